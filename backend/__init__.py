@@ -8,6 +8,8 @@ def create_app(config_name='default'):
     
     # 1. 設定の読み込み
     app.config.from_object(config[config_name])
+    # JSON の日本語を \uXXXX にせず UTF-8 のまま返す（氏名・部署名の多い一覧ではサイズが約半分になる）
+    app.json.ensure_ascii = False
     
     # 2. 拡張機能の初期化
     db.init_app(app)
@@ -17,21 +19,94 @@ def create_app(config_name='default'):
     # このインポートは db.init_app の後に行う必要があります。
     from . import models 
 
+    # コミット時にキャッシュを無効化するための変更追跡
+    from .cache import track_changes, roster_cache
+    from .card_index import card_index
+    from .search import search_index
+    track_changes()
+    # 追加・更新・削除を変更フィード用に Change_Log へ記録する
+    from .changes import track_change_log
+    track_change_log()
+
     # 4. ブループリント（APIエンドポイント）の登録
     
     # (例) 既存のヘルスチェックを登録
     @app.route("/health")
     def health():
-        return jsonify(status="ok"), 200
+        # 接続プールの状態と SELECT 1 の往復時間（DBに接続できない場合は 503）
+        from .pool import pool_status, ping
+        status, code, database = "ok", 200, {}
+        try:
+            database['select1_ms'] = ping(db.session)
+        except Exception as e:
+            status, code = "error", 503
+            database['error'] = str(getattr(e, 'orig', e))
+        database['pool'] = pool_status(db.engine)
+        return jsonify(status=status, database=database,
+                       roster_cache=roster_cache.stats(), card_index=card_index.stats(),
+                       search_index=search_index.stats()), code
     
     # api/users.py から Blueprint をインポート
     from .api.users import api_bp
     # アプリケーションに登録
     app.register_blueprint(api_bp)
+    from .api.cards import cards_bp
+    app.register_blueprint(cards_bp)
+    from .api.resolve import resolver_bp
+    app.register_blueprint(resolver_bp)
+    from .api.changes import changes_bp
+    app.register_blueprint(changes_bp)
+    from .api.search import search_bp
+    app.register_blueprint(search_bp)
+
+    # カードUID索引・職員検索の索引の更新間隔（起動時の読み込みは preload_indexes）
+    card_index.configure(app.config['CARD_INDEX_REFRESH_SECONDS'], app.config['CARD_INDEX_FULL_REFRESH_SECONDS'])
+    search_index.configure(app.config['SEARCH_INDEX_REFRESH_SECONDS'], app.config['SEARCH_INDEX_FULL_REFRESH_SECONDS'])
+
+    # リクエストごとの SQL 件数・DB 時間の計測と /metrics
+    from .instrumentation import init_instrumentation
+    from .pool import pool_status
+
+    def gauges():
+        pool = pool_status(db.engine)
+        return [
+            ('staffdb_db_pool', 'DB connection pool state of this worker.',
+             {k: v for k, v in pool.items() if isinstance(v, (int, float))}),
+            ('staffdb_roster_cache', 'In-memory roster cache counters.',
+             {k: v for k, v in roster_cache.stats().items() if isinstance(v, (int, float))}),
+            ('staffdb_card_index', 'Card UID index counters.', card_index.stats()),
+            ('staffdb_search_index', 'People search index counters.',
+             {k: v for k, v in search_index.stats().items() if isinstance(v, (int, float))}),
+        ]
+
+    init_instrumentation(app, gauges)
+
+    # Accept-Encoding による gzip / brotli 圧縮
+    from .compression import init_compression
+    init_compression(app)
 
     # 5. カスタムCLIコマンドの登録
     # create_app の中でインポートします
     from . import commands 
     commands.register_commands(app)
 
-    return app
\ No newline at end of file
+    return app
+
+
+def preload_indexes(app):
+    """
+    カードUID索引と職員検索の索引を読み込みます（CARD_INDEX_PRELOAD / SEARCH_INDEX_PRELOAD が有効な場合）。
+    サーバーの起動時に gunicorn.conf.py から呼びます。flask コマンドでは読み込まず、
+    サーバーでも読み込みに失敗した場合は最初のリクエストで読み込みます。
+    """
+    from .card_index import card_index
+    from .search import search_index
+    for enabled, index, label in ((app.config['CARD_INDEX_PRELOAD'], card_index, 'カード索引'),
+                                  (app.config['SEARCH_INDEX_PRELOAD'], search_index, '職員検索の索引')):
+        if not enabled:
+            continue
+        with app.app_context():
+            try:
+                index.load(db.session)
+            except Exception as e:
+                print(f"{label}の事前読み込みに失敗しました: {getattr(e, 'orig', e)}")
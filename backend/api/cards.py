@@ -0,0 +1,61 @@
+from flask import Blueprint, jsonify, request
+from ..extensions import db
+from ..card_index import card_index
+
+cards_bp = Blueprint('cards', __name__, url_prefix='/api/cards')
+
+# 一括解決で1回に受け付ける最大件数
+MAX_RESOLVE_UIDS = 10000
+
+
+@cards_bp.route('/<card_uid>', methods=['GET'])
+def get_card(card_uid):
+    """
+    カードUIDから職員を引くAPI（入退館ゲート・カードリーダー向け）
+
+    インメモリ索引から応答するため、通常は DB に問い合わせません。
+    見つからない場合と、無効（is_active が false）のカードの場合は 404 を返します
+    （ゲートは 200 以外を通行不可として扱う）。無効なカードは is_active: false を付けて区別します。
+    """
+    try:
+        card_index.ensure_fresh(db.session)
+        card = card_index.get(card_uid)
+        if card is None:
+            return jsonify(error="カードが見つかりません。", card_uid=card_uid), 404
+        if not card['is_active']:
+            return jsonify(error="カードは無効です。", card_uid=card_uid, is_active=False), 404
+        return jsonify(card), 200
+
+    except Exception as e:
+        print(f"Error in /api/cards/{card_uid}: {e}")
+        return jsonify(error=str(e)), 500
+
+
+@cards_bp.route('/resolve', methods=['POST'])
+def resolve_cards():
+    """
+    複数のカードUIDをまとめて職員に解決するAPI
+
+    リクエスト: {"card_uids": ["...", ...], "include_inactive": false}
+    レスポンス: {"results": [...]}（リクエストと同じ順。見つからないUIDと無効なカードは null。
+               include_inactive が true の場合は無効なカードも is_active: false で返す）
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        card_uids = payload.get('card_uids')
+        if not isinstance(card_uids, list) or not all(isinstance(uid, str) for uid in card_uids):
+            return jsonify(error="card_uids に文字列の配列を指定してください。"), 400
+        if len(card_uids) > MAX_RESOLVE_UIDS:
+            return jsonify(error=f"card_uids は {MAX_RESOLVE_UIDS} 件以下で指定してください。"), 400
+
+        include_inactive = payload.get('include_inactive') is True
+
+        card_index.ensure_fresh(db.session)
+        results = card_index.get_many(card_uids)
+        if not include_inactive:
+            results = [card if card is not None and card['is_active'] else None for card in results]
+        return jsonify(results=results), 200
+
+    except Exception as e:
+        print(f"Error in /api/cards/resolve: {e}")
+        return jsonify(error=str(e)), 500
@@ -0,0 +1,42 @@
+from flask import Blueprint, Response, jsonify, request
+from ..extensions import db
+from ..changes import fetch_changes, CHANGE_COLUMNS, DEFAULT_LIMIT, MAX_LIMIT
+from ..streaming import iter_ndjson
+
+changes_bp = Blueprint('changes', __name__, url_prefix='/api')
+
+
+@changes_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    前回の取得以降に変更された行を返すAPI（連携先システムの差分同期用）
+
+    クエリパラメータ:
+        since: 前回のレスポンスの X-Next-Cursor（または最後の行の cursor）。省略すると最初から
+        limit: 最大件数（既定 1000, 最大 10000）
+        tables: 対象テーブルをカンマ区切りで指定（既定は全テーブル）
+
+    レスポンス: 1行1変更の NDJSON（op は upsert / delete）
+        ヘッダー X-Next-Cursor に次回の since、X-Has-More に続きの有無を返す
+    """
+    try:
+        since = request.args.get('since') or None
+        limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+        tables = [t for t in request.args.get('tables', '').split(',') if t] or None
+        if not 1 <= limit <= MAX_LIMIT:
+            return jsonify(error=f"limit は 1〜{MAX_LIMIT} で指定してください。"), 400
+
+        changes, next_cursor, has_more = fetch_changes(db.session, since, limit, tables)
+
+        response = Response(iter_ndjson(changes, CHANGE_COLUMNS), content_type='application/x-ndjson; charset=utf-8')
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['X-Has-More'] = 'true' if has_more else 'false'
+        return response
+
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    except Exception as e:
+        print(f"Error in /api/changes: {e}")
+        return jsonify(error=str(e)), 500
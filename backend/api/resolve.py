@@ -0,0 +1,51 @@
+from flask import Blueprint, jsonify, request
+from ..extensions import db
+from ..resolver import identifier_resolver
+
+resolver_bp = Blueprint('resolver', __name__, url_prefix='/api')
+
+# 1回に受け付ける最大件数
+MAX_IDENTIFIERS = 10000
+
+
+def parse_identifiers(items):
+    """
+    リクエストの識別子を (種類, 値) のリストに変換します。
+    各要素は {"type": "d_number", "value": "D0001"} か、種類を問わず探す文字列です。
+    """
+    identifiers = []
+    for item in items:
+        if isinstance(item, str):
+            identifiers.append((None, item))
+        elif isinstance(item, dict) and isinstance(item.get('value'), str):
+            identifiers.append((item.get('type') or None, item['value']))
+        else:
+            raise ValueError("identifiers の要素は文字列か {\"type\": ..., \"value\": ...} で指定してください。")
+    return identifiers
+
+
+@resolver_bp.route('/resolve', methods=['POST'])
+def resolve_identifiers():
+    """
+    D番号・職員番号・情報システムID・カードUID・カード管理IDを user_id と現在の識別子に解決するAPI
+
+    リクエスト: {"identifiers": [{"type": "employee_number", "value": "00001234"}, "D0001", ...]}
+    レスポンス: {"results": [...]}（リクエストと同じ順。見つからない場合は user_id が null）
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        items = payload.get('identifiers')
+        if not isinstance(items, list):
+            return jsonify(error="identifiers に配列を指定してください。"), 400
+        if len(items) > MAX_IDENTIFIERS:
+            return jsonify(error=f"identifiers は {MAX_IDENTIFIERS} 件以下で指定してください。"), 400
+
+        results = identifier_resolver.resolve(db.session, parse_identifiers(items))
+        return jsonify(results=results), 200
+
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    except Exception as e:
+        print(f"Error in /api/resolve: {e}")
+        return jsonify(error=str(e)), 500
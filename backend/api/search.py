@@ -0,0 +1,34 @@
+from flask import Blueprint, jsonify, request
+from ..extensions import db
+from ..search import search_index
+
+search_bp = Blueprint('search', __name__, url_prefix='/api')
+
+# 1回に返す件数の既定値と上限
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+@search_bp.route('/search', methods=['GET'])
+def search_users():
+    """
+    氏名（漢字・カナ・半角カナ・ローマ字）・職員番号の先頭・D番号・カード管理IDから職員を探すAPI
+
+    リクエスト: /api/search?q=やまだ&limit=20
+    レスポンス: {"query": "...", "results": [{"user_id": ..., "matched": "name_kana", "score": 60, ...}]}
+    インメモリ索引から応答するため、通常は DB に問い合わせません。
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify(error="q に検索語を指定してください。"), 400
+        limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+        if limit is None or not 1 <= limit <= MAX_LIMIT:
+            return jsonify(error=f"limit は 1〜{MAX_LIMIT} で指定してください。"), 400
+
+        search_index.ensure_fresh(db.session)
+        return jsonify(query=query, results=search_index.search(query, limit)), 200
+
+    except Exception as e:
+        print(f"Error in /api/search: {e}")
+        return jsonify(error=str(e)), 500
@@ -1,63 +1,196 @@
-from flask import Blueprint, jsonify
-from ..models import User, EmployeeNumberHistory, Departments, UserDepartment, Positions, DNumbers, Cards
+import datetime
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from ..extensions import db
+from ..roster import (
+    roster_select, filter_roster, paginate_roster, fetch_roster, fetch_roster_page, stream_roster,
+    roster_version, DEFAULT_SORT, ROSTER_COLUMNS, COLUMN_LABELS,
+)
+from ..streaming import iter_csv, iter_ndjson, ENCODINGS
+from ..cache import roster_cache
+from ..columnar import encode_columns, records_to_columns
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+# 1ページあたりの最大件数
+MAX_PAGE_SIZE = 1000
+
+
+def _bool_arg(name):
+    """クエリパラメータを真偽値として読み込みます（未指定は None）。"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"{name} には true / false を指定してください。")
+
+
+def _date_arg(name):
+    """クエリパラメータを YYYY-MM-DD の日付として読み込みます（未指定は None）。"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} は YYYY-MM-DD 形式で指定してください。") from None
+
+
+def roster_filters_from_request():
+    """クエリパラメータから filter_roster() の引数を組み立てます。"""
+    return {
+        'department_id': request.args.get('department_id', type=int),
+        'position_id': request.args.get('position_id', type=int),
+        'name': request.args.get('name') or None,
+        'has_card': _bool_arg('has_card'),
+        'has_d_number': _bool_arg('has_d_number'),
+    }
+
+
+def _not_modified(version):
+    """リクエストの If-None-Match / If-Modified-Since が現在のバージョンと一致するか。"""
+    if request.if_none_match:
+        # 圧縮したレスポンスの ETag は弱い ETag になるため、弱い比較を行う
+        return request.if_none_match.contains_weak(version.etag)
+    since = request.if_modified_since
+    return since is not None and version.last_modified is not None \
+        and version.last_modified.replace(microsecond=0) <= since.replace(tzinfo=None)
+
+
+def _set_validators(response, version):
+    """ETag / Last-Modified を付け、毎回サーバーに再検証させます。"""
+    response.set_etag(version.etag)
+    if version.last_modified is not None:
+        response.last_modified = version.last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @api_bp.route('/users/', methods=['GET'])
 def get_users():
     """
-    全職員の情報を取得するAPI
+    職員の情報を取得するAPI
+
+    クエリパラメータ:
+        department_id, position_id: 部署・職位で絞り込み
+        name: 氏名の前方一致
+        has_card, has_d_number: カード / 有効なD番号の有無
+        as_of: YYYY-MM-DD を指定すると、その日の在籍者と職員番号・職位・部署を返す
+        sort: hire_date, name, employee_number, user_id（先頭に '-' で降順）
+        limit: 指定するとページングし {"items": [...], "next_cursor": ...} を返す
+        cursor: 前ページの next_cursor
+        format: columns を指定すると列形式で返す（backend/columnar.py。ページング時は
+                {"columns": ..., "data": ..., "dictionaries": ..., "next_cursor": ...}）
     """
     try:
-        users = User.query.all()
-        results = []
-        
-        for user in users:
-            user_data = {
-                "user_id": user.user_id,
-                "name": user.name,
-                "d_id": None,
-                "employee_number": None,
-                "position_id": None,
-                "position_name": None,
-                "department_id": None,
-                "department_name": None,
-                # ▼ 追加
-                "card_uid": None,
-                "card_management_id": None
-            }
-
-            # D番号
-            if user.d_numbers:
-                user_data["d_id"] = user.d_numbers[0].d_number 
-
-            # 職員番号・職位
-            if user.employee_number_history:
-                latest_history = user.employee_number_history[0] 
-                user_data["employee_number"] = latest_history.employee_number
-                user_data["position_id"] = latest_history.position_id
-                if latest_history.position:
-                     user_data["position_name"] = latest_history.position.position_name
-
-            # 部署
-            if user.departments:
-                dept_assoc = user.departments[0]
-                user_data["department_id"] = dept_assoc.department_id
-                if dept_assoc.department:
-                    user_data["department_name"] = dept_assoc.department.department_name
-
-            # ▼ カード情報 (Cards relationship)
-            if user.cards:
-                # 1人のユーザーが複数のカードを持つ可能性もありますが、ここでは最初の1枚を表示します
-                card = user.cards[0]
-                user_data["card_uid"] = card.card_uid
-                user_data["card_management_id"] = card.card_management_id
-
-            results.append(user_data)
-
-        return jsonify(results), 200
+        # 職員一覧が前回から変わっていなければ、一覧のクエリを実行せずに 304 を返す
+        version = roster_version(db.session)
+        if _not_modified(version):
+            return _set_validators(Response(status=304), version)
+
+        filters = roster_filters_from_request()
+        as_of = _date_arg('as_of')
+        sort = request.args.get('sort', DEFAULT_SORT)
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        output_format = request.args.get('format', 'records')
+        if output_format not in ('records', 'columns'):
+            return jsonify(error="format には records または columns を指定してください。"), 400
+        columnar = output_format == 'columns'
+
+        # 職員・職員番号・D番号・部署・カードを1本のSQLで平坦化して取得
+        # (ユーザーごとのリレーション遅延ロードによる N+1 クエリを避ける)
+        stmt = filter_roster(roster_select(as_of), **filters)
+
+        if limit is None:
+            # 従来通り全件を配列で返す
+            if sort == DEFAULT_SORT and as_of is None and not any(v is not None for v in filters.values()):
+                # 絞り込みなしの全件はインメモリキャッシュから返す（バージョンは上で取得したものを使う）
+                if columnar:
+                    payload = encode_columns(roster_cache.columns(db.session, version), ROSTER_COLUMNS)
+                    return _set_validators(jsonify(payload), version), 200
+                results = roster_cache.records(db.session, version)
+            else:
+                results = fetch_roster(db.session, paginate_roster(stmt, sort))
+            if columnar:
+                results = encode_columns(records_to_columns(results, ROSTER_COLUMNS), ROSTER_COLUMNS)
+            return _set_validators(jsonify(results), version), 200
+
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify(error=f"limit は 1〜{MAX_PAGE_SIZE} で指定してください。"), 400
+
+        items, next_cursor = fetch_roster_page(db.session, stmt, sort, limit, cursor)
+        if columnar:
+            payload = encode_columns(records_to_columns(items, ROSTER_COLUMNS), ROSTER_COLUMNS)
+            return _set_validators(jsonify(next_cursor=next_cursor, **payload), version), 200
+        return _set_validators(jsonify(items=items, next_cursor=next_cursor), version), 200
+
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
     except Exception as e:
         print(f"Error in /api/users/: {e}")
-        return jsonify(error=str(e)), 500
\ No newline at end of file
+        return jsonify(error=str(e)), 500
+
+
+@api_bp.route('/users/export', methods=['GET'])
+def export_users():
+    """
+    職員一覧を CSV / NDJSON でストリーム出力するAPI
+
+    クエリパラメータ:
+        format: csv（既定） / ndjson
+        encoding: CSV の文字コード utf-8 / utf-8-sig（既定, Excel 向け） / cp932
+        columns: 出力するカラムをカンマ区切りで指定（既定は全カラム）
+        header: label（既定, 日本語の見出し） / key（カラム名）
+        その他: /api/users/ と同じ絞り込み・並び替え・as_of パラメータ
+    """
+    try:
+        filters = roster_filters_from_request()
+        as_of = _date_arg('as_of')
+        sort = request.args.get('sort', DEFAULT_SORT)
+        output_format = request.args.get('format', 'csv')
+        encoding = request.args.get('encoding', 'utf-8-sig')
+        columns = [c for c in request.args.get('columns', '').split(',') if c] or ROSTER_COLUMNS
+
+        unknown = [c for c in columns if c not in ROSTER_COLUMNS]
+        if unknown:
+            return jsonify(error=f"存在しないカラムです: {', '.join(unknown)}"), 400
+        if output_format not in ('csv', 'ndjson'):
+            return jsonify(error="format には csv または ndjson を指定してください。"), 400
+        if encoding not in ENCODINGS:
+            return jsonify(error=f"encoding には {' / '.join(ENCODINGS)} を指定してください。"), 400
+
+        stmt = paginate_roster(filter_roster(roster_select(as_of), **filters), sort)
+        rows = stream_roster(db.session, stmt)
+
+        if output_format == 'ndjson':
+            body = iter_ndjson(rows, columns)
+            content_type = 'application/x-ndjson; charset=utf-8'
+            filename = 'staff_list.ndjson'
+        else:
+            header = columns if request.args.get('header') == 'key' else [COLUMN_LABELS[c] for c in columns]
+            charset = 'shift_jis' if encoding == 'cp932' else 'utf-8'
+            body = iter_csv(rows, columns, header=header, encoding=encoding)
+            if encoding == 'cp932':
+                # cp932 で表せない文字は途中で送信が切れる前に 400 で知らせるため、先に全件を変換しておく
+                # （ValueError は下の except で行番号・列名つきのエラーとして返る）
+                body = iter(list(body))
+            content_type = f'text/csv; charset={charset}'
+            filename = 'staff_list.csv'
+
+        # レスポンスを返した後もリクエストコンテキスト（DBセッション）を保ったまま送信する
+        response = Response(stream_with_context(body), content_type=content_type)
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # nginx 等でバッファリングせず、生成した分から順に送る
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    except Exception as e:
+        print(f"Error in /api/users/export: {e}")
+        return jsonify(error=str(e)), 500
@@ -8,6 +8,6 @@ config_name = os.environ.get('FLASK_CONFIG', 'default')
 app = create_app(config_name)
 
 if __name__ == "__main__":
-    # DockerfileのCMD ["flask", "run", ...] で起動されるため、
-    # この app.run() は主にローカルでの直接実行用（コンテナ外）
+    # コンテナでは gunicorn（本番, gunicorn.conf.py）か flask run（開発, compose.override.yaml）で
+    # 起動されるため、この app.run() は主にローカルでの直接実行用（コンテナ外）
     app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
@@ -0,0 +1,166 @@
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .roster import ROSTER_COLUMNS, roster_select, paginate_roster, roster_version
+
+# --------------------
+# 変更の追跡（コミット時の通知）
+# --------------------
+# セッションで変更されたテーブル（と分かる範囲で user_id）を記録し、
+# コミットが成功した時点で登録されたコールバックに通知します。
+# ORM の add / delete だけでなく、insert() / update() / delete() 文の実行も対象です。
+# 文の実行では対象の user_id が分からないため、user_ids は None（全件）として通知します。
+
+_subscribers = []
+_tracking_installed = False
+
+
+def on_commit(callback):
+    """
+    コミット時に callback(tables, user_ids) を呼び出すよう登録します。
+    tables は変更されたテーブル名の set、user_ids は変更された user_id の set（不明な場合は None）です。
+    """
+    _subscribers.append(callback)
+    return callback
+
+
+def _pending(session):
+    return session.info.setdefault('changes', {'tables': set(), 'user_ids': set()})
+
+
+def _record_instances(session, instances):
+    changes = _pending(session)
+    for instance in instances:
+        table = getattr(instance, '__tablename__', None)
+        if table is None:
+            continue
+        changes['tables'].add(table)
+        user_id = getattr(instance, 'user_id', None)
+        if user_id is not None and changes['user_ids'] is not None:
+            changes['user_ids'].add(user_id)
+        elif table != 'Users':
+            # user_id を持たないマスター（部署・職位など）の変更は全員に影響しうる
+            changes['user_ids'] = None
+
+
+def _before_flush(session, flush_context, instances):
+    _record_instances(session, list(session.new) + list(session.dirty) + list(session.deleted))
+
+
+def _do_orm_execute(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = getattr(state.statement, 'table', None)
+    changes = _pending(state.session)
+    if table is not None:
+        changes['tables'].add(table.name)
+    changes['user_ids'] = None
+
+
+def _after_commit(session):
+    changes = session.info.pop('changes', None)
+    if not changes or not changes['tables']:
+        return
+    for callback in list(_subscribers):
+        callback(changes['tables'], changes['user_ids'])
+
+
+def _after_rollback(session):
+    session.info.pop('changes', None)
+
+
+def track_changes():
+    """全セッションに変更追跡のイベントを登録します（複数回呼んでも1回だけ）。"""
+    global _tracking_installed
+    if _tracking_installed:
+        return
+    event.listen(Session, 'before_flush', _before_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    _tracking_installed = True
+
+
+# --------------------
+# 職員一覧のキャッシュ
+# --------------------
+# 平坦化した職員一覧（roster_select の結果）をカラムごとのリストで保持します。
+# 以下のいずれかで無効化し、次の読み出し時に再構築します。
+#   - 同じプロセス内で関連テーブルへの変更がコミットされた（on_commit）
+#   - roster_version() のトークンが変わった（他のプロセス・CLI からの更新）
+
+ROSTER_TABLE_NAMES = {
+    'Users', 'Employee_Number_History', 'Positions', 'D_Numbers', 'Cards', 'User_Departments', 'Departments',
+}
+
+
+class RosterCache:
+    """職員一覧（入職日順）のインメモリキャッシュ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = None  # {カラム名: [値, ...]}
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.invalidations = 0
+        self.last_rebuild_seconds = None
+
+    def invalidate(self, tables=None, user_ids=None):
+        if tables is not None and not (set(tables) & ROSTER_TABLE_NAMES):
+            return
+        with self._lock:
+            self._columns = None
+            self._version = None
+            self.invalidations += 1
+
+    def columns(self, session, version=None):
+        """
+        {カラム名: [値, ...]} 形式の職員一覧を返します。
+        キャッシュが古い場合は DB から再構築します。
+        version には呼び出し側で取得済みの roster_version() を渡せます（省略時はここで取得する）。
+        """
+        if version is None:
+            version = roster_version(session)
+        with self._lock:
+            if self._columns is not None and version.etag == self._version:
+                self.hits += 1
+                return self._columns
+            self.misses += 1
+
+        started = time.perf_counter()
+        data = {column: [] for column in ROSTER_COLUMNS}
+        for row in session.execute(paginate_roster(roster_select())):
+            for column in ROSTER_COLUMNS:
+                data[column].append(row._mapping[column])
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.rebuilds += 1
+            self.last_rebuild_seconds = elapsed
+            self._columns = data
+            self._version = version.etag
+        return data
+
+    def records(self, session, version=None):
+        """キャッシュした職員一覧を辞書のリストとして返します。"""
+        data = self.columns(session, version)
+        return [dict(zip(ROSTER_COLUMNS, values)) for values in zip(*(data[c] for c in ROSTER_COLUMNS))]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'rebuilds': self.rebuilds,
+                'invalidations': self.invalidations,
+                'last_rebuild_ms': None if self.last_rebuild_seconds is None
+                else round(self.last_rebuild_seconds * 1000, 1),
+                'rows': None if self._columns is None else len(self._columns[ROSTER_COLUMNS[0]]),
+            }
+
+
+roster_cache = RosterCache()
+on_commit(roster_cache.invalidate)
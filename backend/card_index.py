@@ -0,0 +1,170 @@
+import json
+from sqlalchemy import select
+from .models import User, EmployeeNumberHistory, DNumbers, Cards, UserDepartment, Departments, Positions, Change_Log
+from .roster import current_subqueries
+from .cache import on_commit
+from .refresher import BackgroundRefresher
+
+# --------------------
+# カードUID → 職員のインメモリ索引
+# --------------------
+# 入退館ゲートやカードリーダーはタッチのたびに card_uid を職員に解決するため、
+# 全カードの解決結果を辞書で保持し、DB に問い合わせずに応答します。
+# カードUIDはリーダーによって16進の大文字・小文字が異なるため、大文字にそろえたキーで引きます。
+#
+# 更新方法（refresher.BackgroundRefresher）:
+#   - サーバーの起動時に全件を読み込み（preload_indexes）
+#   - 一定間隔ごとに、前回以降に Change_Log に記録された変更・削除の user_id と card_uid だけを読み直す（差分更新）
+#   - 同じプロセスでのコミットは on_commit で通知を受け、次の参照時に更新を始める
+#   - 一定間隔ごとと、マスターの変更・対象の分からない一括更新の後は全件を読み直す
+#   差分更新・全件の読み直しはどちらもバックグラウンドのスレッドで行います（リクエストは待たせない）。
+
+# 応答に含める項目（CARD_FIELDS の順でタプルに保持する）
+CARD_FIELDS = (
+    'card_uid', 'card_management_id', 'is_active', 'user_id', 'name',
+    'employee_number', 'd_number', 'department_id', 'department_name',
+)
+
+
+def card_select(user_ids=None, card_uids=None):
+    """
+    カードごとに所有者の現在の職員番号・D番号・部署を付けた SELECT 文を返します。
+    user_ids を指定するとその職員のカードだけを、card_uids を指定するとそのカードだけを返します（どちらか一方）。
+    """
+    owners = user_ids
+    if card_uids is not None:
+        owners = select(Cards.user_id).where(Cards.card_uid.in_(card_uids))
+    current = current_subqueries(owners)
+    history = current['employee_number_history']
+    d_number = current['d_numbers']
+    user_dept = current['departments']
+    stmt = (
+        select(
+            Cards.card_uid, Cards.card_management_id, Cards.is_active, Cards.user_id, User.name,
+            history.c.employee_number, d_number.c.d_number,
+            user_dept.c.department_id, Departments.department_name,
+        )
+        .select_from(Cards)
+        .outerjoin(User, User.user_id == Cards.user_id)
+        .outerjoin(history, history.c.user_id == Cards.user_id)
+        .outerjoin(d_number, d_number.c.user_id == Cards.user_id)
+        .outerjoin(user_dept, user_dept.c.user_id == Cards.user_id)
+        .outerjoin(Departments, Departments.department_id == user_dept.c.department_id)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(Cards.user_id.in_(user_ids))
+    if card_uids is not None:
+        stmt = stmt.where(Cards.card_uid.in_(card_uids))
+    return stmt
+
+
+def _uid_key(card_uid):
+    """索引のキー（大文字にそろえたカードUID）"""
+    return card_uid.upper() if isinstance(card_uid, str) else card_uid
+
+
+class CardIndex(BackgroundRefresher):
+    """card_uid をキーにした職員情報の索引"""
+
+    user_tables = (User, EmployeeNumberHistory, DNumbers, Cards, UserDepartment)
+    master_tables = (Departments, Positions)
+    thread_name = 'card-index-refresh'
+    label = 'カード索引'
+
+    def __init__(self, refresh_seconds=5, full_refresh_seconds=300):
+        super().__init__(refresh_seconds, full_refresh_seconds)
+        self._entries = {}   # 大文字にそろえた card_uid -> タプル（CARD_FIELDS の順）
+        self._by_user = {}   # user_id -> {大文字にそろえた card_uid, ...}（更新するスレッドだけが使う）
+
+    # ---- 参照 ----
+
+    def get(self, card_uid):
+        """card_uid（大文字・小文字は区別しない）に対応する辞書を返します（見つからなければ None）。"""
+        entry = self._entries.get(_uid_key(card_uid))
+        return None if entry is None else dict(zip(CARD_FIELDS, entry))
+
+    def get_many(self, card_uids):
+        entries = self._entries
+        return [None if (e := entries.get(_uid_key(uid))) is None else dict(zip(CARD_FIELDS, e))
+                for uid in card_uids]
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---- 更新 ----
+
+    def _read_all(self, session):
+        """全カードを読み込み、(entries, by_user) を返します。"""
+        entries, by_user = {}, {}
+        for row in session.execute(card_select()):
+            key = _uid_key(row.card_uid)
+            entries[key] = tuple(row)
+            by_user.setdefault(row.user_id, set()).add(key)
+        return entries, by_user
+
+    def _install(self, data):
+        # 参照側はロックを取らないため、辞書ごと差し替える
+        self._entries, self._by_user = data
+
+    def _refresh(self, session, after, upto, user_ids):
+        """前回以降に変更・削除された職員のカードと、変更されたカードだけを読み直します。"""
+        card_uids = set()
+        if upto > after:
+            # 所有者の付け替え・解除・削除に備え、変更されたカードは card_uid でも読み直す
+            card_keys = select(Change_Log.row_key).where(
+                Change_Log.change_id > after, Change_Log.change_id <= upto,
+                Change_Log.table_name == Cards.__tablename__, Change_Log.row_key.isnot(None))
+            card_uids = {json.loads(key).get('card_uid') for key in session.execute(card_keys).scalars()}
+            card_uids.discard(None)
+        if not user_ids and not card_uids:
+            return True
+
+        rows = []
+        for name, values in (('user_ids', list(user_ids)), ('card_uids', list(card_uids))):
+            for start in range(0, len(values), 1000):
+                rows.extend(session.execute(card_select(**{name: values[start:start + 1000]})))
+        self._patch(user_ids, rows, card_uids)
+        self.incremental_loads += 1
+        return True
+
+    def _patch(self, user_ids, rows, card_uids=()):
+        """
+        読み直した行で索引を書き換えます。読み直した職員・カードのうち、行がなくなったカードは消します。
+        参照側はロックを取らないため辞書はコピーせずに1件ずつ置き換え、消すのは新しい行を入れた後にします
+        （付け替えの途中のカードが見つからなくならないように）。
+        """
+        entries, by_user = self._entries, self._by_user
+        fresh = {_uid_key(row.card_uid): tuple(row) for row in rows}
+        stale = {_uid_key(uid) for uid in card_uids}
+        for user_id in user_ids:
+            stale.update(by_user.get(user_id, ()))
+        for key, entry in fresh.items():
+            previous = entries.get(key)
+            if previous is not None and previous[3] != entry[3]:
+                # 別の職員から付け替えられたカード
+                self._unlink(previous[3], key)
+            entries[key] = entry
+            by_user.setdefault(entry[3], set()).add(key)
+        for key in stale - fresh.keys():
+            entry = entries.pop(key, None)
+            if entry is not None:
+                self._unlink(entry[3], key)
+
+    def _unlink(self, user_id, key):
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def stats(self):
+        return {
+            'cards': len(self._entries),
+            'full_loads': self.full_loads,
+            'background_loads': self.background_loads,
+            'incremental_loads': self.incremental_loads,
+        }
+
+
+card_index = CardIndex()
+on_commit(card_index.mark_dirty)
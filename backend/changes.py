@@ -0,0 +1,426 @@
+import base64
+import json
+import re
+from sqlalchemy import event, select, insert, func, exists, tuple_, TIMESTAMP, inspect as sa_inspect
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.orm import Session
+from .extensions import db
+from .models import TimestampMixin, Change_Log
+
+# --------------------
+# 変更フィード（Change_Log による差分取得）
+# --------------------
+# TimestampMixin を持つ全テーブルの追加・更新・削除を、変更したのと同じトランザクションで
+# Change_Log に1行ずつ記録し、change_id の順に返します。
+#
+# change_id は Change_Log の AUTO_INCREMENT で、コミットの直前に記録を INSERT した時点で採番します
+# （書き込むトランザクション同士が採番で待ち合わせないように）。そのため change_id はコミットの順とは限らず、
+# 大きい change_id が先にコミットされて、まだコミットされていない記録の欠番が一時的に見えることがあります。
+# 読み出しは latest_change_id() の返す値までとし、直近 GAP_SECONDS 秒の記録の手前にある欠番から先は
+# 読みません（欠番が埋まるか、戻されたトランザクションの欠番として GAP_SECONDS 秒が過ぎるまで待つ）。
+# 記録の INSERT からコミットまでが GAP_SECONDS 秒に収まるよう、1回のコミットの記録は MAX_LOGGED_ROWS 行までとし、
+# それを超える一括の書き込みはテーブルごとの invalidate にまとめます。
+# updated_at は行を書いた時点の値のため、長いトランザクションの行が既に読み進めたカーソルより前に現れることがあり、
+# カーソルには使えません。
+#
+# 記録の対象は、このアプリのセッションを通した書き込み（ORM の add / delete と insert() / update() /
+# delete() 文）です。主キーが分からない一括 INSERT（自動採番の履歴テーブル）は row_key を NULL とし、
+# 読み出し時にその user_id の行すべてを返します。主キーも user_id も分からない書き込み（insert().from_select()
+# など）は、テーブル全体が変わったものとして op = 'invalidate' を1行記録します。
+#
+# セッションを通らない書き込み（db.engine / connection での直接の実行、他のアプリや SQL クライアントからの更新）は
+# 記録されません。その場合は同じトランザクションで log_invalidation() を呼ぶか、書き込んだ後に
+# flask invalidate-changes <テーブル名> を実行してください。記録がないと、職員一覧の ETag・インメモリの索引・
+# 差分出力が変更に気づかず古い内容を返し続けます。
+
+# 1件の変更として返す項目
+CHANGE_COLUMNS = ['cursor', 'op', 'table', 'key', 'user_id', 'changed_at', 'data']
+
+# 1回の取得で返す最大件数
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+# この秒数より前に記録された行の手前の欠番は、戻されたトランザクションの欠番とみなす
+GAP_SECONDS = 60
+# 1回のコミットで行ごとに記録する最大件数（超えるとテーブルごとの invalidate にまとめる）
+MAX_LOGGED_ROWS = 100000
+# Change_Log に一度に INSERT する行数
+_INSERT_CHUNK_SIZE = 5000
+
+
+def feed_models():
+    """変更フィードの対象モデル（TimestampMixin を持つテーブル）をテーブル名の順に返します。"""
+    models = [mapper.class_ for mapper in db.Model.registry.mappers
+              if issubclass(mapper.class_, TimestampMixin)]
+    return sorted(models, key=lambda model: model.__tablename__)
+
+
+def _primary_key(model):
+    return list(sa_inspect(model).primary_key)
+
+
+def _row_key(model, instance_or_row):
+    return {column.key: getattr(instance_or_row, column.key) for column in _primary_key(model)}
+
+
+# ---- 変更の記録 ----
+
+_tracking_installed = False
+
+
+def _feed_model(table):
+    # ORM の insert() / update() / delete() 文の table は注釈付きのコピーのため、テーブル名で照合する
+    return next((m for m in feed_models() if table is not None and m.__tablename__ == table.name), None)
+
+
+def _plain(value):
+    # pandas から渡された numpy の数値は Python の値にしてから JSON にする
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _invalidation(model):
+    return {'op': 'invalidate', 'table_name': model.__tablename__, 'row_key': None, 'user_id': None}
+
+
+def _log_entry(op, model, values):
+    """
+    values（属性名 → 値の対応）から Change_Log の1行を作ります。
+    主キーも user_id も分からない場合は、テーブル全体の invalidate にします。
+    """
+    key = {column.key: _plain(values.get(column.key)) for column in _primary_key(model)}
+    row_key = None if None in key.values() else json.dumps(key, ensure_ascii=False, default=str)
+    user_id = _plain(values.get('user_id'))
+    if row_key is None and user_id is None:
+        return _invalidation(model)
+    return {'op': op, 'table_name': model.__tablename__, 'row_key': row_key, 'user_id': user_id}
+
+
+def _log_entries(op, model, rows):
+    entries = [_log_entry(op, model, row) for row in rows]
+    if any(entry['op'] == 'invalidate' for entry in entries):
+        # 1行でも対象が分からなければ、テーブル全体の1行にまとめる
+        return [_invalidation(model)]
+    return entries
+
+
+def _pending(session):
+    return session.info.setdefault('change_log', [])
+
+
+def _instance_values(instance):
+    values = _row_key(type(instance), instance)
+    values['user_id'] = getattr(instance, 'user_id', None)
+    return values
+
+
+def _after_flush(session, flush_context):
+    """ORM の add / 変更 / delete を記録します（フラッシュ後のため自動採番の主キーも分かる）。"""
+    pending = _pending(session)
+    for instance in session.new:
+        if isinstance(instance, TimestampMixin):
+            pending.append(_log_entry('upsert', type(instance), _instance_values(instance)))
+    for instance in session.dirty:
+        if isinstance(instance, TimestampMixin) and session.is_modified(instance, include_collections=False):
+            pending.append(_log_entry('upsert', type(instance), _instance_values(instance)))
+    for instance in session.deleted:
+        if isinstance(instance, TimestampMixin):
+            pending.append(_log_entry('delete', type(instance), _instance_values(instance)))
+
+
+def _affected_rows(session, model, statement):
+    """update() / delete() 文の対象行の主キーと user_id を、実行前に読み込みます。"""
+    columns = _primary_key(model)
+    if hasattr(model, 'user_id'):
+        columns = columns + [model.user_id]
+    stmt = select(*columns)
+    if statement.whereclause is not None:
+        stmt = stmt.where(statement.whereclause)
+    return [row._mapping for row in session.execute(stmt)]
+
+
+# insert().values([...]) をコンパイルしたパラメータ名（列名_m行番号。先頭行は列名だけのことがある）
+_MULTI_VALUES_PARAM = re.compile(r'^(?P<column>.+)_m(?P<row>\d+)$')
+
+
+def _inserted_rows(statement):
+    """insert().values(...) の文に埋め込まれた値を、行ごとの {列名: 値} のリストで返します。"""
+    rows = {}
+    for name, value in statement.compile().params.items():
+        match = _MULTI_VALUES_PARAM.match(name)
+        if match:
+            rows.setdefault(int(match.group('row')), {})[match.group('column')] = value
+        else:
+            rows.setdefault(0, {})[name] = value
+    return [rows[index] for index in sorted(rows)]
+
+
+def _do_orm_execute(state):
+    """insert() / update() / delete() 文による一括の変更も記録します。"""
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    model = _feed_model(getattr(state.statement, 'table', None))
+    if model is None:
+        return
+    parameters = state.parameters
+    if isinstance(parameters, dict):
+        parameters = [parameters]
+    if state.is_insert:
+        # executemany はパラメータの各行、insert().values(...) は文に埋め込まれた値
+        # （値の分からない insert().from_select() などは空の1行とし、invalidate になる）
+        rows = parameters or _inserted_rows(state.statement) or [{}]
+    elif state.is_update and parameters and state.statement.whereclause is None:
+        # 主キーを含むパラメータのリストによる一括 UPDATE
+        rows = parameters
+    else:
+        rows = _affected_rows(state.session, model, state.statement)
+    op = 'delete' if state.is_delete else 'upsert'
+    _pending(state.session).extend(_log_entries(op, model, rows))
+
+
+def log_invalidation(session, tables):
+    """
+    tables（テーブル名）の全体が変わったことを記録します（session のコミット時に書き込まれます）。
+    セッションを通さずに書き込んだ場合に、同じトランザクションか書き込んだ後に呼び出します。
+    """
+    models = {model.__tablename__: model for model in feed_models()}
+    unknown = set(tables) - set(models)
+    if unknown:
+        raise ValueError(f"変更フィードの対象外のテーブルです: {', '.join(sorted(unknown))}")
+    _pending(session).extend(_invalidation(models[name]) for name in tables)
+
+
+def _after_transaction_create(session, transaction):
+    # セーブポイントが戻された場合に、その間の記録を捨てられるよう位置を覚える
+    if transaction.nested:
+        session.info.setdefault('change_log_marks', {})[transaction] = len(_pending(session))
+
+
+def _after_soft_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        mark = session.info.get('change_log_marks', {}).pop(previous_transaction, None)
+        if mark is not None:
+            del _pending(session)[mark:]
+    elif previous_transaction.parent is None:
+        session.info.pop('change_log', None)
+        session.info.pop('change_log_marks', None)
+
+
+def _before_commit(session):
+    """記録を Change_Log に書き込みます（コミットするトランザクションの中で、コミットの直前に）。"""
+    if session.in_nested_transaction():
+        return
+    # 未フラッシュの ORM の変更を記録に含める
+    session.flush()
+    entries = session.info.pop('change_log', None)
+    session.info.pop('change_log_marks', None)
+    if not entries:
+        return
+    if len(entries) > MAX_LOGGED_ROWS:
+        # 記録の INSERT に時間がかかると欠番が GAP_SECONDS 秒を超えて残り、読み飛ばされるため
+        models = {model.__tablename__: model for model in feed_models()}
+        entries = [_invalidation(models[name]) for name in sorted({entry['table_name'] for entry in entries})]
+    connection = session.connection()
+    for start in range(0, len(entries), _INSERT_CHUNK_SIZE):
+        connection.execute(insert(Change_Log.__table__), entries[start:start + _INSERT_CHUNK_SIZE])
+
+
+def track_change_log():
+    """全セッションで変更を Change_Log に記録するイベントを登録します（複数回呼んでも1回だけ）。"""
+    global _tracking_installed
+    if _tracking_installed:
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_transaction_create', _after_transaction_create)
+    event.listen(Session, 'after_soft_rollback', _after_soft_rollback)
+    event.listen(Session, 'before_commit', _before_commit)
+    _tracking_installed = True
+
+
+# ---- 読み出し ----
+
+class seconds_ago(FunctionElement):
+    """DB の現在時刻の n 秒前（記録日時と同じ DB の時計で比べるため）"""
+    type = TIMESTAMP()
+    inherit_cache = True
+
+
+@compiles(seconds_ago)
+def _compile_seconds_ago(element, compiler, **kw):
+    return f"NOW() - INTERVAL {compiler.process(element.clauses, **kw)} SECOND"
+
+
+@compiles(seconds_ago, 'sqlite')
+def _compile_seconds_ago_sqlite(element, compiler, **kw):
+    return f"datetime('now', '-' || {compiler.process(element.clauses, **kw)} || ' seconds')"
+
+
+def latest_change_id(session):
+    """
+    読み出してよい最大の change_id（記録がなければ 0）を返します。
+    それ以下の記録はすべてコミット済みか、戻されたトランザクションの欠番です。
+
+    直近 GAP_SECONDS 秒の記録（changed_at のインデックスの範囲）が欠番なく続いていれば最大の change_id を、
+    欠番があればその手前までを返します。欠番がなければ1回のクエリです。
+    """
+    recent = (select(func.min(Change_Log.change_id).label('first'), func.max(Change_Log.change_id).label('last'),
+                     func.count().label('count'))
+              .where(Change_Log.changed_at >= seconds_ago(GAP_SECONDS))
+              .subquery())
+    first, last, count, preceded, latest = session.execute(select(
+        recent.c.first, recent.c.last, recent.c.count,
+        exists().where(Change_Log.change_id == recent.c.first - 1),
+        select(func.max(Change_Log.change_id)).scalar_subquery(),
+    )).one()
+    if not count:
+        return latest or 0
+    if first > 1 and not preceded:
+        # 直近の記録の直前が欠番: それより前の最後の記録まで
+        return session.execute(select(func.max(Change_Log.change_id))
+                               .where(Change_Log.change_id < first)).scalar() or 0
+    if count == last - first + 1:
+        return latest
+    # 直近の記録の間の最初の欠番の手前まで
+    following = Change_Log.__table__.alias('following')
+    return session.execute(
+        select(func.min(Change_Log.change_id))
+        .where(Change_Log.change_id >= first, Change_Log.change_id < last,
+               ~exists().where(following.c.change_id == Change_Log.change_id + 1))
+    ).scalar()
+
+
+def changed_user_ids(session, after, upto, tables):
+    """
+    after < change_id <= upto の間に tables（テーブル名）で変更された行の user_id の set を返します。
+    テーブル全体の invalidate が記録されていた場合は None（全員）を返します。
+    """
+    where = (Change_Log.change_id > after, Change_Log.change_id <= upto, Change_Log.table_name.in_(list(tables)))
+    invalidated = select(Change_Log.change_id).where(*where, Change_Log.op == 'invalidate').limit(1)
+    if session.execute(invalidated).first() is not None:
+        return None
+    stmt = select(Change_Log.user_id).distinct().where(*where, Change_Log.user_id.isnot(None))
+    return set(session.execute(stmt).scalars())
+
+
+def has_changes(session, after, upto, tables):
+    """after < change_id <= upto の間に tables（テーブル名）の変更があれば True を返します。"""
+    stmt = (select(Change_Log.change_id)
+            .where(Change_Log.change_id > after, Change_Log.change_id <= upto,
+                   Change_Log.table_name.in_(list(tables)))
+            .limit(1))
+    return session.execute(stmt).first() is not None
+
+
+# ---- カーソル ----
+
+def encode_change_cursor(change_id):
+    raw = json.dumps([change_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_change_cursor(cursor):
+    """encode_change_cursor() の逆変換。不正なカーソルの場合は ValueError を送出します。"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"不正なカーソルです: {cursor}") from e
+    if isinstance(values, list) and len(values) == 3:
+        # updated_at による以前の形式
+        raise ValueError("以前の形式のカーソルです。since を指定せずに最初から取得し直してください。")
+    if not (isinstance(values, list) and len(values) == 1 and isinstance(values[0], int)):
+        raise ValueError(f"不正なカーソルです: {cursor}")
+    return values[0]
+
+
+# ---- 取得 ----
+
+def _key_values(key):
+    # 記録時の JSON と読み込んだ行で数値・日付の型が違っても一致するよう、文字列にそろえて比べる
+    return tuple(str(value) for value in key.values())
+
+
+def _current_rows(session, model, entries):
+    """
+    entries（同じテーブルの upsert の記録）の行の現在の値を読み込み、
+    ({主キーの値: 行}, {user_id: [行, ...]}) を返します。
+    """
+    pk = _primary_key(model)
+    keys = [json.loads(entry.row_key) for entry in entries if entry.row_key is not None]
+    user_ids = list({entry.user_id for entry in entries if entry.row_key is None and entry.user_id is not None})
+    by_key, by_user = {}, {}
+    for start in range(0, len(keys), 1000):
+        chunk = keys[start:start + 1000]
+        if len(pk) == 1:
+            where = pk[0].in_([key[pk[0].key] for key in chunk])
+        else:
+            where = tuple_(*pk).in_([tuple(key[c.key] for c in pk) for key in chunk])
+        for row in session.execute(select(*model.__table__.columns).where(where)):
+            by_key[_key_values(_row_key(model, row))] = row
+    for start in range(0, len(user_ids), 1000):
+        stmt = select(*model.__table__.columns).where(model.user_id.in_(user_ids[start:start + 1000]))
+        for row in session.execute(stmt.order_by(*pk)):
+            by_user.setdefault(row.user_id, []).append(row)
+    return by_key, by_user
+
+
+def fetch_changes(session, since=None, limit=DEFAULT_LIMIT, tables=None):
+    """
+    カーソル since より後の変更を最大 limit 件返します。
+
+    戻り値は (変更のリスト, 次回のカーソル, まだ続きがあるか)。
+    各変更は {'op': 'upsert' / 'delete' / 'invalidate', 'table', 'key', 'user_id', 'changed_at', 'data', 'cursor'} です。
+    upsert の data は取得時点の行の値で、その後に削除された行は返しません（削除の記録が後に続く）。
+    invalidate はテーブル全体が変わったことを表し、受け取った側はそのテーブルを全件取り直します。
+    主キーが記録されていない変更は、その職員の行ごとに同じカーソルで返します。
+    次回のカーソルは、変更がなければ since のままです。
+    """
+    after = decode_change_cursor(since) if since else 0
+    models = {model.__tablename__: model for model in feed_models()}
+    upto = latest_change_id(session)
+    stmt = select(*Change_Log.__table__.columns).where(Change_Log.change_id > after, Change_Log.change_id <= upto)
+    if tables:
+        unknown = set(tables) - set(models)
+        if unknown:
+            raise ValueError(f"変更フィードの対象外のテーブルです: {', '.join(sorted(unknown))}")
+        stmt = stmt.where(Change_Log.table_name.in_(tables))
+    entries = session.execute(stmt.order_by(Change_Log.change_id).limit(limit + 1)).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # upsert はテーブルごとにまとめて現在の行を読む
+    current = {}
+    for table_name in {entry.table_name for entry in entries if entry.op == 'upsert'}:
+        if table_name in models:
+            current[table_name] = _current_rows(
+                session, models[table_name],
+                [entry for entry in entries if entry.op == 'upsert' and entry.table_name == table_name])
+    session.rollback()
+
+    changes = []
+    for entry in entries:
+        cursor = encode_change_cursor(entry.change_id)
+        base = {'cursor': cursor, 'op': entry.op, 'table': entry.table_name, 'changed_at': entry.changed_at}
+        if entry.op == 'invalidate':
+            changes.append({**base, 'key': None, 'user_id': None, 'data': None})
+            continue
+        if entry.op == 'delete':
+            changes.append({**base, 'key': None if entry.row_key is None else json.loads(entry.row_key),
+                            'user_id': entry.user_id, 'data': None})
+            continue
+        if entry.table_name not in current:
+            continue
+        model = models[entry.table_name]
+        by_key, by_user = current[entry.table_name]
+        if entry.row_key is not None:
+            rows = [by_key.get(_key_values(json.loads(entry.row_key)))]
+        else:
+            rows = by_user.get(entry.user_id, [])
+        for row in rows:
+            if row is not None:
+                values = row._mapping
+                changes.append({**base, 'key': _row_key(model, row), 'user_id': values.get('user_id'),
+                                'data': dict(values)})
+    next_cursor = encode_change_cursor(entries[-1].change_id) if entries else since
+    return changes, next_cursor, has_more
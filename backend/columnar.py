@@ -0,0 +1,50 @@
+# --------------------
+# 列形式（columnar）の JSON
+# --------------------
+# 職員一覧を {"キー": 値} の配列ではなく、カラムごとの値の配列で返します。
+# キー名は1回だけで済み、繰り返しの多い名称は辞書（重複のない値の配列）への番号に置き換えます。
+#
+#   {
+#     "columns": ["user_id", "name", ...],
+#     "length": 2,
+#     "data": {"user_id": ["u1", "u2"], ..., "department_name": [0, 0]},
+#     "dictionaries": {"department_name": ["内科"], ...}
+#   }
+#
+# 辞書で符号化したカラムの null は null のままです。フロントエンドの decodeColumns() で行の配列に戻します。
+
+# 辞書で符号化するカラム（職員数に比べて種類が少ない名称）
+DICTIONARY_COLUMNS = ('position_name', 'department_name')
+
+
+def records_to_columns(records, columns):
+    """辞書のリストを {カラム名: [値, ...]} に変換します。"""
+    return {column: [record[column] for record in records] for column in columns}
+
+
+def dictionary_encode(values):
+    """値の配列を (番号の配列, 辞書) に変換します。辞書は出現順です。"""
+    index = {}
+    codes = []
+    for value in values:
+        if value is None:
+            codes.append(None)
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(index)
+        codes.append(code)
+    return codes, list(index)
+
+
+def encode_columns(data, columns, dictionary_columns=DICTIONARY_COLUMNS):
+    """{カラム名: [値, ...]} を列形式の JSON 用の辞書にします。"""
+    encoded = {}
+    dictionaries = {}
+    for column in columns:
+        if column in dictionary_columns:
+            encoded[column], dictionaries[column] = dictionary_encode(data[column])
+        else:
+            encoded[column] = data[column]
+    length = len(data[columns[0]]) if columns else 0
+    return {'columns': list(columns), 'length': length, 'data': encoded, 'dictionaries': dictionaries}
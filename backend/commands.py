@@ -2,8 +2,19 @@ import click
 import pandas as pd
 from .extensions import db
 # UserDepartment をインポート対象に追加
-from .models import Positions, User, EmployeeNumberHistory, DNumbers, Cards, Departments, UserDepartment
+from .models import Positions, User, EmployeeNumberHistory, DNumbers, Cards, Departments, UserDepartment, Department_Aliases
+from .models import External_Systems, External_System_Exports
+from .importers import (ImportStats, read_csv_chunks, normalize_employee_numbers, existing_employee_numbers,
+                        bulk_import_staff, parallel_import_staff, upsert_master, upsert_cards, backfill_name_kana)
+from .resolver import identifier_resolver, KEY_TYPES, IDENTIFIER_COLUMNS
+from .streaming import iter_csv, iter_ndjson, iter_table, write_parquet, ENCODINGS
+from .changes import fetch_changes, log_invalidation, CHANGE_COLUMNS, DEFAULT_LIMIT
+from .departments import department_canonicalizer
+from .exports import (load_plan, compile_plan, find_system, write_export_csv, write_delta_csv, write_delta_file,
+                      save_delta_state)
+from .roster import ROSTER_COLUMNS, COLUMN_LABELS, roster_select, filter_roster, paginate_roster, stream_roster
 import os
+import importlib.util
 import datetime
 import uuid
 import logging
@@ -13,7 +24,9 @@ def register_commands(app):
 
     @app.cli.command("import-positions")
     @click.argument('csv_file')
-    def import_positions(csv_file):
+    @click.option('--upsert', is_flag=True, help='既存の職位も名称を更新します（INSERT ... ON DUPLICATE KEY UPDATE）。')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int, help='CSVを読み込み・書き込みする1回あたりの行数。')
+    def import_positions(csv_file, upsert, chunk_size):
         """
         position_id_list.csv から Position (職位) マスターデータをインポートします。
         CSVはヘッダーなし、1列目=ID, 2列目=名前 と想定します。
@@ -27,39 +40,53 @@ def register_commands(app):
         
         try:
             # CSVにヘッダーがないため、カラム名を指定
-            df = pd.read_csv(
+            chunks = read_csv_chunks(
                 csv_file, 
+                chunk_size,
                 header=None, 
                 names=['position_id', 'position_name'],
                 # position_id を integer として読み込む
                 dtype={'position_id': int, 'position_name': str} 
             )
 
-            count = 0
-            for index, row in df.iterrows():
-                pos_id = row['position_id']
-                pos_name = row['position_name']
+            if upsert:
+                stats = upsert_master(Positions, chunks, 'position_id', ['position_name'])
+                stats.report()
+                print("職位データのインポートが完了しました。")
+                return
 
-                # 変更: Position -> Positions
-                existing_pos = Positions.query.get(pos_id)
-                
-                if existing_pos:
-                    print(f"スキップ: Position ID {pos_id} ({pos_name}) は既に存在します。")
-                    continue
-                
-                # 変更: Position -> Positions
-                new_pos = Positions(
-                    position_id=pos_id,
-                    position_name=pos_name
-                )
-                db.session.add(new_pos)
-                print(f"追加: Position ID {pos_id} ({pos_name})")
-                count += 1
+            count = 0
+            stats = ImportStats()
+            for df in chunks:
+                stats.read += len(df)
+                for index, row in df.iterrows():
+                    pos_id = row['position_id']
+                    pos_name = row['position_name']
+
+                    # 変更: Position -> Positions
+                    existing_pos = Positions.query.get(pos_id)
+                    
+                    if existing_pos:
+                        print(f"スキップ: Position ID {pos_id} ({pos_name}) は既に存在します。")
+                        continue
+                    
+                    # 変更: Position -> Positions
+                    new_pos = Positions(
+                        position_id=pos_id,
+                        position_name=pos_name
+                    )
+                    db.session.add(new_pos)
+                    print(f"追加: Position ID {pos_id} ({pos_name})")
+                    count += 1
+                # チャンクごとに書き出してセッションのオブジェクトを解放する
+                db.session.flush()
+                db.session.expunge_all()
 
             # ループが正常に完了したらコミット
             db.session.commit()
             print(f"---")
             print(f"職位データのインポートが完了しました。{count}件の新しいレコードが追加されました。")
+            stats.report_throughput()
 
         except Exception as e:
             db.session.rollback() # エラーが発生したらロールバック
@@ -67,7 +94,9 @@ def register_commands(app):
 
     @app.cli.command("import-departments")
     @click.argument('csv_file')
-    def import_departments(csv_file):
+    @click.option('--upsert', is_flag=True, help='既存の部署も名称を更新します（INSERT ... ON DUPLICATE KEY UPDATE）。')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int, help='CSVを読み込み・書き込みする1回あたりの行数。')
+    def import_departments(csv_file, upsert, chunk_size):
         """
         dept_master.csv から Department (部署) マスターデータをインポートします。
         CSVはヘッダーなし、1列目=ID, 2列目=名前 と想定します。
@@ -79,36 +108,52 @@ def register_commands(app):
         print(f"{csv_file} から部署データを読み込んでいます...")
 
         try:
-            df = pd.read_csv(
+            chunks = read_csv_chunks(
                 csv_file,
+                chunk_size,
                 header=None,
                 names=['department_id', 'department_name'],
                 dtype={'department_id': int, 'department_name': str}
             )
 
-            count = 0
-            for index, row in df.iterrows():
-                dept_id = row['department_id']
-                dept_name = row['department_name']
-
-                existing_dept = Departments.query.get(dept_id)
-
-                if existing_dept:
-                    print(f"スキップ: Department ID {dept_id} ({dept_name}) は既に存在します。")
-                    continue
+            if upsert:
+                # start_date は新規の部署にだけ設定される
+                stats = upsert_master(Departments, chunks, 'department_id', ['department_name'],
+                                      insert_defaults={'start_date': datetime.date.today()})
+                stats.report()
+                print("部署データのインポートが完了しました。")
+                return
 
-                new_dept = Departments(
-                    department_id=dept_id,
-                    department_name=dept_name,
-                    start_date=datetime.date.today() # start_date を今日の日付に設定
-                )
-                db.session.add(new_dept)
-                print(f"追加: Department ID {dept_id} ({dept_name})")
-                count += 1
+            count = 0
+            stats = ImportStats()
+            for df in chunks:
+                stats.read += len(df)
+                for index, row in df.iterrows():
+                    dept_id = row['department_id']
+                    dept_name = row['department_name']
+
+                    existing_dept = Departments.query.get(dept_id)
+
+                    if existing_dept:
+                        print(f"スキップ: Department ID {dept_id} ({dept_name}) は既に存在します。")
+                        continue
+
+                    new_dept = Departments(
+                        department_id=dept_id,
+                        department_name=dept_name,
+                        start_date=datetime.date.today() # start_date を今日の日付に設定
+                    )
+                    db.session.add(new_dept)
+                    print(f"追加: Department ID {dept_id} ({dept_name})")
+                    count += 1
+                # チャンクごとに書き出してセッションのオブジェクトを解放する
+                db.session.flush()
+                db.session.expunge_all()
 
             db.session.commit()
             print(f"---")
             print(f"部署データのインポートが完了しました。{count}件の新しいレコードが追加されました。")
+            stats.report_throughput()
 
         except Exception as e:
             db.session.rollback()
@@ -116,7 +161,13 @@ def register_commands(app):
 
     @app.cli.command("import-data")
     @click.argument('csv_file')
-    def import_data(csv_file):
+    @click.option('--bulk', is_flag=True, help='一括モード: チャンク単位の executemany で高速に取り込みます。')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int, help='CSVを読み込み・書き込みする1回あたりの行数。')
+    @click.option('--workers', default=1, show_default=True, type=int,
+                  help='2以上で並列モード: 検証・変換を行うプロセス数。')
+    @click.option('--writers', default=2, show_default=True, type=int,
+                  help='並列モードで DB に書き込むスレッド数（それぞれ専用の接続を使用）。')
+    def import_data(csv_file, bulk, chunk_size, workers, writers):
         """
         指定されたCSVファイルから初期データをDBにインポートします。
         (例: flask import-data nurse_newcomer_modified.csv)
@@ -128,182 +179,234 @@ def register_commands(app):
             return
 
         print(f"{csv_file} からデータを読み込んでいます...")
-        try:
-            # nurse_newcomer_modified.csv はヘッダー付き、UTF-8 と想定
-            # 1列目の名前なしカラムはインデックスとして読み込む
-            df = pd.read_csv(csv_file, encoding='utf-8', index_col=0) 
-        except Exception as e:
-            print(f"CSV読み込みエラー: {e}")
+
+        # nurse_newcomer_modified.csv はヘッダー付き、UTF-8 と想定
+        # 1列目の名前なしカラムはインデックスとして読み込む
+        # ファイル全体は読み込まず、chunk_size 行ずつ処理する
+        chunks = read_csv_chunks(csv_file, chunk_size, encoding='utf-8', index_col=0,
+                                 dtype={'employee_number': str, 'd_number': str})
+
+        if workers > 1:
+            print(f"並列モードで処理します... (チャンクサイズ: {chunk_size}, "
+                  f"変換プロセス: {workers}, 書き込みスレッド: {writers})")
+            try:
+                stats = parallel_import_staff(app, chunks, workers=workers, writers=writers)
+            except Exception as e:
+                print(f"エラーが発生したため中断しました（書き込み済みのチャンクは保持されます）: {e}")
+                return
+            stats.report()
+            print("データインポートが完了しました。")
             return
-            
-        print(f"{len(df)}件のデータを処理します...")
+
+        if bulk:
+            print(f"一括モードで処理します... (チャンクサイズ: {chunk_size})")
+            try:
+                stats = bulk_import_staff(chunks)
+            except Exception as e:
+                print(f"エラーが発生したためロールバックしました: {e}")
+                return
+            stats.report()
+            print("データインポートが完了しました。")
+            return
+
+        print(f"データを処理します... (チャンクサイズ: {chunk_size})")
+        stats = ImportStats()
+        # 職員番号は一括・並列モードと同じキーにそろえてから照合・登録する
+        rows = (item for df in chunks
+                for item in df.assign(employee_number=normalize_employee_numbers(df['employee_number'])).iterrows())
 
         # 'nurse_newcomer_modified.csv' のカラム名と
         # 'backend/models.py' のモデルを対応付けます
         
-        for index, row in df.iterrows():
-            try:
-                # --- 重複チェック ---
-                # employee_number をキーに EmployeeNumberHistory を検索
-                emp_num_str = str(row['employee_number'])
-                existing_history = EmployeeNumberHistory.query.filter_by(employee_number=emp_num_str).first()
-                
-                if existing_history:
-                    print(f"スキップ: Employee Number {emp_num_str} ({row['name']}) は既に存在します。")
-                    continue
-
-                # --- 新規登録 ---
-                # 1. user_id として UUID を生成
-                user_id = str(uuid.uuid4())
-
-                # 2. Usersテーブルへの登録
-                new_user = User(
-                    user_id=user_id, # 生成したUUIDを使用
-                    name=row['name'],
-                    birthday=pd.to_datetime(row['Birthday']).date() if pd.notna(row['Birthday']) else None,
-                    hire_date=pd.to_datetime(row['hire_date']).date() if pd.notna(row['hire_date']) else None
-                )
-                db.session.add(new_user)
-                
-                # 3. EmployeeNumberHistory への登録 (職員番号の履歴)
-                emp_history = EmployeeNumberHistory(
-                    user_id=user_id, # 生成したUUIDを使用
-                    employee_number=emp_num_str, # CSVの職員番号
-                    # CSVから 'position_id' を使用
-                    position_id=int(row['position_id']), 
-                    start_date=pd.to_datetime(row['hire_date']).date() if pd.notna(row['hire_date']) else None
-                )
-                db.session.add(emp_history)
-
-                # 4. DNumbers への登録
-                if pd.notna(row['d_number']): 
-                    d_num = DNumbers(
+        try:
+            for line, (index, row) in enumerate(rows, start=2):
+                stats.read += 1
+                try:
+                    # --- 重複チェック ---
+                    # employee_number をキーに EmployeeNumberHistory を検索
+                    # （以前の取り込みで先頭の 0 が落ちた表記で登録されている職員番号も重複とみなす）
+                    emp_num_str = row['employee_number']
+                    if pd.isna(emp_num_str):
+                        stats.error(line, f"User (Name: {row.get('name', 'N/A')}) の職員番号がありません。")
+                        continue
+                    if existing_employee_numbers([emp_num_str]):
+                        print(f"スキップ: Employee Number {emp_num_str} ({row['name']}) は既に存在します。")
+                        stats.skipped += 1
+                        continue
+
+                    # --- 新規登録 ---
+                    # 1. user_id として UUID を生成
+                    user_id = str(uuid.uuid4())
+
+                    # 2. Usersテーブルへの登録
+                    new_user = User(
                         user_id=user_id, # 生成したUUIDを使用
-                        d_number=str(row['d_number']),
-                        is_active=True 
+                        name=row['name'],
+                        name_kana=row['name_kana'] if pd.notna(row.get('name_kana')) else None,
+                        birthday=pd.to_datetime(row['Birthday']).date() if pd.notna(row['Birthday']) else None,
+                        hire_date=pd.to_datetime(row['hire_date']).date() if pd.notna(row['hire_date']) else None
                     )
-                    db.session.add(d_num)
-                
-                # 5. Cards への登録 (CSVにないためスキップ)
-                # ...
-
-                # 6. UserDepartment への登録 (部署との関連付け)
-                if pd.notna(row['department_id']):
-                    user_dept = UserDepartment(
+                    db.session.add(new_user)
+            
+                    # 3. EmployeeNumberHistory への登録 (職員番号の履歴)
+                    emp_history = EmployeeNumberHistory(
                         user_id=user_id, # 生成したUUIDを使用
-                        department_id=int(row['department_id'])
+                        employee_number=emp_num_str, # CSVの職員番号
+                        # CSVから 'position_id' を使用
+                        position_id=int(row['position_id']), 
+                        start_date=pd.to_datetime(row['hire_date']).date() if pd.notna(row['hire_date']) else None
                     )
-                    db.session.add(user_dept)
-                
-                db.session.commit()
-                print(f"成功: User {user_id} (Name: {row['name']}, Emp#: {emp_num_str}) を登録しました。")
+                    db.session.add(emp_history)
+
+                    # 4. DNumbers への登録
+                    if pd.notna(row['d_number']): 
+                        d_num = DNumbers(
+                            user_id=user_id, # 生成したUUIDを使用
+                            d_number=str(row['d_number']),
+                            is_active=True 
+                        )
+                        db.session.add(d_num)
+            
+                    # 5. Cards への登録 (CSVにないためスキップ)
+                    # ...
+
+                    # 6. UserDepartment への登録 (部署との関連付け)
+                    if pd.notna(row['department_id']):
+                        user_dept = UserDepartment(
+                            user_id=user_id, # 生成したUUIDを使用
+                            department_id=int(row['department_id'])
+                        )
+                        db.session.add(user_dept)
+            
+                    db.session.commit()
+                    print(f"成功: User {user_id} (Name: {row['name']}, Emp#: {emp_num_str}) を登録しました。")
+                    stats.inserted += 1
+
+                except Exception as e:
+                    db.session.rollback()
+                    # エラー出力に 'employee_number' を使用
+                    stats.error(line, f"User (Name: {row.get('name', 'N/A')}, Emp#: {row.get('employee_number', 'N/A')}) の登録に失敗しました。 {e}")
+        except Exception as e:
+            print(f"CSV読み込みエラー: {e}")
+            return
 
-            except Exception as e:
-                db.session.rollback()
-                # エラー出力に 'employee_number' を使用
-                print(f"エラー: User (Name: {row.get('name', 'N/A')}, Emp#: {row.get('employee_number', 'N/A')}) の登録に失敗しました。 {e}")
-        
+        stats.report()
         print("データインポートが完了しました。")
 
+    @app.cli.command("backfill-name-kana")
+    @click.argument('csv_file')
+    @click.option('--overwrite', is_flag=True, help='カナが登録済みの職員も CSV のカナで上書きします。')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int, help='CSVを読み込み・書き込みする1回あたりの行数。')
+    def backfill_name_kana_command(csv_file, overwrite, chunk_size):
+        """
+        import-data と同じ形式の CSV から、登録済みの職員の氏名（カナ）を職員番号で照合して埋めます。
+        name_kana 列の追加前に登録した職員は、カナ・ローマ字で職員検索できるようにこのコマンドで埋めてください。
+        (例: flask backfill-name-kana nurse_newcomer_modified.csv)
+        """
+        if not os.path.exists(csv_file):
+            print(f"エラー: ファイルが見つかりません: {csv_file}")
+            return
+
+        print(f"{csv_file} から氏名（カナ）を読み込んでいます...")
+        chunks = read_csv_chunks(csv_file, chunk_size, encoding='utf-8', index_col=0,
+                                 dtype={'employee_number': str, 'name_kana': str})
+        try:
+            stats = backfill_name_kana(chunks, overwrite=overwrite)
+        except Exception as e:
+            print(f"エラーが発生したためロールバックしました: {e}")
+            return
+        stats.report()
+        print("氏名（カナ）の後埋めが完了しました。")
+
     @app.cli.command("show-users")
     @click.option('--limit', '-n', default=None, type=int, help='表示する最大レコード数を指定します。')
-    def show_users(limit):
+    @click.option('--department', 'department_id', default=None, type=int, help='部署IDで絞り込みます。')
+    @click.option('--position', 'position_id', default=None, type=int, help='職位IDで絞り込みます。')
+    @click.option('--format', 'output_format', default='table', show_default=True,
+                  type=click.Choice(['table', 'csv', 'parquet']), help='出力形式。')
+    @click.option('--output', '-o', default=None, help='出力先のファイル（省略時は標準出力。parquet では必須）。')
+    @click.option('--encoding', default='utf-8-sig', show_default=True, type=click.Choice(ENCODINGS),
+                  help='CSVの文字コード。')
+    @click.option('--page-size', default=50, show_default=True, type=int, help='表形式で1ページに表示する行数。')
+    @click.option('--batch-size', default=1000, show_default=True, type=int,
+                  help='サーバーサイドカーソルから1回に読み込む行数。')
+    def show_users(limit, department_id, position_id, output_format, output, encoding, page_size, batch_size):
         """
-        データベースに登録されている全ユーザーの概要情報を表示します。
+        データベースに登録されているユーザーの概要情報を入職日順に表示します。
+        全件をメモリに載せず、1本のSQLの結果をサーバーサイドカーソルで読みながら出力します。
+        (例: flask show-users --department 3 --format csv -o users.csv)
         """
 
         # SQLAlchemyのログをWARNING以上のみ表示に設定
         # INFOレベルのSQLクエリログが出力されない
         logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
 
-        print("データベースからユーザー情報を読み込んでいます...")
+        if output_format == 'parquet':
+            if not output:
+                print("エラー: parquet 形式では --output を指定してください。")
+                return
+            if importlib.util.find_spec('pyarrow') is None:
+                print("エラー: parquet 形式の出力には pyarrow が必要です"
+                      "（pip install -r requirements-optional.txt）。")
+                return
 
-        try:
-            # 1. User クエリを作成 (まだ実行しない)
-            #    入職日でソートしておくと limit が意味を持つ
-            query = User.query.order_by(User.hire_date)
-
-            if limit:
-                # 2. limit オプションが指定されていたら件数を制限
-                print(f"データベースから最大{limit}件のユーザー情報を読み込んでいます...")
-                query = query.limit(limit)
-            else:
-                print("データベースから全ユーザー情報を読み込んでいます...")
+        # 絞り込みは SQL 側で行い、入職日順（同日は user_id 順）に並べる
+        stmt = filter_roster(roster_select(), department_id=department_id, position_id=position_id)
+        stmt = paginate_roster(stmt)
+        if limit:
+            stmt = stmt.limit(limit)
 
-            # 3. クエリを実行
-            users = query.all()
+        count = 0
 
-            if not users:
-                print("データベースにユーザーが見つかりません。")
-                return
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        rows = counted(stream_roster(db.session, stmt, batch_size=batch_size))
+
+        try:
+            if output_format == 'parquet':
+                types = {c: stmt.selected_columns[c].type.python_type for c in ROSTER_COLUMNS}
+                write_parquet(rows, ROSTER_COLUMNS, output, types=types, batch_size=batch_size)
+
+            elif output_format == 'csv':
+                stream = open(output, 'wb') if output else click.get_binary_stream('stdout')
+                try:
+                    for chunk in iter_csv(rows, ROSTER_COLUMNS, encoding=encoding):
+                        stream.write(chunk)
+                finally:
+                    if output:
+                        stream.close()
 
-            if limit:
-                print(f"--- {len(users)}件のユーザー情報を表示 (最大{limit}件) ---")
             else:
-                print(f"--- {len(users)}件のユーザー情報 ---")
-
-            dct = {}
-            i = 0
-            for user in users:
-                dct[i] = {}
-                dct[i]['user_id'] = user.user_id
-                dct[i]['name'] = user.name
-                dct[i]['hire_date'] = user.hire_date
-
-                # 職員番号と職位 (EmployeeNumberHistory から取得)
-                if user.employee_number_history:
-                    history = user.employee_number_history[0]
-                    dct[i]['employee_number'] = history.employee_number
-                    dct[i]['position_id'] = history.position_id
-                    # Position表示 (position リレーションシップが必要)
-                    if history.position:
-                        # PositionテーブルにIDがある場合
-                        dct[i]['position_name'] = history.position.position_name
-                    else:
-                        # PositionテーブルにIDが見つからない場合
-                        dct[i]['position_name'] = None
+                header = [COLUMN_LABELS[c] for c in ROSTER_COLUMNS]
+                pages = iter_table(rows, ROSTER_COLUMNS, header=header, page_size=page_size)
+                if output:
+                    with open(output, 'w', encoding='utf-8') as f:
+                        for page in pages:
+                            f.write(page + '\n')
                 else:
-                    # EmployeeNumberHistory が存在しない場合
-                    dct[i]['employee_number'] = None
-                    dct[i]['position_id'] = None
-                    dct[i]['position_name'] = None
-
-                # D番号 (DNumbers から取得)
-                if user.d_numbers:
-                    # DNumbersテーブルにD番号がある場合
-                    d_num = user.d_numbers[0]
-                    dct[i]['d_number'] = d_num.d_number
-                else:
-                    # D番号がNanの場合
-                    dct[i]['d_number'] = None
-
-                # 所属部署 (UserDepartment 経由で Departments から取得)
-                if user.departments:
-                    dept_assoc = user.departments[0] 
-                    if dept_assoc.department:
-                        # DepartmentテーブルにIDがある場合
-                        dct[i]['department_id'] = dept_assoc.department_id
-                        dct[i]['department_name'] = dept_assoc.department.department_name
-                    else:
-                        # DepartmentテーブルにIDが見つからない場合
-                        dct[i]['department_id'] = dept_assoc.department_id
-                        dct[i]['department_name'] = None
-                else:
-                    # department_idがNanの場合
-                    dct[i]['department_id'] = None
-                    dct[i]['department_name'] = None
-
-                i += 1
-            df = pd.DataFrame.from_dict(dct, orient='index')
-            print(df.head(limit))
-            print("\n--- 表示完了 ---")
+                    # 端末ではページャー（less など）で表示する。1ページずつ生成して渡す
+                    click.echo_via_pager(page + '\n' for page in pages)
 
         except Exception as e:
             print(f"データの表示中にエラーが発生しました: {e}")
+            return
+        finally:
+            db.session.rollback()
+
+        if count == 0:
+            click.echo("データベースにユーザーが見つかりません。", err=True)
+        else:
+            click.echo(f"--- {count}件のユーザー情報を出力しました ---", err=True)
 
     @app.cli.command("import-cards")
     @click.argument('csv_file')
-    def import_cards(csv_file):
+    @click.option('--upsert', is_flag=True, help='既存のカードも所有者・カード管理IDを更新します（INSERT ... ON DUPLICATE KEY UPDATE）。')
+    @click.option('--chunk-size', default=1000, show_default=True, type=int, help='CSVを読み込み・書き込みする1回あたりの行数。')
+    def import_cards(csv_file, upsert, chunk_size):
         """
         CardsテーブルにCSVからデータをインポートします。
         CSVは 'user_id', 'card_uid', 'card_management_id' のヘッダーがあることを前提とします。
@@ -317,8 +420,9 @@ def register_commands(app):
 
         try:
             # ヘッダー付き、UTF-8 と想定。キー項目は文字列として読み込む
-            df = pd.read_csv(
+            chunks = read_csv_chunks(
                 csv_file, 
+                chunk_size,
                 encoding='utf-8',
                 dtype={
                     'user_id': str,
@@ -327,45 +431,59 @@ def register_commands(app):
                 }
             )
 
+            if upsert:
+                print(f"UPSERT モードで処理します... (チャンクサイズ: {chunk_size})")
+                stats = upsert_cards(chunks)
+                stats.report()
+                print("カードデータのインポートが完了しました。")
+                return
+
             count = 0
             skip_count = 0
             fk_skip_count = 0
-
-            print(f"{len(df)}件のデータを処理します...")
-
-            for index, row in df.iterrows():
-                card_uid = row['card_uid']
-                user_id = row['user_id']
-                card_management_id = row['card_management_id']
-
-                # card_uid (PK) または user_id (FK) が空の場合はスキップ
-                if not pd.notna(card_uid) or not pd.notna(user_id):
-                    print(f"スキップ: {index+2}行目: card_uid または user_id が空です。")
-                    skip_count += 1
-                    continue
-
-                # 1. 既存チェック (Primary Key: card_uid)
-                existing_card = Cards.query.get(card_uid)
-                if existing_card:
-                    print(f"スキップ: Card UID {card_uid} は既に存在します。")
-                    skip_count += 1
-                    continue
+            stats = ImportStats()
+
+            print(f"データを処理します... (チャンクサイズ: {chunk_size})")
+
+            # chunk をまたいでも index は通し番号になる
+            for df in chunks:
+                for index, row in df.iterrows():
+                    stats.read += 1
+                    card_uid = row['card_uid']
+                    user_id = row['user_id']
+                    card_management_id = row['card_management_id']
+
+                    # card_uid (PK) または user_id (FK) が空の場合はスキップ
+                    if not pd.notna(card_uid) or not pd.notna(user_id):
+                        print(f"スキップ: {index+2}行目: card_uid または user_id が空です。")
+                        skip_count += 1
+                        continue
+
+                    # 1. 既存チェック (Primary Key: card_uid)
+                    existing_card = Cards.query.get(card_uid)
+                    if existing_card:
+                        print(f"スキップ: Card UID {card_uid} は既に存在します。")
+                        skip_count += 1
+                        continue
                 
-                # 2. 外部キーチェック (User ID)
-                user = User.query.get(user_id)
-                if not user:
-                    print(f"警告: User ID {user_id} (Card: {card_uid}) が Users テーブルに見つかりません。スキップします。")
-                    fk_skip_count += 1
-                    continue
-
-                # 3. 新規登録 (is_active はモデルのデフォルト 'True' を使用)
-                new_card = Cards(
-                    card_uid=card_uid,
-                    user_id=user_id,
-                    card_management_id=card_management_id
-                )
-                db.session.add(new_card)
-                count += 1
+                    # 2. 外部キーチェック (User ID)
+                    user = User.query.get(user_id)
+                    if not user:
+                        print(f"警告: User ID {user_id} (Card: {card_uid}) が Users テーブルに見つかりません。スキップします。")
+                        fk_skip_count += 1
+                        continue
+
+                    # 3. 新規登録 (is_active はモデルのデフォルト 'True' を使用)
+                    new_card = Cards(
+                        card_uid=card_uid,
+                        user_id=user_id,
+                        card_management_id=card_management_id
+                    )
+                    db.session.add(new_card)
+                    count += 1
+                # チャンクごとに書き出してセッションのオブジェクトを解放する
+                db.session.flush()
+                db.session.expunge_all()
 
             # ループが正常に完了したらコミット
             db.session.commit()
@@ -374,7 +492,356 @@ def register_commands(app):
             print(f"  {count}件の新しいレコードが追加されました。")
             print(f"  {skip_count}件のレコードが（重複またはデータ欠損のため）スキップされました。")
             print(f"  {fk_skip_count}件のレコードが（存在しないUser IDのため）スキップされました。")
+            stats.report_throughput()
 
         except Exception as e:
             db.session.rollback() # エラーが発生したらロールバック
-            print(f"エラーが発生したためロールバックしました: {e}")
\ No newline at end of file
+            print(f"エラーが発生したためロールバックしました: {e}")
+    @app.cli.command("resolve-ids")
+    @click.argument('csv_file')
+    @click.option('--type', 'key_type', default=None, type=click.Choice(list(KEY_TYPES)),
+                  help='type 列がない（空の）行の識別子の種類。省略するとすべての種類から探します。')
+    @click.option('--output', '-o', default=None, help='結果のCSVの出力先（省略時は標準出力）。')
+    @click.option('--encoding', default='utf-8-sig', show_default=True, type=click.Choice(ENCODINGS),
+                  help='出力するCSVの文字コード。')
+    def resolve_ids(csv_file, key_type, output, encoding):
+        """
+        CSVファイルの識別子（value 列、任意で type 列）を user_id と現在の識別子に解決します。
+        """
+        if not os.path.exists(csv_file):
+            print(f"エラー: ファイルが見つかりません: {csv_file}")
+            return
+
+        try:
+            df = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+            if 'value' not in df.columns:
+                print("エラー: CSVに value 列がありません。")
+                return
+            types = df['type'] if 'type' in df.columns else [''] * len(df)
+            identifiers = [(t or key_type, v) for t, v in zip(types, df['value'])]
+
+            results = identifier_resolver.resolve(db.session, identifiers)
+            columns = ['type', 'value', 'matched_type'] + IDENTIFIER_COLUMNS + ['error']
+            rows = ({c: r.get(c) for c in columns} for r in results)
+
+            stream = open(output, 'wb') if output else click.get_binary_stream('stdout')
+            try:
+                for chunk in iter_csv(rows, columns, encoding=encoding):
+                    stream.write(chunk)
+            finally:
+                if output:
+                    stream.close()
+
+            resolved = sum(1 for r in results if r['user_id'] is not None)
+            # 標準出力をCSVに使うため、集計は標準エラーに出す
+            click.echo(f"{len(results)}件中 {resolved}件を解決しました。", err=True)
+
+        except ValueError as e:
+            print(f"エラー: {e}")
+
+    @app.cli.command("roster-as-of")
+    @click.argument('as_of', type=click.DateTime(formats=['%Y-%m-%d']))
+    @click.option('--department', 'department_id', default=None, type=int, help='部署IDで絞り込みます。')
+    @click.option('--position', 'position_id', default=None, type=int, help='職位IDで絞り込みます。')
+    @click.option('--output', '-o', default=None, help='CSVの出力先（省略時は標準出力）。')
+    @click.option('--encoding', default='utf-8-sig', show_default=True, type=click.Choice(ENCODINGS),
+                  help='出力するCSVの文字コード。')
+    def roster_as_of(as_of, department_id, position_id, output, encoding):
+        """
+        指定日（YYYY-MM-DD）時点の在籍者と、その日の職員番号・職位・部署をCSVで出力します。
+        """
+        as_of = as_of.date()
+        stmt = filter_roster(roster_select(as_of), department_id=department_id, position_id=position_id)
+        rows = stream_roster(db.session, paginate_roster(stmt))
+
+        stream = open(output, 'wb') if output else click.get_binary_stream('stdout')
+        count = 0
+        try:
+            def counted(rows):
+                nonlocal count
+                for row in rows:
+                    count += 1
+                    yield row
+            for chunk in iter_csv(counted(rows), ROSTER_COLUMNS, encoding=encoding):
+                stream.write(chunk)
+        except ValueError as e:
+            click.echo(f"エラー: {e}", err=True)
+            return
+        finally:
+            if output:
+                stream.close()
+        click.echo(f"{as_of.isoformat()} 時点の職員 {count}件を出力しました。", err=True)
+
+    @app.cli.command("changes")
+    @click.option('--since', default=None, help='前回の続きから取得するカーソル（省略すると最初から）。')
+    @click.option('--cursor-file', default=None,
+                  help='カーソルを保存するファイル。指定すると前回の続きから取得し、取得後に更新します。')
+    @click.option('--tables', default=None, help='対象テーブルをカンマ区切りで指定します。')
+    @click.option('--limit', default=DEFAULT_LIMIT, show_default=True, type=int, help='1回のクエリで取得する件数。')
+    def changes(since, cursor_file, tables, limit):
+        """
+        前回以降の変更（追加・更新・削除）を NDJSON で標準出力に出力します。
+        """
+        if cursor_file and not since and os.path.exists(cursor_file):
+            with open(cursor_file, encoding='utf-8') as f:
+                since = f.read().strip() or None
+        tables = [t for t in tables.split(',') if t] if tables else None
+
+        stream = click.get_binary_stream('stdout')
+        total = 0
+        try:
+            # 続きがある間はページを取得し続ける
+            while True:
+                page, next_cursor, has_more = fetch_changes(db.session, since, limit, tables)
+                for chunk in iter_ndjson(page, CHANGE_COLUMNS):
+                    stream.write(chunk)
+                # 書き出し終えてからカーソルを進める
+                since = next_cursor
+                total += len(page)
+                if not has_more:
+                    break
+        except ValueError as e:
+            click.echo(f"エラー: {e}", err=True)
+            return
+        finally:
+            if cursor_file and since:
+                with open(cursor_file, 'w', encoding='utf-8') as f:
+                    f.write(since)
+
+        click.echo(f"{total}件の変更を出力しました。次回のカーソル: {since}", err=True)
+
+    @app.cli.command("invalidate-changes")
+    @click.argument('tables', nargs=-1, required=True)
+    def invalidate_changes(tables):
+        """
+        アプリを通さずに書き換えたテーブル（TABLES）の全体が変わったことを Change_Log に記録します。
+        職員一覧の ETag・インメモリの索引・差分出力が、次の確認時にそのテーブルを読み直します。
+        """
+        try:
+            log_invalidation(db.session, tables)
+            db.session.commit()
+        except ValueError as e:
+            db.session.rollback()
+            click.echo(f"エラー: {e}", err=True)
+            return
+        click.echo(f"{', '.join(tables)} の変更を記録しました。", err=True)
+
+    @app.cli.command("canonicalize-departments")
+    @click.argument('csv_file')
+    @click.option('--column', default='dept', show_default=True, help='部署名の列。')
+    @click.option('--input-encoding', default='utf-8', show_default=True, type=click.Choice(ENCODINGS),
+                  help='読み込むCSVの文字コード。')
+    @click.option('--output', '-o', default=None, help='結果のCSVの出力先（省略時は標準出力）。')
+    @click.option('--encoding', default='utf-8-sig', show_default=True, type=click.Choice(ENCODINGS),
+                  help='出力するCSVの文字コード。')
+    @click.option('--unresolved', 'unresolved_file', default=None,
+                  help='解決できなかった部署名と件数を書き出すCSV（department 列を埋めて add-department-alias に使う）。')
+    def canonicalize_departments(csv_file, column, input_encoding, output, encoding, unresolved_file):
+        """
+        CSVファイルの部署名を Departments の部署に対応付け、department_ids・department_names 列を追加して出力します。
+        複数の部署に対応する部署名は ';' 区切りになります。
+        """
+        if not os.path.exists(csv_file):
+            print(f"エラー: ファイルが見つかりません: {csv_file}")
+            return
+
+        df = pd.read_csv(csv_file, dtype=str, encoding=input_encoding)
+        if column not in df.columns:
+            print(f"エラー: CSVに {column} 列がありません。")
+            return
+
+        if Department_Aliases.query.first() is None:
+            click.echo("警告: 部署名の別名（Department_Aliases）が1件も登録されていません。部署を取り込んだ後に "
+                       "flask add-department-alias --from-csv seeds/department_aliases.csv で同梱の別名を登録してください。",
+                       err=True)
+
+        # 部署名の種類ごとに1回だけ解決し、行に配り直す
+        codes, uniques = pd.factorize(df[column])
+        resolved = department_canonicalizer.canonicalize(db.session, list(uniques))
+        ids = [';'.join(map(str, d)) for d in resolved] + ['']
+        names = [';'.join(department_canonicalizer.department_name(i) or '' for i in d) for d in resolved] + ['']
+        df['department_ids'] = [ids[c] for c in codes]
+        df['department_names'] = [names[c] for c in codes]
+
+        columns = list(df.columns)
+        rows = df.astype(object).where(df.notna(), None).to_dict('records')
+        stream = open(output, 'wb') if output else click.get_binary_stream('stdout')
+        try:
+            for chunk in iter_csv(rows, columns, encoding=encoding):
+                stream.write(chunk)
+        except ValueError as e:
+            click.echo(f"エラー: {e}", err=True)
+            return
+        finally:
+            if output:
+                stream.close()
+
+        counts = df[column].value_counts()
+        unresolved = [(name, int(counts[name])) for name, d in zip(uniques, resolved) if not d]
+        if unresolved_file:
+            with open(unresolved_file, 'wb') as f:
+                rows = ({'alias': name, 'count': n, 'department': None} for name, n in unresolved)
+                for chunk in iter_csv(rows, ['alias', 'count', 'department'], encoding='utf-8-sig'):
+                    f.write(chunk)
+        missing = sum(n for _, n in unresolved) + int(df[column].isna().sum())
+        click.echo(f"{len(df)}件（部署名 {len(uniques)}種類）中 {len(df) - missing}件を解決しました。"
+                   f"解決できなかった部署名: {len(unresolved)}種類", err=True)
+
+    @app.cli.command("add-department-alias")
+    @click.argument('alias', required=False)
+    @click.argument('department', required=False)
+    @click.option('--from-csv', 'csv_file', default=None,
+                  help='alias・department 列のCSVからまとめて登録します（canonicalize-departments --unresolved の出力、'
+                       'seeds/department_aliases.csv など）。')
+    @click.option('--skip-unknown', is_flag=True,
+                  help='部署を特定できない行は登録せずに飛ばします（指定しない場合は1件も登録しません）。')
+    def add_department_alias(alias, department, csv_file, skip_unknown):
+        """
+        部署名の表記ゆれ ALIAS を部署 DEPARTMENT（部署IDか部署名）の別名として登録します。
+        """
+        if csv_file:
+            df = pd.read_csv(csv_file, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+            pairs = [(a, d) for a, d in zip(df['alias'], df['department']) if a and d]
+        elif alias and department:
+            pairs = [(alias, department)]
+        else:
+            print("エラー: ALIAS と DEPARTMENT か、--from-csv を指定してください。")
+            return
+
+        added, skipped = 0, 0
+        try:
+            # lookup はセッションをロールバックするため、登録の前にまとめて部署を特定する
+            resolved = []
+            for alias, department in pairs:
+                try:
+                    resolved.append((alias, department_canonicalizer.lookup(db.session, department)))
+                except ValueError as e:
+                    if not skip_unknown:
+                        raise
+                    print(f"スキップ: {alias}: {e}")
+            pairs = resolved
+            for alias, department_id in pairs:
+                existing = Department_Aliases.query.filter_by(alias=alias).first()
+                if existing is None:
+                    db.session.add(Department_Aliases(alias=alias, department_id=department_id))
+                    added += 1
+                elif existing.department_id != department_id:
+                    existing.department_id = department_id
+                    added += 1
+                else:
+                    skipped += 1
+            db.session.commit()
+            print(f"別名を {added}件登録しました（登録済み {skipped}件）。")
+        except ValueError as e:
+            db.session.rollback()
+            print(f"エラー: {e}")
+
+    @app.cli.command("import-export-settings")
+    @click.argument('system')
+    @click.argument('csv_file')
+    @click.option('--file-encoding', default=None, type=click.Choice(ENCODINGS),
+                  help='外部システムの出力ファイルの文字コード（省略時は変更しない。新規登録時は utf-8-sig）。')
+    def import_export_settings(system, csv_file, file_encoding):
+        """
+        外部システム SYSTEM（system_id か名前。未登録の名前は新規登録）の出力設定を CSV の内容で置き換えます。
+        CSV は transform_id（出力の列名）・table_name・column_name・transform 列を出力の列順に並べたものです。
+        """
+        if not os.path.exists(csv_file):
+            print(f"エラー: ファイルが見つかりません: {csv_file}")
+            return
+
+        df = pd.read_csv(csv_file, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        missing = {'transform_id', 'table_name', 'column_name', 'transform'} - set(df.columns)
+        if missing:
+            print(f"エラー: CSVに {', '.join(sorted(missing))} 列がありません。")
+            return
+
+        try:
+            try:
+                target = find_system(db.session, system)
+            except ValueError:
+                if system.isdigit():
+                    raise
+                target = External_Systems(system_name=system, start_date=datetime.date.today())
+                db.session.add(target)
+            if file_encoding:
+                target.file_encoding = file_encoding
+            elif target.file_encoding is None:
+                target.file_encoding = 'utf-8-sig'
+            db.session.flush()
+
+            settings = [
+                External_System_Exports(
+                    system_id=target.system_id, transform_id=row['transform_id'],
+                    table_name=row['table_name'] or None, column_name=row['column_name'] or None,
+                    transform=row['transform'] or None,
+                )
+                for row in df.to_dict('records')
+            ]
+            # 保存する前に設定をコンパイルして誤りを確かめる
+            compile_plan(target, settings)
+
+            for existing in External_System_Exports.query.filter_by(system_id=target.system_id).all():
+                db.session.delete(existing)
+            db.session.flush()
+            db.session.add_all(settings)
+            db.session.commit()
+            print(f"{target.system_name}（system_id={target.system_id}）の出力設定を {len(settings)}列で登録しました。")
+
+        except ValueError as e:
+            db.session.rollback()
+            print(f"エラー: {e}")
+
+    @app.cli.command("export-system")
+    @click.argument('system')
+    @click.option('--output', '-o', default=None, help='出力先のファイル（省略時は標準出力）。')
+    @click.option('--encoding', default=None, type=click.Choice(ENCODINGS),
+                  help='出力するCSVの文字コード（省略時は外部システムの設定）。')
+    @click.option('--batch-size', default=5000, show_default=True, type=int,
+                  help='DBから1回に読み込み、まとめて変換する行数。')
+    @click.option('--delta', is_flag=True,
+                  help='前回の差分出力以降に追加・変更・削除された行だけを、先頭に op 列を付けて出力します。')
+    @click.option('--full', is_flag=True,
+                  help='差分出力の状態を作り直し、全員を insert として出力します（--delta を含む）。')
+    @click.option('--explain', is_flag=True, help='出力せずに、コンパイルした出力設定と SQL を表示します。')
+    def export_system(system, output, encoding, batch_size, delta, full, explain):
+        """
+        外部システム SYSTEM（system_id か名前）の出力設定（External_System_Exports）に従って職員の CSV を出力します。
+        """
+        try:
+            target = find_system(db.session, system)
+            plan = load_plan(db.session, target)
+            if explain:
+                print(plan.describe())
+                print(plan.stmt.compile(db.engine))
+                return
+
+            if (delta or full) and output:
+                # 一時ファイルに書き出し、差分の基準をコミットしてから output に置き換える
+                state = write_delta_file(db.session, target, plan, output, encoding, full, batch_size)
+            else:
+                stream = open(output, 'wb') if output else click.get_binary_stream('stdout')
+                try:
+                    if delta or full:
+                        state = write_delta_csv(db.session, target, plan, stream, encoding, full, batch_size)
+                    else:
+                        count = write_export_csv(db.session, plan, stream, encoding, batch_size)
+                finally:
+                    if output:
+                        stream.close()
+                if delta or full:
+                    # 書き出しが成功した場合だけ、次回の差分の基準を進める
+                    db.session.rollback()
+                    save_delta_state(db.session, state)
+
+            if delta or full:
+                scope = '全員' if state.user_ids is None else f'更新のあった {len(state.user_ids)}人'
+                click.echo(f"{plan.system_name} の差分出力（{scope}を確認）: 追加 {state.inserted}件 / "
+                           f"変更 {state.updated}件 / 削除 {len(state.retired)}件", err=True)
+            else:
+                click.echo(f"{plan.system_name} の出力: {count}件", err=True)
+
+        except ValueError as e:
+            click.echo(f"エラー: {e}", err=True)
+        finally:
+            db.session.rollback()
@@ -0,0 +1,76 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli は任意の依存。なければ gzip だけを使う
+    brotli = None
+
+from flask import request
+
+# --------------------
+# レスポンスの圧縮（gzip / brotli）
+# --------------------
+# Accept-Encoding を見て、JSON・CSV などのテキスト系レスポンスを圧縮します。
+# 職員一覧の JSON は同じ文字列の繰り返しが多く、gzip で 1/10 程度になります。
+# ストリーミング応答（/api/users/export など）は対象外で、nginx の gzip に任せます。
+#
+# 圧縮したレスポンスの ETag は弱い ETag（W/"..."）に変えます（符号化が違えばバイト列も違うため）。
+# 条件付き GET の比較は弱い比較で行ってください（api/users.py の _not_modified）。
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/plain',
+    'text/html',
+)
+
+
+def choose_encoding(accept_encodings):
+    """Accept-Encoding から使う符号化（'br' / 'gzip' / None）を選びます。同じ重みなら br を優先します。"""
+    br = accept_encodings.quality('br') if brotli is not None else 0
+    gz = accept_encodings.quality('gzip')
+    if br > 0 and br >= gz:
+        return 'br'
+    if gz > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=5):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    # mtime=0: 同じ内容なら同じバイト列になるようにする
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def init_compression(app):
+    """app の全レスポンスに Accept-Encoding による圧縮を適用します。"""
+    if not app.config.get('COMPRESSION_ENABLED', True):
+        return
+    min_size = app.config.get('COMPRESSION_MIN_SIZE', 1024)
+    gzip_level = app.config.get('COMPRESSION_GZIP_LEVEL', 6)
+    brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY', 5)
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        # 圧縮の有無で内容が変わるため、キャッシュ（nginx・ブラウザ）に Accept-Encoding ごとに保存させる
+        response.vary.add('Accept-Encoding')
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers):
+            return response
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        response.set_data(compress(data, encoding, gzip_level, brotli_quality))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
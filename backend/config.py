@@ -1,9 +1,35 @@
 import os
 from dotenv import load_dotenv
+from .pool import InstrumentedQueuePool
 
 # .envファイルから環境変数を読み込む（ローカル開発用）
 load_dotenv()
 
+
+def engine_options(pool_size=5, max_overflow=5, pool_timeout=10, pool_recycle=1800, connect_timeout=5):
+    """
+    SQLAlchemy の接続プール設定を返します。引数は設定クラスごとの既定値で、環境変数で上書きできます。
+
+        DB_POOL_SIZE        常時保持する接続数（gunicorn のスレッド数以上にする）
+        DB_MAX_OVERFLOW     pool_size を超えて一時的に作る接続数
+        DB_POOL_TIMEOUT     空き接続を待つ秒数（超えるとエラー）
+        DB_POOL_RECYCLE     この秒数より古い接続は作り直す（MySQL の wait_timeout より短くする）
+        DB_POOL_PRE_PING    1 なら取り出すたびに接続の生存を確認する
+        DB_CONNECT_TIMEOUT  MySQL への接続タイムアウト（秒, connect_timeout=None で指定しない）
+    """
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', pool_size)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', max_overflow)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', pool_timeout)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', pool_recycle)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+    }
+    if connect_timeout is not None:
+        options['connect_args'] = {'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', connect_timeout))}
+    return options
+
+
 class Config:
     """基本設定クラス"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'a_very_secret_key_fallback'
@@ -23,6 +49,37 @@ class Config:
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False # Trueにすると実行SQLをログに出力
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options()
+
+    # カードUID索引（/api/cards）
+    # サーバー（gunicorn）の起動時に全カードを読み込むか（flask コマンドでは読み込まない）、差分更新・全件読み直しの間隔（秒）
+    CARD_INDEX_PRELOAD = os.environ.get('CARD_INDEX_PRELOAD', '1') == '1'
+    CARD_INDEX_REFRESH_SECONDS = float(os.environ.get('CARD_INDEX_REFRESH_SECONDS', 5))
+    CARD_INDEX_FULL_REFRESH_SECONDS = float(os.environ.get('CARD_INDEX_FULL_REFRESH_SECONDS', 300))
+
+    # 職員検索の索引（/api/search）
+    # 削除も Change_Log から差分で反映するため、全件の読み直しはカード索引より間隔を長くする
+    SEARCH_INDEX_PRELOAD = os.environ.get('SEARCH_INDEX_PRELOAD', '1') == '1'
+    SEARCH_INDEX_REFRESH_SECONDS = float(os.environ.get('SEARCH_INDEX_REFRESH_SECONDS', 5))
+    SEARCH_INDEX_FULL_REFRESH_SECONDS = float(os.environ.get('SEARCH_INDEX_FULL_REFRESH_SECONDS', 3600))
+
+    # リクエストの計測（Server-Timing ヘッダー・JSON ログ・/metrics）
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1') == '1'
+    # 同じ形の SQL がこの回数を超えて実行されたリクエストを N+1 として警告する
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 10))
+    # 警告ログに載せる遅い SQL の件数
+    SQL_SLOWEST = 3
+    # この時間（ミリ秒）を超えたリクエストは遅い SQL を付けて警告する
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+    # リクエストログの出力レベル（WARNING にすると遅いリクエストと N+1 だけを出力する）
+    REQUEST_LOG_LEVEL = os.environ.get('REQUEST_LOG_LEVEL', 'INFO')
+
+    # レスポンスの圧縮（Accept-Encoding に応じて br / gzip。br は brotli パッケージ（requirements-optional.txt）がある場合のみ）
+    COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+    # これより小さいレスポンスは圧縮しない（バイト）
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 5
 
 class DevelopmentConfig(Config):
     """開発環境用設定"""
@@ -33,10 +90,32 @@ class ProductionConfig(Config):
     """本番環境用設定"""
     DEBUG = False
     SQLALCHEMY_ECHO = False
+    # gunicorn の1ワーカーあたりのスレッド数（既定 4）に余裕を持たせる
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(pool_size=8, max_overflow=4)
+
+class TestingConfig(Config):
+    """テスト・ベンチマーク用設定（既定はインメモリのSQLite）"""
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    SQLALCHEMY_ECHO = False
+    # インメモリの SQLite は接続ごとに別のDBになるため、ドライバ既定のプールを使う
+    # ファイルの SQLite には MySQL 向けの connect_timeout を渡さない
+    if SQLALCHEMY_DATABASE_URI in ('sqlite://', 'sqlite:///:memory:'):
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+    elif SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(connect_timeout=None)
+    else:
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options()
+    # テーブル作成前に起動するため、索引は最初のリクエストで読み込む
+    CARD_INDEX_PRELOAD = False
+    SEARCH_INDEX_PRELOAD = False
+    # ベンチマークで大量のリクエストを送るため、通常のリクエストログは出さない
+    REQUEST_LOG_LEVEL = os.environ.get('REQUEST_LOG_LEVEL', 'WARNING')
 
 # 環境変数に応じて設定を切り替える
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
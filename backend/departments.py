@@ -0,0 +1,196 @@
+import re
+import threading
+import unicodedata
+from sqlalchemy import select, case
+from .models import Departments, Department_Aliases
+from .roster import roster_version
+
+# --------------------
+# 部署名の正規化（表記ゆれ → department_id）
+# --------------------
+# カードデータなどの外部データの部署名は、半角カナ・「･」と「・」・「、」区切り・複数部署の併記など
+# 表記がそろっていないため、次の手順で Departments の部署に対応付けます。
+#
+#   1. NFKC 正規化（半角カナ → 全角、全角英数字 → 半角、「･」→「・」など）と区切り文字・空白の統一
+#   2. 部署名と Department_Aliases の別名を同じ方法で正規化した索引（{正規化した名前: department_id}）で引く
+#   3. 見つからない場合は「/」と「・」で区切り、それぞれが索引にある部署名の組み合わせとして解釈する
+#      （「呼吸器内科/臨床腫瘍部」「救急部・集中治療部」は2つの部署に対応する）
+#
+# 同じ部署名は何度も現れるため、結果は元の部署名ごとに保持し、Departments・Department_Aliases の
+# Change_Log の最新の change_id が変わった場合に索引ごと破棄します（roster_version）。
+# 新しい表記ゆれは Department_Aliases に行を追加すれば（add-department-alias）、コードを変えずに反映されます。
+
+# 部署の区切りとして扱う文字（NFKC の後に適用する）
+_SEPARATOR_TABLE = str.maketrans({
+    '、': '・', ',': '・', '·': '・', '•': '・', '‧': '・', '\\': '/',
+})
+_SPACES = re.compile(r'\s+')
+_AROUND_SEPARATORS = re.compile(r'\s*([・/])\s*')
+_REPEATED_DOTS = re.compile(r'・{2,}')
+
+# 索引の鮮度確認に使うテーブル
+DEPARTMENT_TABLES = [Departments, Department_Aliases]
+
+
+def normalize_department_name(name):
+    """
+    部署名を索引のキーに正規化します（文字列でない値や空の部署名は None）。
+
+    >>> normalize_department_name('ｱﾚﾙｷﾞｰ･膠原病内科')
+    'アレルギー・膠原病内科'
+    >>> normalize_department_name(' 婦人科、周産期母性科 ')
+    '婦人科・周産期母性科'
+    >>> normalize_department_name('ＭＥ機器管理センター／未来医療系事務部\\u3000医学部')
+    'ME機器管理センター/未来医療系事務部 医学部'
+    """
+    if not isinstance(name, str):
+        return None
+    text = unicodedata.normalize('NFKC', name).translate(_SEPARATOR_TABLE)
+    text = _SPACES.sub(' ', text).strip()
+    text = _AROUND_SEPARATORS.sub(r'\1', text)
+    text = _REPEATED_DOTS.sub('・', text).strip('・/')
+    return text or None
+
+
+def _segment(index, part):
+    """
+    「・」で区切った語を、索引にある部署名の並びとして最も少ない部署数で解釈します。
+    解釈できない場合は None を返します。
+    """
+    tokens = part.split('・')
+    # best[i]: tokens[:i] を覆う department_id のリスト
+    best = [[]] + [None] * len(tokens)
+    for end in range(1, len(tokens) + 1):
+        for start in range(end):
+            if best[start] is None:
+                continue
+            department_id = index.get('・'.join(tokens[start:end]))
+            if department_id is None:
+                continue
+            candidate = best[start] + [department_id]
+            if best[end] is None or len(candidate) < len(best[end]):
+                best[end] = candidate
+    return best[-1]
+
+
+def resolve_key(index, key):
+    """
+    正規化した部署名を department_id のタプルに解決します（解決できない場合は空のタプル）。
+
+    >>> index = {'救急科': 1, '集中治療部': 2, '糖尿病・代謝・内分泌内科': 3, 'アレルギー・膠原病内科': 4}
+    >>> resolve_key(index, '救急科・集中治療部')
+    (1, 2)
+    >>> resolve_key(index, 'アレルギー・膠原病内科・糖尿病・代謝・内分泌内科')
+    (4, 3)
+    >>> resolve_key(index, '救急科/不明な部署')
+    ()
+    """
+    if not key:
+        return ()
+    if key in index:
+        return (index[key],)
+    ids = []
+    for part in key.split('/'):
+        if not part:
+            continue
+        found = _segment(index, part)
+        if found is None:
+            return ()
+        ids.extend(found)
+    return tuple(dict.fromkeys(ids))
+
+
+class DepartmentCanonicalizer:
+    """部署名 → department_id の索引"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = {}     # {正規化した部署名・別名: department_id}
+        self._names = {}     # {department_id: 部署名}
+        self._resolved = {}  # {元の部署名: (department_id, ...)}
+        self._version = None
+        self._loaded = False
+        self.loads = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, session):
+        index, names = {}, {}
+        # 終了した部署より現在有効な部署を優先する（後に読み込んだ行で上書きする）
+        stmt = (select(Departments.department_id, Departments.department_name)
+                .order_by(case((Departments.end_date.is_(None), 1), else_=0), Departments.department_id))
+        for department_id, department_name in session.execute(stmt):
+            names[department_id] = department_name
+            key = normalize_department_name(department_name)
+            if key:
+                index[key] = department_id
+        # 別名は部署名より優先する
+        stmt = select(Department_Aliases.alias, Department_Aliases.department_id).order_by(Department_Aliases.alias_id)
+        for alias, department_id in session.execute(stmt):
+            key = normalize_department_name(alias)
+            if key:
+                index[key] = department_id
+        return index, names
+
+    def _check_version(self, session):
+        """DB 側の変更を検出したら索引を読み直します。"""
+        version = roster_version(session, DEPARTMENT_TABLES).etag
+        with self._lock:
+            if self._loaded and version == self._version:
+                return
+            self._index, self._names = self._load(session)
+            self._resolved = {}
+            self._version = version
+            self._loaded = True
+            self.loads += 1
+
+    def canonicalize(self, session, names):
+        """
+        部署名のリストを、入力と同じ順の department_id のタプルのリストに変換します。
+        重複する部署名は1回だけ正規化・解決します。
+        """
+        self._check_version(session)
+        session.rollback()
+        # 処理中に他のスレッドが索引を読み直しても、この呼び出しの中では同じ辞書を使う
+        index, resolved = self._index, self._resolved
+
+        unique = dict.fromkeys(names)
+        for name in unique:
+            if name in resolved:
+                self.hits += 1
+                unique[name] = resolved[name]
+            else:
+                self.misses += 1
+                unique[name] = resolved[name] = resolve_key(index, normalize_department_name(name))
+        return [unique[name] for name in names]
+
+    def department_name(self, department_id):
+        return self._names.get(department_id)
+
+    def lookup(self, session, value):
+        """
+        department_id（数字）か部署名から部署を1つに特定し、department_id を返します。
+        見つからない・複数の部署に対応する場合は ValueError を送出します。
+        """
+        self._check_version(session)
+        session.rollback()
+        if str(value).isdigit():
+            if int(value) not in self._names:
+                raise ValueError(f"部署ID {value} は存在しません。")
+            return int(value)
+        ids = resolve_key(self._index, normalize_department_name(value))
+        if len(ids) != 1:
+            raise ValueError(f"部署を1つに特定できません: {value}")
+        return ids[0]
+
+    def stats(self):
+        return {
+            'loads': self.loads,
+            'hits': self.hits,
+            'misses': self.misses,
+            'indexed': len(self._index),
+            'resolved': len(self._resolved),
+        }
+
+
+department_canonicalizer = DepartmentCanonicalizer()
@@ -0,0 +1,485 @@
+import datetime
+import os
+import threading
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, update, delete
+from .models import (
+    User, EmployeeNumberHistory, Positions, DNumbers, System_IDs, Cards, UserDepartment, Departments,
+    External_Systems, External_System_Exports, External_System_Export_Rows,
+)
+from .roster import current_subqueries, roster_version
+from .changes import latest_change_id, changed_user_ids as logged_user_ids, has_changes
+from .streaming import ENCODINGS, unencodable_error
+from .text_tables import KANA_Z2H_TABLE, FULLWIDTH_ALNUM_TABLE
+
+# --------------------
+# 外部システム向けのファイル出力（External_System_Exports による設定）
+# --------------------
+# External_System_Exports の1行が出力ファイルの1列です（export_setting_id の順）。
+#   table_name / column_name: 値の取得元（空の場合は transform の const などで値を作る）
+#   transform_id: 出力ファイルでの列名
+#   transform: 値の変換処理。'|' 区切りで左から順に適用します（例: 'family_name|halfwidth_kana'）
+#
+# システムごとの設定を「使うテーブルだけを結合した1本の SELECT 文」と「列ごとの変換関数のリスト」に
+# コンパイルし（ExportPlan）、出力設定が変わるまでシステムごとに使い回します（export_plans）。
+# 出力時はサーバーサイドカーソルで batch_size 行ずつ読み込み、変換は pandas の列単位で行います。
+
+# 取得元にできるテーブル: (モデル, current_subqueries のキー, (結合元のテーブル, 結合に使う列))
+# 履歴テーブルは職員一覧と同じ「現在のレコード」を使う。結合元のテーブルが先に来る順に並べる
+SOURCE_TABLES = {
+    'Users': (User, None, None),
+    'Employee_Number_History': (EmployeeNumberHistory, 'employee_number_history', None),
+    'Positions': (Positions, None, ('Employee_Number_History', 'position_id')),
+    'D_Numbers': (DNumbers, 'd_numbers', None),
+    'System_IDs': (System_IDs, 'system_ids', None),
+    'Cards': (Cards, 'cards', None),
+    'User_Departments': (UserDepartment, 'departments', None),
+    'Departments': (Departments, None, ('User_Departments', 'department_id')),
+}
+
+# IN (...) に一度に渡す値の数
+IN_CHUNK_SIZE = 1000
+
+def _constant(values, arg):
+    return pd.Series(arg, index=values.index, dtype=object)
+
+
+def _date(values, arg):
+    """
+    日付を arg の書式（省略時は %Y/%m/%d）の文字列にします。NULL は空文字にします。
+
+    >>> _date(pd.Series([datetime.date(2024, 4, 1), None]), '%Y%m%d').tolist()
+    ['20240401', '']
+    """
+    return pd.to_datetime(values).dt.strftime(arg or '%Y/%m/%d').fillna('')
+
+
+def _text(values):
+    """
+    .str を使う変換の前に、NULL 以外の値を文字列にします（NULL は None）。
+    整数の列は NULL を含むと float で読み込まれるため、整数の表記にそろえます。
+
+    >>> _text(pd.Series([1.0, None, 12.0])).str.zfill(3).tolist()
+    ['001', None, '012']
+    """
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype('Int64')
+    return values.astype(str).where(values.notna(), None)
+
+
+# 変換処理: 名前 → func(Series, 引数)。引数は 'date:%Y%m%d' のように ':' の後に書く
+TRANSFORMS = {
+    'family_name': lambda values, arg: _text(values).str.split(n=1).str[0],  # 最初の空白より前
+    'given_name': lambda values, arg: _text(values).str.split(n=1).str[1],   # 最初の空白より後
+    'halfwidth_kana': lambda values, arg: _text(values).str.translate(KANA_Z2H_TABLE),
+    'ascii': lambda values, arg: _text(values).str.translate(FULLWIDTH_ALNUM_TABLE),
+    'nfkc': lambda values, arg: _text(values).str.normalize('NFKC'),
+    'date': _date,
+    'zfill': lambda values, arg: _text(values).str.zfill(int(arg)),
+    'flag': lambda values, arg: values.map({True: '1', False: '0'}),
+    'default': lambda values, arg: values.fillna(arg),
+    'const': _constant,
+}
+
+
+class ExportColumn:
+    def __init__(self, name, source, steps):
+        self.name = name      # 出力ファイルでの列名
+        self.source = source  # SELECT 文のラベル（取得元がない場合は None）
+        self.steps = steps    # [(変換の名前, 関数, 引数), ...]
+
+    def apply(self, frame):
+        """変換後の列を返します。変換処理が値に適用できない場合は列名を示す ValueError。"""
+        values = frame[self.source] if self.source else pd.Series(None, index=frame.index, dtype=object)
+        for name, func, arg in self.steps:
+            try:
+                values = func(values, arg)
+            except (AttributeError, TypeError, ValueError) as e:
+                step = name if arg is None else f'{name}:{arg}'
+                raise ValueError(f"{self.name} 列に変換処理 {step} を適用できません: {e}") from None
+        return values
+
+
+class ExportPlan:
+    """1つの外部システムの出力設定をコンパイルしたもの"""
+
+    def __init__(self, system_id, system_name, encoding, stmt, labels, columns, tables):
+        self.system_id = system_id
+        self.system_name = system_name
+        self.encoding = encoding
+        self.stmt = stmt        # 取得元の列（と _user_id）を返す SELECT 文
+        self.labels = labels    # stmt の列ラベルの順
+        self.columns = columns  # ExportColumn のリスト（出力の列順）
+        self.tables = tables    # stmt が結合するテーブル名の set
+
+    @property
+    def headers(self):
+        return [column.name for column in self.columns]
+
+    def describe(self):
+        """設定の内容（列ごとの取得元・変換処理）を文字列で返します。"""
+        lines = [f"{self.system_name} (system_id={self.system_id}, {self.encoding})"]
+        for column in self.columns:
+            steps = ' | '.join(name if arg is None else f'{name}:{arg}' for name, _, arg in column.steps)
+            lines.append(f"  {column.name}: {column.source or '-'}{' -> ' + steps if steps else ''}")
+        return '\n'.join(lines)
+
+
+def parse_transform(spec):
+    """'family_name|halfwidth_kana' のような変換処理を [(名前, 関数, 引数), ...] に変換します。"""
+    steps = []
+    for part in (spec or '').split('|'):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition(':')
+        if name not in TRANSFORMS:
+            raise ValueError(f"変換処理には {' / '.join(TRANSFORMS)} を指定してください: {name}")
+        steps.append((name, TRANSFORMS[name], arg if _ else None))
+    return steps
+
+
+def _source_columns(tables):
+    """tables（と結合元）だけを User に外部結合した FROM 句と、{テーブル名: 列のコレクション} を返します。"""
+    needed = set(tables)
+    for table in tables:
+        parent = SOURCE_TABLES[table][2]
+        if parent:
+            needed.add(parent[0])
+
+    current = current_subqueries()
+    from_clause = User.__table__
+    columns = {'Users': User.__table__.c}
+    for table, (model, current_key, parent) in SOURCE_TABLES.items():
+        if table not in needed or table == 'Users':
+            continue
+        if current_key:
+            source = current[current_key]
+            condition = source.c.user_id == User.user_id
+        else:
+            source = model.__table__
+            parent_table, key = parent
+            condition = source.c[key] == columns[parent_table][key]
+        from_clause = from_clause.outerjoin(source, condition)
+        columns[table] = source.c
+    return from_clause, columns
+
+
+def compile_plan(system, settings):
+    """外部システムと出力設定（export_setting_id の順）から ExportPlan を作ります。設定の誤りは ValueError。"""
+    if system.file_encoding not in ENCODINGS:
+        raise ValueError(f"{system.system_name}: 対応していない文字コードです: {system.file_encoding}")
+    if not settings:
+        raise ValueError(f"{system.system_name}: 出力設定がありません。")
+
+    sources = []
+    for setting in settings:
+        if setting.table_name:
+            if setting.table_name not in SOURCE_TABLES:
+                raise ValueError(f"出力できないテーブルです: {setting.table_name}")
+            model = SOURCE_TABLES[setting.table_name][0]
+            if setting.column_name not in model.__table__.c:
+                raise ValueError(f"{setting.table_name} に {setting.column_name} 列はありません。")
+            sources.append((setting.table_name, setting.column_name))
+    sources = list(dict.fromkeys(sources))
+    from_clause, table_columns = _source_columns({table for table, _ in sources})
+
+    labels = {source: f'{source[0]}__{source[1]}' for source in sources}
+    stmt = (
+        select(User.user_id.label('_user_id'),
+               *[table_columns[table][column].label(labels[(table, column)]) for table, column in sources])
+        .select_from(from_clause)
+        .order_by(User.user_id)
+    )
+
+    columns, names = [], set()
+    for setting in settings:
+        name = setting.transform_id or setting.column_name
+        if not name or name in names:
+            raise ValueError(f"出力の列名が空か重複しています: {name} (export_setting_id={setting.export_setting_id})")
+        names.add(name)
+        source = labels[(setting.table_name, setting.column_name)] if setting.table_name else None
+        columns.append(ExportColumn(name, source, parse_transform(setting.transform)))
+
+    return ExportPlan(system.system_id, system.system_name, system.file_encoding, stmt,
+                      ['_user_id'] + list(labels.values()), columns, set(table_columns))
+
+
+def find_system(session, value):
+    """system_id（数字）か外部システム名から External_Systems を返します。見つからない場合は ValueError。"""
+    stmt = select(External_Systems)
+    if str(value).isdigit():
+        stmt = stmt.where(External_Systems.system_id == int(value))
+    else:
+        stmt = stmt.where(External_Systems.system_name == value)
+    system = session.execute(stmt).scalars().first()
+    if system is None:
+        raise ValueError(f"外部システムが見つかりません: {value}")
+    return system
+
+
+class ExportPlanCache:
+    """
+    system_id ごとの ExportPlan。出力設定（External_System_Exports）の Change_Log の記録か、
+    外部システムの名前・文字コードが変わったらコンパイルし直します。
+    差分出力のたびに更新される External_Systems.exported_change_id では破棄しません。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._plans = {}  # {system_id: (キー, ExportPlan)}
+        self.compiles = 0
+        self.hits = 0
+
+    def get(self, session, system):
+        key = (roster_version(session, [External_System_Exports]).etag, system.system_name, system.file_encoding)
+        with self._lock:
+            cached = self._plans.get(system.system_id)
+            if cached is not None and cached[0] == key:
+                self.hits += 1
+                return cached[1]
+
+        settings = session.execute(
+            select(External_System_Exports)
+            .where(External_System_Exports.system_id == system.system_id)
+            .order_by(External_System_Exports.export_setting_id)
+        ).scalars().all()
+        plan = compile_plan(system, settings)
+        with self._lock:
+            self._plans[system.system_id] = (key, plan)
+            self.compiles += 1
+        return plan
+
+
+export_plans = ExportPlanCache()
+
+
+def load_plan(session, system):
+    """外部システムの ExportPlan を返します（出力設定が変わるまで export_plans から返す）。"""
+    return export_plans.get(session, system)
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def iter_export_frames(session, plan, batch_size=1000, user_ids=None):
+    """
+    plan の SELECT 文を batch_size 行ずつ読み込み、変換後の DataFrame（列は plan.headers、インデックスは user_id）を順に返します。
+    user_ids を指定すると、その職員だけを IN_CHUNK_SIZE 件ずつ読み込みます。
+    """
+    if user_ids is None:
+        results = [session.execute(plan.stmt.execution_options(yield_per=batch_size))]
+    else:
+        results = (session.execute(plan.stmt.where(User.user_id.in_(chunk)))
+                   for chunk in _chunks(sorted(user_ids)))
+    for result in results:
+        for rows in result.partitions(batch_size):
+            frame = pd.DataFrame.from_records(rows, columns=plan.labels)
+            out = pd.DataFrame({column.name: column.apply(frame) for column in plan.columns}, dtype=object)
+            out.index = frame['_user_id']
+            yield out
+
+
+class CsvFrameWriter:
+    """
+    DataFrame を pandas の to_csv で stream（バイナリ）に書き出します。1行ずつ辞書にする iter_csv より速く、
+    見出し・改行（CRLF）・BOM と、cp932 で表せない文字があれば行番号と列名を示す ValueError にするのは iter_csv と同じです。
+    """
+
+    def __init__(self, stream, headers, encoding):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"対応していない文字コードです: {encoding}")
+        self.stream = stream
+        self.headers = headers
+        self.encoding = encoding
+        self.codec = 'utf-8' if encoding == 'utf-8-sig' else encoding
+        self.count = 0
+        self._started = False
+        if encoding == 'utf-8-sig':
+            stream.write(b'\xef\xbb\xbf')
+
+    def write(self, frame):
+        text = frame.to_csv(index=False, header=not self._started, lineterminator='\r\n')
+        try:
+            data = text.encode(self.codec)
+        except UnicodeEncodeError:
+            raise unencodable_error(frame.to_dict('records'), list(frame.columns), self.encoding,
+                                    self.count + 1) from None
+        self.stream.write(data)
+        self._started = True
+        self.count += len(frame)
+
+    def close(self):
+        # 0件でも見出しは書く
+        if not self._started:
+            self.write(pd.DataFrame(columns=self.headers))
+
+
+def write_export_csv(session, plan, stream, encoding=None, batch_size=5000):
+    """外部システムの文字コード（encoding で上書き可）の全件の CSV を stream に書き出し、件数を返します。"""
+    writer = CsvFrameWriter(stream, plan.headers, encoding or plan.encoding)
+    for frame in iter_export_frames(session, plan, batch_size):
+        writer.write(frame)
+    writer.close()
+    return writer.count
+
+
+# --------------------
+# 差分出力
+# --------------------
+# 外部システムごとに「前回出力した時点の Change_Log の change_id」（External_Systems.exported_change_id）と
+# 出力した行の内容のハッシュ（External_System_Export_Rows）を保存し、次回は
+#   1. 前回以降に Change_Log に記録された変更・削除の user_id だけを読み込んで変換し
+#   2. ハッシュが保存されていない行を insert、異なる行を update、出力対象から消えた職員を delete
+# として、先頭の op 列に変更区分を付けて出力します。
+# 職位・部署などのマスターや出力設定が変わった場合は全員を読み込みます（出力は変わった行だけ）。
+# --full は保存した状態を使わず、全員を insert として出力し直します（消えた職員は delete）。
+
+OP_COLUMN = 'op'
+
+# 差分の対象の職員を探すテーブル（user_id を持つ）と、変わると全員を読み込むマスター
+_USER_TABLES = {
+    'Users': User, 'Employee_Number_History': EmployeeNumberHistory, 'D_Numbers': DNumbers,
+    'System_IDs': System_IDs, 'Cards': Cards, 'User_Departments': UserDepartment,
+}
+_MASTER_TABLES = {'Positions': Positions, 'Departments': Departments}
+
+
+def row_hashes(frame):
+    """変換後の行の内容のハッシュ（16桁の16進数）を返します。"""
+    return pd.util.hash_pandas_object(frame, index=False).map('{:016x}'.format)
+
+
+def changed_user_ids(session, plan, after, upto):
+    """
+    plan が使うテーブルで after < change_id <= upto の間に変更・削除された行の user_id の set を返します。
+    マスターか出力設定が変更されていた場合は None（全員）を返します。
+    """
+    masters = [name for name in _MASTER_TABLES if name in plan.tables]
+    if has_changes(session, after, upto, masters + [External_System_Exports.__tablename__]):
+        return None
+    tables = [name for name in _USER_TABLES if name in plan.tables or name == 'Users']
+    return logged_user_ids(session, after, upto, tables)
+
+
+class DeltaState:
+    """差分出力の結果。save_delta_state() で保存すると次回の差分の基準になります。"""
+
+    def __init__(self, system_id, change_id, full, user_ids):
+        self.system_id = system_id
+        self.change_id = change_id
+        self.full = full          # 保存済みの行をすべて置き換えるかどうか
+        self.user_ids = user_ids  # 読み込んだ職員（None は全員）
+        self.rows = {}            # 出力した職員 {user_id: (row_hash, key_value)}
+        self.retired = set()      # delete として出力した職員
+        self.evaluated = 0
+        self.inserted = 0
+        self.updated = 0
+
+
+def _stored_rows(session, system_id, user_ids=None):
+    stmt = (select(External_System_Export_Rows.user_id, External_System_Export_Rows.row_hash,
+                   External_System_Export_Rows.key_value)
+            .where(External_System_Export_Rows.system_id == system_id))
+    if user_ids is None:
+        rows = session.execute(stmt).all()
+    else:
+        rows = [row for chunk in _chunks(user_ids)
+                for row in session.execute(stmt.where(External_System_Export_Rows.user_id.in_(chunk)))]
+    return {user_id: (row_hash, key_value) for user_id, row_hash, key_value in rows}
+
+
+def write_delta_csv(session, system, plan, stream, encoding=None, full=False, batch_size=5000):
+    """
+    前回の差分出力以降に追加・変更・削除された行だけを、先頭に op 列（insert / update / delete）を付けて
+    stream に書き出し、DeltaState を返します。delete の行は先頭列（前回出力した値）だけを埋めます。
+    """
+    change_id = latest_change_id(session)
+    user_ids = None
+    if not full and system.exported_change_id is not None:
+        user_ids = changed_user_ids(session, plan, system.exported_change_id, change_id)
+
+    state = DeltaState(system.system_id, change_id, full, user_ids)
+    stored = _stored_rows(session, system.system_id, user_ids)
+    previous = pd.Series({user_id: row_hash for user_id, (row_hash, _) in stored.items()}, dtype=object)
+    writer = CsvFrameWriter(stream, [OP_COLUMN] + plan.headers, encoding or plan.encoding)
+    seen = set()
+
+    for frame in iter_export_frames(session, plan, batch_size, user_ids):
+        hashes = row_hashes(frame)
+        before = previous.reindex(frame.index)
+        if full:
+            ops = pd.Series('insert', index=frame.index)
+        else:
+            ops = pd.Series(np.where(before.isna(), 'insert', np.where(before != hashes, 'update', '')),
+                            index=frame.index)
+        changed = (ops != '').to_numpy()
+        seen.update(frame.index)
+        state.evaluated += len(frame)
+        if not changed.any():
+            continue
+        out = frame[changed]
+        out.insert(0, OP_COLUMN, ops[changed])
+        writer.write(out)
+        keys = out.iloc[:, 1]
+        state.rows.update(zip(out.index, zip(hashes[changed], keys.where(keys.notna(), None))))
+        state.inserted += int((ops[changed] == 'insert').sum())
+        state.updated += int((ops[changed] == 'update').sum())
+
+    candidates = stored.keys() if user_ids is None else user_ids & stored.keys()
+    state.retired = set(candidates) - seen
+    if state.retired:
+        retired = sorted(state.retired)
+        deleted = pd.DataFrame({name: None for name in plan.headers}, index=retired, dtype=object)
+        deleted.iloc[:, 0] = [stored[user_id][1] for user_id in retired]
+        deleted.insert(0, OP_COLUMN, 'delete')
+        writer.write(deleted)
+    writer.close()
+    return state
+
+
+def write_delta_file(session, system, plan, path, encoding=None, full=False, batch_size=5000):
+    """
+    差分出力を path に書き出し、DeltaState を返します。
+    一時ファイル（path + '.tmp'）に書き出して save_delta_state() でコミットしてから path に置き換えるため、
+    途中で失敗した場合は path も次回の差分の基準も変わりません。
+    """
+    temp_path = f'{path}.tmp'
+    try:
+        with open(temp_path, 'wb') as stream:
+            state = write_delta_csv(session, system, plan, stream, encoding, full, batch_size)
+        session.rollback()
+        save_delta_state(session, state)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    # コミット後に置き換えに失敗した場合は、一時ファイルに今回の差分が残る
+    os.replace(temp_path, path)
+    return state
+
+
+def save_delta_state(session, state):
+    """出力済みの行のハッシュと exported_change_id を保存してコミットします（出力が成功した後に呼ぶ）。"""
+    rows = External_System_Export_Rows
+    if state.full:
+        session.execute(delete(rows).where(rows.system_id == state.system_id))
+    else:
+        for chunk in _chunks(list(state.rows) + list(state.retired)):
+            session.execute(delete(rows).where(rows.system_id == state.system_id, rows.user_id.in_(chunk)))
+    records = [
+        {'system_id': state.system_id, 'user_id': user_id, 'row_hash': row_hash,
+         'key_value': None if key is None else str(key)[:255]}
+        for user_id, (row_hash, key) in state.rows.items()
+    ]
+    for chunk in _chunks(records):
+        session.execute(insert(rows), chunk)
+    session.execute(
+        update(External_Systems).where(External_Systems.system_id == state.system_id)
+        .values(exported_change_id=state.change_id)
+    )
+    session.commit()
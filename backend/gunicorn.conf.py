@@ -0,0 +1,81 @@
+"""
+gunicorn の設定（本番用）
+
+    gunicorn -c gunicorn.conf.py
+
+環境変数:
+    GUNICORN_BIND       待ち受けアドレス（既定 0.0.0.0:5000）
+    GUNICORN_WORKERS    ワーカープロセス数（既定 CPU数 * 2 + 1）
+    GUNICORN_THREADS    ワーカーあたりのスレッド数（既定 4）
+    GUNICORN_TIMEOUT    応答のないワーカーを再起動するまでの秒数（既定 60）
+    GUNICORN_PRELOAD    1 ならマスタープロセスでアプリを読み込んでから fork する（既定 1）
+    GUNICORN_MAX_REQUESTS  この件数を処理したワーカーを入れ替える（既定 2000, 0 で無効）
+
+再起動:
+    kill -HUP <master pid>
+        ワーカーを順に入れ替えます（処理中のリクエストは graceful_timeout まで待つ）。
+        preload 有効時はマスターが読み込んだコードを引き継ぐため、コードの更新は反映されません。
+    kill -USR2 <master pid> → 新しいマスターの起動を確認後 kill -TERM <旧 master pid>
+        コードを更新したときの無停止入れ替え。
+"""
+import multiprocessing
+import os
+
+# このディレクトリ（backend）をパッケージとして読み込む
+# （コンテナでは /app、リポジトリでは backend。app.py が相対インポートを使うため）
+_here = os.path.dirname(os.path.abspath(__file__))
+_package = os.path.basename(_here)
+pythonpath = os.path.dirname(_here)
+wsgi_app = f"{_package}.app:app"
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# create_app() と索引の読み込み（when_ready）をマスターで1回だけ行い、ワーカーは fork で共有する
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# メモリの断片化対策として一定件数ごとにワーカーを入れ替える（同時に入れ替わらないようずらす）
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def _preload_indexes(flask_app):
+    from importlib import import_module
+    import_module(_package).preload_indexes(flask_app)
+
+
+def when_ready(server):
+    """preload 時は、ワーカーを fork する前にマスターでカード索引・職員検索の索引を読み込みます。"""
+    if preload_app:
+        _preload_indexes(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    """preload しない場合は、ワーカーごとにアプリを読み込んだ後で索引を読み込みます。"""
+    if not preload_app:
+        _preload_indexes(worker.app.wsgi())
+
+
+def post_fork(server, worker):
+    """
+    preload したマスターの DB 接続をワーカーで使い回さないよう、接続プールを作り直します
+    （同じソケットを複数プロセスで共有すると応答が混ざるため）。
+    """
+    if not preload_app:
+        return
+    from importlib import import_module
+    db = import_module(f"{_package}.extensions").db
+    flask_app = worker.app.wsgi()
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
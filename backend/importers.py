@@ -0,0 +1,577 @@
+import multiprocessing
+import queue
+import resource
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from sqlalchemy import insert, select, update, func, and_, or_
+from sqlalchemy.exc import SQLAlchemyError
+from .extensions import db
+from .models import User, EmployeeNumberHistory, DNumbers, UserDepartment, Cards
+
+# --------------------
+# CSV のチャンク読み込み
+# --------------------
+# CSV は read_csv(chunksize=...) で chunk_size 行ずつ読み込み、チャンク単位で
+# 検証・書き込みを行います。ファイル全体を DataFrame に載せないため、
+# メモリ使用量はファイルサイズではなくチャンクサイズで決まります。
+
+
+def read_csv_chunks(csv_file, chunk_size, **kwargs):
+    """pd.read_csv の引数を受け取り、chunk_size 行ずつの DataFrame を順に返します。"""
+    with pd.read_csv(csv_file, chunksize=chunk_size, **kwargs) as reader:
+        yield from reader
+
+
+def peak_memory_mb():
+    """プロセスの最大常駐メモリ (MB)。Linux の ru_maxrss は KB 単位です。"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+
+class ImportStats:
+    """インポート処理の件数と所要時間を集計します。"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []  # (CSVの行番号, 説明)
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    def merge(self, other):
+        """別スレッドで集計した件数を取り込みます（read は取り込みません）。"""
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.skipped += other.skipped
+        self.errors.extend(other.errors)
+
+    def report_throughput(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.read / elapsed if elapsed > 0 else 0
+        print(f"所要時間: {elapsed:.2f}秒 ({rate:,.0f}行/秒) / 最大メモリ使用量: {peak_memory_mb():,.1f} MB")
+
+    def report(self):
+        print("---")
+        print(f"処理件数: {self.read}件 (追加 {self.inserted}件 / 更新 {self.updated}件 / "
+              f"スキップ {self.skipped}件 / エラー {len(self.errors)}件)")
+        self.report_throughput()
+        for line, message in sorted(self.errors):
+            print(f"  エラー: {line}行目: {message}")
+
+
+# --------------------
+# 一括インポート（import-data --bulk）
+# --------------------
+# 行ごとに SELECT / INSERT / COMMIT を繰り返す代わりに、チャンクごとに
+#   1. チャンク内の職員番号のうち登録済みのものを1回の IN クエリで取得
+#   2. pandas の列演算で全テーブル分のレコードを組み立て
+#   3. executemany で INSERT（全チャンクで1トランザクション）
+# という流れで取り込みます。チャンクごとにセーブポイントを張り、
+# 失敗したチャンクだけを1行ずつ再実行して不正な行を特定します。
+
+
+def _to_date(series):
+    """日付文字列の列を date に変換します。解釈できない値は NaT になります。"""
+    return pd.to_datetime(series, errors='coerce').dt.date
+
+
+def frame_records(frame):
+    """NaN / NaT を None に置き換えたレコードのリストを返します。"""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+# --------------------
+# 職員番号のキー
+# --------------------
+# 職員番号は CSV の表記のまま（文字列として読み、前後の空白だけを除いて）登録・照合します。
+# 一括・並列・1行ずつのどのモードでも normalize_employee_numbers() で同じキーにそろえます。
+#
+# 以前の import-data は read_csv の型推論で職員番号を数値として読んでいたため、登録済みの行には
+# 「00123」が「123」（欠損を含む列では「123.0」）として残っている場合があります。
+# 先頭の 0 は元に戻せないため既存の行は書き換えず、重複チェックではこれらの表記も登録済みとみなします。
+
+
+def normalize_employee_numbers(values):
+    """
+    職員番号の列を登録・照合に使うキーにそろえます（欠損は NaN のまま）。
+
+    >>> normalize_employee_numbers(pd.Series([' 00123 ', '456', None])).tolist()
+    ['00123', '456', nan]
+    """
+    return values.astype(str).str.strip().where(values.notna())
+
+
+def legacy_employee_numbers(number):
+    """
+    型推論で取り込まれていた頃に number が登録されたときの表記（number 自身は含まない）を返します。
+
+    >>> sorted(legacy_employee_numbers('00123'))
+    ['123', '123.0']
+    >>> sorted(legacy_employee_numbers('123'))
+    ['123.0']
+    >>> legacy_employee_numbers('A0123')
+    set()
+    """
+    if not number.isascii() or not number.isdigit():
+        return set()
+    value = int(number)
+    return {str(value), f'{value}.0'} - {number}
+
+
+def existing_employee_numbers(numbers=None):
+    """
+    登録済みの職員番号を set で返します。
+    numbers を渡した場合はそれらのうち登録済みのもの（以前の表記で登録されているものを含む）だけを
+    1回の IN クエリで調べ、numbers の表記で返します。
+    """
+    stmt = select(EmployeeNumberHistory.employee_number).distinct()
+    if numbers is None:
+        return set(db.session.execute(stmt).scalars())
+
+    candidates = {}  # {DB での表記: numbers の表記}
+    for number in numbers:
+        for legacy in legacy_employee_numbers(number):
+            candidates.setdefault(legacy, number)
+        candidates[number] = number
+    if not candidates:
+        return set()
+    stmt = stmt.where(EmployeeNumberHistory.employee_number.in_(list(candidates)))
+    return {candidates[found] for found in db.session.execute(stmt).scalars()}
+
+
+def validate_staff(df, first_line=2):
+    """
+    import-data 形式の DataFrame を検証し、登録用の列を揃えた DataFrame と
+    エラーのリスト [(CSVの行番号, 説明), ...] を返します。
+
+    DB を参照しないため、並列インポートではプロセスプール上で実行されます。
+    職員番号・職位IDの欠損や、解釈できない日付・ID の行はエラーとして除外します。
+    """
+    frame = pd.DataFrame({
+        'line': range(first_line, first_line + len(df)),
+        'name': df['name'].values,
+        # 氏名（カナ）は任意の列
+        'name_kana': df['name_kana'].values if 'name_kana' in df.columns else None,
+        'employee_number': normalize_employee_numbers(df['employee_number']).values,
+        'birthday': _to_date(df['Birthday']).values,
+        'hire_date': _to_date(df['hire_date']).values,
+        'position_id': pd.to_numeric(df['position_id'], errors='coerce').values,
+        'department_id': pd.to_numeric(df['department_id'], errors='coerce').values,
+        'd_number': df['d_number'].astype(str).where(df['d_number'].notna()).values,
+    })
+
+    invalid = (
+        # 空白だけの職員番号は strip すると空文字になるため、欠損と同じく不正とする
+        frame['employee_number'].isna() | (frame['employee_number'] == '')
+        | frame['position_id'].isna()
+        | (df['Birthday'].notna().values & frame['birthday'].isna())
+        | (df['hire_date'].notna().values & frame['hire_date'].isna())
+        | (df['department_id'].notna().values & frame['department_id'].isna())
+    )
+    errors = [(int(line), "職員番号・職位ID・日付・部署IDのいずれかが不正です。")
+              for line in frame.loc[invalid, 'line']]
+    frame = frame[~invalid].copy()
+
+    frame['user_id'] = [str(uuid.uuid4()) for _ in range(len(frame))]
+    frame['position_id'] = frame['position_id'].astype('Int64')
+    frame['department_id'] = frame['department_id'].astype('Int64')
+    return frame, errors
+
+
+def deduplicate_staff(frame, existing, stats):
+    """
+    職員番号が既存 / ファイル内で重複している行をスキップします。
+    existing には残した行の職員番号を追加します。
+    """
+    duplicated = frame['employee_number'].isin(existing) | frame['employee_number'].duplicated()
+    stats.skipped += int(duplicated.sum())
+    frame = frame[~duplicated]
+    existing.update(frame['employee_number'])
+    return frame
+
+
+def prepare_staff(df, existing, stats, first_line=2):
+    """validate_staff() と deduplicate_staff() をまとめて実行します。"""
+    frame, errors = validate_staff(df, first_line)
+    stats.read += len(df)
+    for line, message in errors:
+        stats.error(line, message)
+    return deduplicate_staff(frame, existing, stats)
+
+
+def staff_records(frame):
+    """prepare_staff() の結果から各テーブルの INSERT 用レコードを組み立てます。"""
+    users = frame[['user_id', 'name', 'name_kana', 'birthday', 'hire_date']]
+    histories = frame[['user_id', 'employee_number', 'position_id', 'hire_date']] \
+        .rename(columns={'hire_date': 'start_date'})
+    d_numbers = frame.loc[frame['d_number'].notna(), ['user_id', 'd_number']].assign(is_active=True)
+    departments = frame.loc[frame['department_id'].notna(), ['user_id', 'department_id']]
+    return [
+        (User, frame_records(users)),
+        (EmployeeNumberHistory, frame_records(histories)),
+        (DNumbers, frame_records(d_numbers)),
+        (UserDepartment, frame_records(departments)),
+    ]
+
+
+def _insert_records(records):
+    for model, rows in records:
+        if rows:
+            db.session.execute(insert(model), rows)
+
+
+def insert_staff(frame, stats):
+    """
+    1チャンク分をセーブポイント内で INSERT します。
+    チャンクが失敗した場合は1行ずつ再実行し、失敗した行だけをエラーとして記録します。
+    """
+    if frame.empty:
+        return
+    try:
+        with db.session.begin_nested():
+            _insert_records(staff_records(frame))
+        stats.inserted += len(frame)
+        return
+    except SQLAlchemyError:
+        pass
+
+    for position in range(len(frame)):
+        row = frame.iloc[position:position + 1]
+        try:
+            with db.session.begin_nested():
+                _insert_records(staff_records(row))
+            stats.inserted += 1
+        except SQLAlchemyError as e:
+            stats.error(int(row['line'].iloc[0]), str(e.orig if hasattr(e, 'orig') else e))
+
+
+def bulk_import_staff(chunks):
+    """
+    import-data 形式の DataFrame のチャンクを順に取り込み、集計結果を返します。
+    全チャンクを1トランザクションで処理し、最後に1回だけコミットします。
+    """
+    stats = ImportStats()
+    # このインポート中に登録済み / 登録した職員番号（ファイル内の重複検出用）
+    seen = set()
+    first_line = 2
+    try:
+        for chunk in chunks:
+            numbers = normalize_employee_numbers(chunk['employee_number']).dropna().unique()
+            seen.update(existing_employee_numbers(numbers))
+            frame = prepare_staff(chunk, seen, stats, first_line=first_line)
+            insert_staff(frame, stats)
+            first_line += len(chunk)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return stats
+
+
+# --------------------
+# 並列インポート（import-data --workers N --writers M）
+# --------------------
+# 1. メインスレッドが CSV をチャンクで読み、検証・変換（validate_staff）をプロセスプールに投入
+# 2. 結果を投入順に受け取り、職員番号の重複除外（DB参照）をメインスレッドで実行
+# 3. 上限付きキューを介して、それぞれ専用のセッションを持つ書き込みスレッドが INSERT
+# 投入中のチャンク数とキューの長さに上限があるため、メモリ使用量は一定に保たれます。
+# エラーは最後に行番号順で出力するため、並列度に関わらず同じ結果になります。
+
+
+def _writer(app, batches, stats, lock):
+    """キューから受け取ったチャンクを書き込み、チャンクごとにコミットします。"""
+    local = ImportStats()
+    with app.app_context():
+        while True:
+            frame = batches.get()
+            if frame is None:
+                break
+            try:
+                insert_staff(frame, local)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                for line in frame['line']:
+                    local.error(int(line), f"書き込みに失敗しました: {e}")
+        db.session.remove()
+    with lock:
+        stats.merge(local)
+
+
+def parallel_import_staff(app, chunks, workers=4, writers=2):
+    """
+    import-data 形式の DataFrame のチャンクを並列に取り込み、集計結果を返します。
+    チャンクごとにコミットするため、途中で失敗しても書き込み済みのチャンクは残ります。
+    """
+    stats = ImportStats()
+    lock = threading.Lock()
+    batches = queue.Queue(maxsize=writers * 2)
+    threads = [
+        threading.Thread(target=_writer, args=(app, batches, stats, lock), daemon=True)
+        for _ in range(writers)
+    ]
+
+    seen = set()
+    max_pending = workers * 2
+    # 書き込みスレッドの起動後に fork しないよう spawn でワーカーを起動する
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            for thread in threads:
+                thread.start()
+
+            pending = deque()
+            first_line = 2
+
+            def drain_one():
+                future, chunk_rows = pending.popleft()
+                frame, errors = future.result()
+                stats.read += chunk_rows
+                for line, message in errors:
+                    stats.error(line, message)
+                numbers = frame['employee_number'].unique()
+                seen.update(existing_employee_numbers(numbers))
+                frame = deduplicate_staff(frame, seen, stats)
+                if not frame.empty:
+                    batches.put(frame)
+
+            for chunk in chunks:
+                pending.append((pool.submit(validate_staff, chunk, first_line), len(chunk)))
+                first_line += len(chunk)
+                if len(pending) >= max_pending:
+                    drain_one()
+            while pending:
+                drain_one()
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+        db.session.rollback()
+    return stats
+
+
+# --------------------
+# マスターデータの UPSERT（import-positions / import-departments / import-cards --upsert）
+# --------------------
+# チャンクごとに、そのキーの既存レコードを1回の IN クエリで読み込んで新規・変更・変更なしに分類し、
+# 新規と変更のある行だけを INSERT ... ON DUPLICATE KEY UPDATE の executemany で送ります。
+# updated_at は値が実際に変わった行だけ更新します。
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def load_current_values(model, key, columns, keys, chunk_size=1000):
+    """{キー: (columns の値, ...)} を返します。"""
+    key_column = getattr(model, key)
+    value_columns = [getattr(model, column) for column in columns]
+    current = {}
+    for chunk in _chunks(list(keys), chunk_size):
+        rows = db.session.execute(select(key_column, *value_columns).where(key_column.in_(chunk)))
+        for row in rows:
+            current[row[0]] = tuple(row[1:])
+    return current
+
+
+def upsert_statement(model, key, columns):
+    """
+    接続先の方言に合わせた UPSERT 文を返します。
+    本番の MySQL では INSERT ... ON DUPLICATE KEY UPDATE、
+    テスト・ベンチマーク用の SQLite では INSERT ... ON CONFLICT DO UPDATE を使います。
+    """
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        unchanged = and_(*[table.c[c].is_not_distinct_from(stmt.inserted[c]) for c in columns])
+        # MySQL は代入を左から順に評価するため、値を書き換える前に updated_at を判定する
+        assignments = [('updated_at', func.IF(unchanged, table.c.updated_at, func.now()))]
+        assignments += [(c, stmt.inserted[c]) for c in columns]
+        return stmt.on_duplicate_key_update(assignments)
+
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table)
+        changed = or_(*[table.c[c].is_distinct_from(stmt.excluded[c]) for c in columns])
+        values = {c: stmt.excluded[c] for c in columns}
+        values['updated_at'] = func.now()
+        return stmt.on_conflict_do_update(index_elements=[key], set_=values, where=changed)
+
+    raise ValueError(f"UPSERT に対応していないデータベースです: {dialect}")
+
+
+def upsert_records(model, records, key, columns, stats, insert_defaults=None):
+    """
+    1チャンク分の records（辞書のリスト）を model に UPSERT します（コミットはしません）。
+
+    insert_defaults は新規行にだけ意味を持つ値（開始日など）です。
+    executemany のため全行に同じキーを持たせますが、更新時は columns だけを書き換えます。
+    """
+    insert_defaults = insert_defaults or {}
+    stats.read += len(records)
+    current = load_current_values(model, key, columns, {r[key] for r in records})
+
+    pending = []
+    for record in records:
+        existing = current.get(record[key])
+        values = tuple(record[c] for c in columns)
+        if existing is None:
+            stats.inserted += 1
+        elif existing != values:
+            stats.updated += 1
+        else:
+            stats.skipped += 1
+            continue
+        # ファイル内で同じキーが複数回出てきた場合は後勝ち
+        current[record[key]] = values
+        pending.append({**insert_defaults, **record})
+
+    if pending:
+        db.session.execute(upsert_statement(model, key, columns), pending)
+
+
+def upsert_master(model, chunks, key, columns, insert_defaults=None):
+    """
+    DataFrame のチャンクを順に model へ UPSERT し、最後に1回だけコミットします。
+    """
+    stats = ImportStats()
+    try:
+        for df in chunks:
+            upsert_records(model, frame_records(df), key, columns, stats, insert_defaults)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return stats
+
+
+def upsert_cards(chunks):
+    """
+    import-cards 形式の DataFrame のチャンクを順に UPSERT します。
+
+    - card_uid / user_id が空の行、存在しない user_id の行はエラーとして記録
+    - カード管理IDが別のカードに登録済みの行もエラー
+      (card_management_id の一意インデックスで別の行が上書きされるのを防ぐ)
+    """
+    stats = ImportStats()
+    first_line = 2
+    try:
+        for df in chunks:
+            records = frame_records(df[['card_uid', 'user_id', 'card_management_id']])
+
+            user_ids = [r['user_id'] for r in records if r['user_id'] is not None]
+            known_users = set(db.session.execute(
+                select(User.user_id).where(User.user_id.in_(user_ids))
+            ).scalars())
+
+            management_ids = [r['card_management_id'] for r in records if r['card_management_id'] is not None]
+            owner_of = dict(db.session.execute(
+                select(Cards.card_management_id, Cards.card_uid)
+                .where(Cards.card_management_id.in_(management_ids))
+            ).all())
+
+            valid = []
+            for line, record in enumerate(records, start=first_line):
+                if record['card_uid'] is None or record['user_id'] is None:
+                    stats.read += 1
+                    stats.error(line, "card_uid または user_id が空です。")
+                elif record['user_id'] not in known_users:
+                    stats.read += 1
+                    stats.error(line, f"User ID {record['user_id']} が Users テーブルに見つかりません。")
+                elif owner_of.get(record['card_management_id'], record['card_uid']) != record['card_uid']:
+                    stats.read += 1
+                    stats.error(line, f"カード管理ID {record['card_management_id']} は別のカードに登録されています。")
+                else:
+                    valid.append(record)
+
+            upsert_records(Cards, valid, 'card_uid', ['user_id', 'card_management_id'], stats,
+                           insert_defaults={'is_active': True})
+            first_line += len(df)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return stats
+
+
+# --------------------
+# 氏名（カナ）の後埋め（backfill-name-kana）
+# --------------------
+# name_kana 列を追加する前に登録した職員はカナが空で、職員検索のカナ・ローマ字で見つからないため、
+# import-data と同じ CSV から職員番号で照合してカナを埋めます（import-data は登録済みの職員を読み飛ばす）。
+
+
+def backfill_name_kana(chunks, overwrite=False):
+    """
+    import-data 形式の DataFrame のチャンクから、登録済みの職員の name_kana を埋めます。
+
+    - 職員番号で照合します（以前の表記で登録されている職員番号を含む）
+    - overwrite でなければ、name_kana が空の職員だけを更新します
+    - 職員番号・カナが空の行、登録されていない職員番号の行はエラーとして記録
+    チャンクごとに1回の SELECT と UPDATE の executemany を行い、最後に1回だけコミットします。
+    """
+    stats = ImportStats()
+    first_line = 2
+    try:
+        for df in chunks:
+            if 'name_kana' not in df.columns:
+                raise ValueError("CSV に name_kana 列がありません。")
+            numbers = normalize_employee_numbers(df['employee_number'])
+            kana = df['name_kana'].astype(str).str.strip().where(df['name_kana'].notna())
+
+            wanted = {}  # {職員番号: (CSVの行番号, カナ)}（ファイル内で同じ職員番号が複数回出てきた場合は後勝ち）
+            for line, number, value in zip(range(first_line, first_line + len(df)), numbers, kana):
+                stats.read += 1
+                if pd.isna(number) or pd.isna(value) or not value:
+                    stats.error(line, "職員番号または name_kana が空です。")
+                else:
+                    wanted[number] = (line, value)
+            first_line += len(df)
+
+            candidates = {}  # {DB での表記: CSV の表記}
+            for number in wanted:
+                for legacy in legacy_employee_numbers(number):
+                    candidates.setdefault(legacy, number)
+                candidates[number] = number
+            found = {}  # {CSV の表記: (user_id, 現在のカナ)}
+            for chunk in _chunks(list(candidates), 1000):
+                rows = db.session.execute(
+                    select(EmployeeNumberHistory.employee_number, User.user_id, User.name_kana)
+                    .join(User, User.user_id == EmployeeNumberHistory.user_id)
+                    .where(EmployeeNumberHistory.employee_number.in_(chunk))
+                )
+                for employee_number, user_id, current in rows:
+                    found[candidates[employee_number]] = (user_id, current)
+
+            updates = {}
+            for number, (line, value) in wanted.items():
+                if number not in found:
+                    stats.error(line, f"職員番号 {number} の職員が見つかりません。")
+                    continue
+                user_id, current = found[number]
+                if current == value or (current and not overwrite):
+                    stats.skipped += 1
+                    continue
+                updates[user_id] = value
+            if updates:
+                db.session.execute(update(User), [{'user_id': user_id, 'name_kana': value}
+                                                  for user_id, value in updates.items()])
+                stats.updated += len(updates)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return stats
@@ -0,0 +1,240 @@
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# --------------------
+# リクエスト単位の計測（SQL 件数・DB 時間・N+1 検出）
+# --------------------
+# SQLALCHEMY_ECHO の代わりに、本番でも常時有効にできる軽量な計測を行います。
+#   - レスポンスヘッダー Server-Timing（ブラウザの開発者ツールで確認できる）
+#   - 1リクエスト1行の JSON ログ（ロガー backend.requests）
+#   - Prometheus 形式の /metrics
+# 計測はカーソル実行前後の時刻差と SQL 文字列の集計だけで、SQL の整形やパラメータの記録は行いません。
+# /metrics の値はプロセスごと（gunicorn ではワーカーごと）です。
+# ストリーミング応答は本文の送信前に集計するため、送信中に実行された SQL は含みません。
+
+logger = logging.getLogger('backend.requests')
+
+# リクエスト処理時間のヒストグラムの境界（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# IN (?, ?, ...) のプレースホルダーの数が違っても同じ形の SQL とみなす
+_IN_LIST = re.compile(r'IN \((?:[^()]*?,)*[^()]*?\)', re.IGNORECASE)
+
+
+def statement_shape(statement):
+    if ' IN (' in statement or ' in (' in statement:
+        statement = _IN_LIST.sub('IN (...)', statement)
+    return statement
+
+
+class RequestStats:
+    """1リクエスト分の SQL の集計"""
+
+    __slots__ = ('started', 'queries', 'db_seconds', 'shapes', 'slowest')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.shapes = Counter()
+        self.slowest = []  # [(秒, SQL), ...] を遅い順に最大 SQL_SLOWEST 件
+
+    def record(self, statement, elapsed, keep):
+        self.queries += 1
+        self.db_seconds += elapsed
+        self.shapes[statement] += 1
+        if len(self.slowest) < keep or elapsed > self.slowest[-1][0]:
+            self.slowest.append((elapsed, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[keep:]
+
+
+class Metrics:
+    """Prometheus 形式で出力するカウンター・ヒストグラム"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()            # (method, endpoint, status) -> 件数
+        self.durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))  # endpoint -> バケットごとの件数
+        self.duration_sum = Counter()        # endpoint -> 合計秒
+        self.db_queries = Counter()          # endpoint -> SQL 件数
+        self.db_seconds = Counter()          # endpoint -> DB 合計秒
+        self.n_plus_one = Counter()          # endpoint -> N+1 を検出したリクエスト数
+
+    def observe(self, method, endpoint, status, seconds, stats, n_plus_one):
+        with self._lock:
+            self.requests[(method, endpoint, status)] += 1
+            buckets = self.durations[endpoint]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self.duration_sum[endpoint] += seconds
+            self.db_queries[endpoint] += stats.queries
+            self.db_seconds[endpoint] += stats.db_seconds
+            if n_plus_one:
+                self.n_plus_one[endpoint] += 1
+
+    def render(self, gauges=()):
+        """Prometheus のテキスト形式で返します。gauges は (名前, 説明, {ラベル: 値} または値) のリスト。"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def labels(**values):
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in values.items()) + '}'
+
+        with self._lock:
+            family('staffdb_http_requests_total', 'counter', 'HTTP requests by endpoint and status.')
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f'staffdb_http_requests_total{labels(method=method, endpoint=endpoint, status=status)} {count}')
+
+            family('staffdb_http_request_duration_seconds', 'histogram', 'Request handling time.')
+            for endpoint, buckets in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    cumulative += count
+                    lines.append(f'staffdb_http_request_duration_seconds_bucket{labels(endpoint=endpoint, le=bound)} {cumulative}')
+                cumulative += buckets[-1]
+                lines.append(f'staffdb_http_request_duration_seconds_bucket{labels(endpoint=endpoint, le="+Inf")} {cumulative}')
+                lines.append(f'staffdb_http_request_duration_seconds_sum{labels(endpoint=endpoint)} {self.duration_sum[endpoint]:.6f}')
+                lines.append(f'staffdb_http_request_duration_seconds_count{labels(endpoint=endpoint)} {cumulative}')
+
+            family('staffdb_db_queries_total', 'counter', 'SQL statements executed while handling requests.')
+            for endpoint, count in sorted(self.db_queries.items()):
+                lines.append(f'staffdb_db_queries_total{labels(endpoint=endpoint)} {count}')
+
+            family('staffdb_db_seconds_total', 'counter', 'Time spent in SQL statements while handling requests.')
+            for endpoint, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'staffdb_db_seconds_total{labels(endpoint=endpoint)} {seconds:.6f}')
+
+            family('staffdb_n_plus_one_requests_total', 'counter', 'Requests that repeated one statement shape too often.')
+            for endpoint, count in sorted(self.n_plus_one.items()):
+                lines.append(f'staffdb_n_plus_one_requests_total{labels(endpoint=endpoint)} {count}')
+
+        for name, help_text, value in gauges:
+            family(name, 'gauge', help_text)
+            if isinstance(value, dict):
+                for label, v in sorted(value.items()):
+                    if v is not None:
+                        lines.append(f'{name}{labels(name=label)} {v}')
+            elif value is not None:
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+_engine_events_installed = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 開始時刻は文ごとの実行コンテキストに持たせる（失敗した文の分が接続に残らないように）
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_start', None)
+    if started is None or not has_request_context():
+        return
+    stats = g.get('sql_stats')
+    if stats is not None:
+        stats.record(statement_shape(statement), time.perf_counter() - started, g.sql_slowest)
+
+
+def _install_engine_events():
+    # Flask-SQLAlchemy はエンジンを遅延生成するため、Engine クラス全体に登録する
+    global _engine_events_installed
+    if _engine_events_installed:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _engine_events_installed = True
+
+
+def _configure_logger(level):
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
+
+
+def init_instrumentation(app, gauges=None):
+    """
+    app に計測を組み込み、/metrics を登録します。
+    gauges は /metrics に追加するゲージ [(名前, 説明, 値または {ラベル: 値}), ...] を返す関数です。
+    """
+    if not app.config.get('INSTRUMENTATION_ENABLED', True):
+        return
+    _install_engine_events()
+    _configure_logger(app.config.get('REQUEST_LOG_LEVEL', 'INFO'))
+
+    threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 10)
+    slowest = app.config.get('SQL_SLOWEST', 3)
+    slow_request = app.config.get('SLOW_REQUEST_MS', 500) / 1000
+
+    @app.before_request
+    def start_request_stats():
+        g.sql_stats = RequestStats()
+        g.sql_slowest = slowest
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unknown'
+        repeated = [(shape, count) for shape, count in stats.shapes.most_common() if count > threshold]
+
+        # Server-Timing: 開発者ツールのネットワークタブに DB 時間と件数が表示される
+        response.headers.add('Server-Timing', ', '.join([
+            f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+            f'app;dur={(elapsed - stats.db_seconds) * 1000:.1f}',
+            f'total;dur={elapsed * 1000:.1f}',
+        ]))
+
+        metrics.observe(request.method, endpoint, response.status_code, elapsed, stats, bool(repeated))
+
+        level = logging.WARNING if repeated or elapsed >= slow_request else logging.INFO
+        if not logger.isEnabledFor(level):
+            return response
+        record = {
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 1),
+            'queries': stats.queries,
+            'db_ms': round(stats.db_seconds * 1000, 1),
+        }
+        if level == logging.WARNING:
+            record['slowest'] = [{'ms': round(s * 1000, 1), 'sql': sql[:300]} for s, sql in stats.slowest]
+        if repeated:
+            record['n_plus_one'] = [{'count': count, 'sql': shape[:300]} for shape, count in repeated[:3]]
+        logger.log(level, json.dumps(record, ensure_ascii=False))
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        body = metrics.render(gauges() if gauges else ())
+        return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,50 @@
+"""Add Change_Log for the change feed and incremental refreshes
+
+Revision ID: 6c1e8f4a9d23
+Revises: 3d8f6b1e9a27
+Create Date: 2026-10-18 10:24:37.160832
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1e8f4a9d23'
+down_revision = '3d8f6b1e9a27'
+branch_labels = None
+depends_on = None
+
+# 変更フィードの対象（TimestampMixin を持つテーブル）
+FEED_TABLES = [
+    'Cards', 'D_Numbers', 'Department_Aliases', 'Departments', 'Employee_Number_History', 'External_System_Exports',
+    'External_Systems', 'Positions', 'System_IDs', 'User_Departments', 'Users',
+]
+
+
+def upgrade():
+    op.create_table('Change_Log',
+    sa.Column('change_id', sa.Integer(), autoincrement=True, nullable=False, comment='変更ID (PK)'),
+    sa.Column('op', sa.VARCHAR(length=10), nullable=False, comment='変更区分 (upsert / delete / invalidate)'),
+    sa.Column('table_name', sa.VARCHAR(length=64), nullable=False, comment='変更された行のテーブル名'),
+    sa.Column('row_key', sa.VARCHAR(length=512), nullable=True, comment='変更された行の主キー (JSON)。不明な場合は NULL（user_id の行すべて）'),
+    sa.Column('user_id', sa.VARCHAR(length=255), nullable=True, comment='変更された行の管理ID'),
+    sa.Column('changed_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False, comment='記録日時'),
+    sa.PrimaryKeyConstraint('change_id')
+    )
+    with op.batch_alter_table('Change_Log', schema=None) as batch_op:
+        batch_op.create_index('ix_Change_Log_table_name_change_id', ['table_name', 'change_id'], unique=False)
+        batch_op.create_index('ix_Change_Log_changed_at', ['changed_at'], unique=False)
+
+    # 既存の行には記録がないため、テーブルごとに基準の記録を1行入れる
+    # （職員一覧の ETag などのバージョンが、記録のないテーブルでも空にならないように。
+    #   変更フィードを最初から読む側には invalidate として全件の読み直しを伝える）
+    change_log = sa.table('Change_Log', sa.column('op', sa.VARCHAR), sa.column('table_name', sa.VARCHAR))
+    op.bulk_insert(change_log, [{'op': 'invalidate', 'table_name': name} for name in FEED_TABLES])
+
+
+def downgrade():
+    with op.batch_alter_table('Change_Log', schema=None) as batch_op:
+        batch_op.drop_index('ix_Change_Log_changed_at')
+        batch_op.drop_index('ix_Change_Log_table_name_change_id')
+    op.drop_table('Change_Log')
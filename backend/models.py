@@ -1,6 +1,6 @@
 from .extensions import db
 from sqlalchemy.sql import func
-from sqlalchemy import Column, Integer, String, DATE, TIMESTAMP, BOOLEAN, VARCHAR, ForeignKey, PrimaryKeyConstraint, text
+from sqlalchemy import Column, Integer, String, DATE, TIMESTAMP, BOOLEAN, VARCHAR, ForeignKey, PrimaryKeyConstraint, Index, text
 from sqlalchemy.orm import relationship
 
 # 共通のタイムスタンプカラム（ミックスイン）
@@ -14,8 +14,13 @@ class TimestampMixin:
 
 class User(TimestampMixin, db.Model):
     __tablename__ = 'Users'
+    __table_args__ = (
+        Index('ix_Users_hire_date_user_id', 'hire_date', 'user_id'), # 一覧の並び替え・キーセットページング
+        Index('ix_Users_name', 'name'), # 氏名の前方一致検索
+    )
     user_id = Column(VARCHAR(255), primary_key=True, comment="管理ID (PK)")
     name = Column(VARCHAR(255), comment="氏名")
+    name_kana = Column(VARCHAR(255), nullable=True, comment="氏名（カナ）")
     birthday = Column(DATE, comment="生年月日")
     hire_date = Column(DATE, comment="入職日")
     # personal_extension_number はER図から削除
@@ -44,6 +49,11 @@ class Positions(TimestampMixin, db.Model): # Position -> Positions
 
 class EmployeeNumberHistory(TimestampMixin, db.Model):
     __tablename__ = 'Employee_Number_History'
+    __table_args__ = (
+        Index('ix_Employee_Number_History_employee_number', 'employee_number'), # import-data の重複チェック
+        Index('ix_Employee_Number_History_user_id_end_date', 'user_id', 'end_date'), # 現在の職員番号
+        Index('ix_Employee_Number_History_user_id_start_date_end_date', 'user_id', 'start_date', 'end_date'), # 指定日時点の職員番号
+    )
     employee_number_history_id = Column(Integer, primary_key=True, comment="履歴ID (PK)")
     user_id = Column(VARCHAR(255), ForeignKey('Users.user_id'), comment="管理ID (FK)")
     employee_number = Column(VARCHAR(100), comment="職員番号")
@@ -57,6 +67,10 @@ class EmployeeNumberHistory(TimestampMixin, db.Model):
 
 class DNumbers(TimestampMixin, db.Model): # DNumberHistory -> DNumbers
     __tablename__ = 'D_Numbers'
+    __table_args__ = (
+        Index('ix_D_Numbers_d_number', 'd_number'),
+        Index('ix_D_Numbers_user_id_is_active', 'user_id', 'is_active'), # 有効なD番号
+    )
     d_number_history_id = Column(Integer, primary_key=True, comment="履歴ID (PK)")
     user_id = Column(VARCHAR(255), ForeignKey('Users.user_id'), comment="管理ID (FK)")
     d_number = Column(VARCHAR(100), comment="D番号")
@@ -67,6 +81,10 @@ class DNumbers(TimestampMixin, db.Model): # DNumberHistory -> DNumbers
 
 class System_IDs(TimestampMixin, db.Model): # SystemID -> System_IDs
     __tablename__ = 'System_IDs'
+    __table_args__ = (
+        Index('ix_System_IDs_system_id', 'system_id'),
+        Index('ix_System_IDs_user_id_is_active', 'user_id', 'is_active'), # 有効なシステムID
+    )
     system_id_record_id = Column(Integer, primary_key=True, comment="レコードID (PK)")
     user_id = Column(VARCHAR(255), ForeignKey('Users.user_id'), comment="管理ID (FK)")
     system_id = Column(VARCHAR(255), comment="情報システムID")
@@ -77,6 +95,10 @@ class System_IDs(TimestampMixin, db.Model): # SystemID -> System_IDs
 
 class Cards(TimestampMixin, db.Model): # Card -> Cards
     __tablename__ = 'Cards'
+    __table_args__ = (
+        Index('ix_Cards_card_management_id', 'card_management_id', unique=True), # カード管理IDは1枚に1つ
+        Index('ix_Cards_user_id_is_active', 'user_id', 'is_active'), # 有効なカード
+    )
     card_uid = Column(VARCHAR(255), primary_key=True, comment="カードUID (PK)")
     user_id = Column(VARCHAR(255), ForeignKey('Users.user_id'), comment="管理ID (FK)")
     card_management_id = Column(VARCHAR(255), comment="カード管理用ID")
@@ -91,6 +113,10 @@ class Cards(TimestampMixin, db.Model): # Card -> Cards
 
 class Departments(TimestampMixin, db.Model): # Department -> Departments
     __tablename__ = 'Departments'
+    __table_args__ = (
+        Index('ix_Departments_end_date', 'end_date'), # 現在有効な部署
+        Index('ix_Departments_start_date_end_date', 'start_date', 'end_date'), # 指定日時点で有効な部署
+    )
     department_id = Column(Integer, primary_key=True, comment="部署ID (PK)")
     
     department_name = Column(VARCHAR(255), nullable=True, comment="部署名") 
@@ -104,9 +130,20 @@ class Departments(TimestampMixin, db.Model): # Department -> Departments
     # リレーションシップ
     # name_history はER図から削除
     users = relationship('UserDepartment', back_populates='department')
+    aliases = relationship('Department_Aliases', back_populates='department')
 
 # DepartmentNameHistory はER図から削除
 
+class Department_Aliases(TimestampMixin, db.Model):
+    """部署名の表記ゆれ（カードデータなど外部データの部署名 → 部署）"""
+    __tablename__ = 'Department_Aliases'
+    alias_id = Column(Integer, primary_key=True, comment="別名ID (PK)")
+    alias = Column(VARCHAR(255), nullable=False, unique=True, comment="別名（外部データでの部署名）")
+    department_id = Column(Integer, ForeignKey('Departments.department_id'), nullable=False, comment="部署ID (FK)")
+
+    # リレーションシップ
+    department = relationship('Departments', back_populates='aliases')
+
 # 中間テーブル (Users と Departments)
 class UserDepartment(TimestampMixin, db.Model):
     __tablename__ = 'User_Departments'
@@ -127,6 +164,8 @@ class External_Systems(TimestampMixin, db.Model): # ExternalSystem -> External_S
     system_name = Column(VARCHAR(255), comment="外部システム名")
     start_date = Column(DATE, comment="開始日")
     end_date = Column(DATE, nullable=True, comment="終了日")
+    file_encoding = Column(VARCHAR(20), nullable=False, server_default='utf-8-sig', comment="出力ファイルの文字コード")
+    exported_change_id = Column(Integer, nullable=True, comment="差分出力で前回までに出力した変更ID (Change_Log)")
     
     # リレーションシップ
     export_settings = relationship('External_System_Exports', back_populates='system') # ExternalSystemExport -> External_System_Exports
@@ -137,7 +176,36 @@ class External_System_Exports(TimestampMixin, db.Model): # ExternalSystemExport
     system_id = Column(Integer, ForeignKey('External_Systems.system_id'), comment="システムID (FK)")
     table_name = Column(VARCHAR(255), comment="対象テーブル名")
     column_name = Column(VARCHAR(255), comment="対象カラム名")
-    transform_id = Column(VARCHAR(255), comment="変換先ID") # 新規追加
+    transform_id = Column(VARCHAR(255), comment="変換先ID") # 新規追加（出力ファイルでの列名）
+    transform = Column(VARCHAR(255), nullable=True, comment="変換処理（'|' 区切り）")
     
     # リレーションシップ
-    system = relationship('External_Systems', back_populates='export_settings') # ExternalSystem -> External_Systems
\ No newline at end of file
+    system = relationship('External_Systems', back_populates='export_settings') # ExternalSystem -> External_Systems
+
+class External_System_Export_Rows(db.Model):
+    """差分出力で外部システムに出力済みの行（行の内容のハッシュ）"""
+    __tablename__ = 'External_System_Export_Rows'
+    system_id = Column(Integer, ForeignKey('External_Systems.system_id'), primary_key=True, comment="システムID (PK, FK)")
+    user_id = Column(VARCHAR(255), primary_key=True, comment="管理ID (PK)") # 削除された職員の行も残すため FK にしない
+    row_hash = Column(VARCHAR(16), nullable=False, comment="出力した行の内容のハッシュ")
+    key_value = Column(VARCHAR(255), nullable=True, comment="出力した行の先頭列の値（削除の通知に使う）")
+    exported_at = Column(TIMESTAMP, server_default=func.now(), nullable=False, comment="出力日時")
+
+# --------------------
+# 5. 変更フィード
+# --------------------
+
+class Change_Log(db.Model):
+    """変更された行の記録（変更フィード・差分更新のカーソル）"""
+    __tablename__ = 'Change_Log'
+    __table_args__ = (
+        Index('ix_Change_Log_table_name_change_id', 'table_name', 'change_id'), # テーブルごとの最新の変更
+        Index('ix_Change_Log_changed_at', 'changed_at'), # 直近の記録の欠番の確認（changes.latest_change_id）
+    )
+    # コミットの直前に INSERT した時点で採番する（コミットの順とは限らない。読み出しは changes.latest_change_id まで）
+    change_id = Column(Integer, primary_key=True, autoincrement=True, comment="変更ID (PK)")
+    op = Column(VARCHAR(10), nullable=False, comment="変更区分 (upsert / delete / invalidate)")
+    table_name = Column(VARCHAR(64), nullable=False, comment="変更された行のテーブル名")
+    row_key = Column(VARCHAR(512), nullable=True, comment="変更された行の主キー (JSON)。不明な場合は NULL（user_id の行すべて）")
+    user_id = Column(VARCHAR(255), nullable=True, comment="変更された行の管理ID")
+    changed_at = Column(TIMESTAMP, server_default=func.now(), nullable=False, comment="記録日時")
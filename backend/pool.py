@@ -0,0 +1,89 @@
+import threading
+import time
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# --------------------
+# DB 接続プールの計測
+# --------------------
+# QueuePool は使用中の接続数などは返せますが、接続の空き待ちが何回起きたかは記録しないため、
+# 接続の取得（_do_get）を包んで待ち回数・待ち時間・タイムアウトを数えます。
+# 値はプロセス（gunicorn のワーカー）ごとです。
+
+
+class InstrumentedQueuePool(QueuePool):
+    """待ち回数などを記録する QueuePool（SQLALCHEMY_ENGINE_OPTIONS の poolclass に指定）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        event.listen(self, 'connect', self._on_connect)
+        event.listen(self, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._stats_lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        # pool_pre_ping で切断済みの接続を検出した場合などに呼ばれる
+        with self._stats_lock:
+            self.invalidations += 1
+
+    def _saturated(self):
+        # max_overflow が負（無制限）の場合は待ちが発生しない
+        return self._max_overflow >= 0 and self.checkedout() >= self.size() + self._max_overflow
+
+    def _do_get(self):
+        saturated = self._saturated()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            if saturated:
+                with self._stats_lock:
+                    self.waits += 1
+                    self.wait_seconds += time.perf_counter() - started
+
+
+def pool_status(engine):
+    """エンジンの接続プールの状態を辞書で返します。"""
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'timeout': pool.timeout(),
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            status.update({
+                'waits': pool.waits,
+                'wait_ms': round(pool.wait_seconds * 1000, 1),
+                'timeouts': pool.timeouts,
+                'connects': pool.connects,
+                'invalidations': pool.invalidations,
+            })
+    return status
+
+
+def ping(session):
+    """SELECT 1 の往復時間（ミリ秒）を返します。"""
+    started = time.perf_counter()
+    session.execute(text('SELECT 1'))
+    elapsed = time.perf_counter() - started
+    session.rollback()
+    return round(elapsed * 1000, 2)
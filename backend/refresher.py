@@ -0,0 +1,153 @@
+import threading
+import time
+from flask import current_app
+from .extensions import db
+from .changes import latest_change_id, changed_user_ids, has_changes
+
+# --------------------
+# Change_Log の差分で更新するインメモリ索引の共通処理
+# --------------------
+# カードUID索引・職員検索の索引は参照にロックを取らず、DB の読み込みはすべてバックグラウンドの
+# スレッドで行います。リクエストのスレッドは ensure_fresh() で前回の更新からの経過時間を見て
+# スレッドを起こすだけで、DB には問い合わせません（初回の読み込みだけは完了を待つ）。
+#
+# スレッドは索引ごとに同時に1つで、次のどちらかを行います。
+#   - 差分更新: 前回以降に Change_Log に記録された変更の user_id だけを読み直す
+#   - 全件の読み直し: 一定間隔ごと、マスターの変更・対象の分からない一括更新の後、差分が多すぎる場合
+#
+# サブクラスは次を実装します。
+#   - _read_all(session): 全件を読み込み、_install() に渡す値を返す
+#   - _install(data): 索引を _read_all() の結果に差し替える
+#   - _refresh(session, after, upto, user_ids): 変更を反映する。全件の読み直しが必要な場合は False を返す
+
+
+class BackgroundRefresher:
+    """Change_Log の差分でバックグラウンドに更新するインメモリ索引の基底クラス"""
+
+    # 差分更新の対象（user_id を持つテーブル）と、変更されると全件の読み直しが必要なテーブル
+    user_tables = ()
+    master_tables = ()
+    # 更新するスレッドの名前と、ログに出す索引の名前
+    thread_name = 'index-refresh'
+    label = '索引'
+
+    def __init__(self, refresh_seconds, full_refresh_seconds):
+        self.configure(refresh_seconds, full_refresh_seconds)
+        self._lock = threading.Lock()  # 読み込み・更新は同時に1つだけ
+        self._worker_lock = threading.Lock()  # 更新するスレッドの起動
+        self._worker = None
+        self._loaded = False
+        self._change_id = 0  # 前回の更新時点の Change_Log の change_id
+        self._checked_at = 0.0
+        self._full_loaded_at = 0.0
+        self._dirty_users = set()
+        self._dirty_all = False
+        self.full_loads = 0
+        self.background_loads = 0
+        self.incremental_loads = 0
+        self.last_load_seconds = None
+
+    def configure(self, refresh_seconds, full_refresh_seconds):
+        """差分更新・全件読み直しの間隔（秒）を設定します。"""
+        self.refresh_seconds = refresh_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+
+    def mark_dirty(self, tables, user_ids):
+        """on_commit から呼ばれ、次の参照時に該当ユーザーを読み直します。"""
+        tables = set(tables)
+        masters = {m.__tablename__ for m in self.master_tables}
+        if not tables & ({m.__tablename__ for m in self.user_tables} | masters):
+            return
+        if user_ids is None or tables & masters:
+            self._dirty_all = True
+        else:
+            self._dirty_users.update(user_ids)
+        self._checked_at = 0.0
+
+    def ensure_fresh(self, session):
+        """
+        必要ならバックグラウンドのスレッドで索引の更新を始めます。更新の完了は待たずに現在の索引で応答します
+        （初回の読み込みだけは完了を待ちます）。
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load(session)
+                    self._checked_at = time.monotonic()
+            return
+        if time.monotonic() - self._checked_at >= self.refresh_seconds:
+            self._start_worker()
+
+    def load(self, session):
+        """全件を読み込み直します（完了するまで待ちます）。"""
+        with self._lock:
+            self._load(session)
+            self._checked_at = time.monotonic()
+
+    def _load(self, session):
+        started = time.perf_counter()
+        # 読み込み中に通知された変更は、次の更新で取り込み直す
+        self._dirty_all = False
+        self._dirty_users = set()
+        change_id = latest_change_id(session)
+        data = self._read_all(session)
+        session.rollback()
+        self._install(data)
+        self._change_id = change_id
+        self._loaded = True
+        self._full_loaded_at = time.monotonic()
+        self.full_loads += 1
+        self.last_load_seconds = time.perf_counter() - started
+
+    def _start_worker(self):
+        """更新をバックグラウンドのスレッドで始めます（実行中なら何もしません）。"""
+        with self._worker_lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            # 失敗しても次の間隔まで再試行しない（リクエストごとにスレッドを起動しないため）
+            self._checked_at = time.monotonic()
+            self._worker = threading.Thread(target=self._work, args=(current_app._get_current_object(),),
+                                            name=self.thread_name, daemon=True)
+            self._worker.start()
+
+    def _work(self, app):
+        try:
+            with app.app_context():
+                try:
+                    with self._lock:
+                        self._update(db.session)
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            print(f"{self.label}の更新に失敗しました: {getattr(e, 'orig', e)}")
+
+    def _update(self, session):
+        """前回以降の変更を反映します。全件の読み直しが必要な場合は読み直します。"""
+        full = self._dirty_all or time.monotonic() - self._full_loaded_at >= self.full_refresh_seconds
+        if not full:
+            after, upto = self._change_id, latest_change_id(session)
+            user_ids, self._dirty_users = self._dirty_users, set()
+            if upto > after:
+                if self.master_tables and has_changes(session, after, upto,
+                                                      [m.__tablename__ for m in self.master_tables]):
+                    full = True
+                else:
+                    changed = changed_user_ids(session, after, upto, [m.__tablename__ for m in self.user_tables])
+                    # テーブル全体の invalidate が記録されていれば全件を読み直す
+                    full = changed is None
+                    user_ids |= changed or set()
+            user_ids.discard(None)
+            if not full:
+                full = self._refresh(session, after, upto, user_ids) is False
+                session.rollback()
+            if not full:
+                self._change_id = upto
+        if full:
+            self._load(session)
+            self.background_loads += 1
+
+    def wait_refresh(self, timeout=None):
+        """バックグラウンドの更新が終わるまで待ちます（ベンチマーク・テスト用）。"""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
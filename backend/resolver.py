@@ -0,0 +1,273 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import select, case
+from .models import User, EmployeeNumberHistory, DNumbers, System_IDs, Cards, Change_Log
+from .roster import current_subqueries
+from .changes import latest_change_id, changed_user_ids
+
+# --------------------
+# 識別子の解決（D番号・職員番号・情報システムID・カード → user_id）
+# --------------------
+# 連携先システムはそれぞれ異なるキーで職員を管理しているため、
+# 混在した識別子をまとめて user_id と現在の各識別子に変換します。
+#
+# キーの種類ごとに {値: user_id} のハッシュ索引を、user_id ごとに現在の識別子を保持し、
+# 索引にない値だけを種類ごとに1回の IN (...) クエリで引きます。
+# Change_Log の change_id が進んだ場合は、前回の確認以降に変更・削除された職員と
+# その職員の現在の値・変更されたカードの分だけを索引から除きます。
+# 見つからなかった値は件数の上限と有効期間のある LRU に記録します。
+
+# キーの種類と検索対象のカラム
+# order_by は同じ値が複数の職員に存在する場合の優先順（後の行ほど優先）
+KEY_TYPES = {
+    'd_number': (DNumbers.d_number, DNumbers.user_id,
+                 [case((DNumbers.is_active.is_(True), 1), else_=0), DNumbers.d_number_history_id]),
+    'employee_number': (EmployeeNumberHistory.employee_number, EmployeeNumberHistory.user_id,
+                        [case((EmployeeNumberHistory.end_date.is_(None), 1), else_=0),
+                         EmployeeNumberHistory.start_date, EmployeeNumberHistory.employee_number_history_id]),
+    'system_id': (System_IDs.system_id, System_IDs.user_id,
+                  [case((System_IDs.is_active.is_(True), 1), else_=0), System_IDs.system_id_record_id]),
+    'card_uid': (Cards.card_uid, Cards.user_id, []),
+    'card_management_id': (Cards.card_management_id, Cards.user_id,
+                           [case((Cards.is_active.is_(True), 1), else_=0), Cards.updated_at]),
+}
+
+# 解決結果に含める現在の識別子
+IDENTIFIER_COLUMNS = ['user_id', 'name', 'employee_number', 'd_number', 'system_id', 'card_uid', 'card_management_id']
+
+# 変更を確認するテーブル（変更がなければ「見つからない」結果もそのまま使える）
+RESOLVER_TABLES = [User, EmployeeNumberHistory, DNumbers, System_IDs, Cards]
+
+# IN (...) に一度に渡す値の数
+IN_CHUNK_SIZE = 1000
+
+# 変更された職員がこれより多い場合は、職員ごとに除かずに索引を空にする
+MAX_INVALIDATE_USERS = 10000
+
+# 見つからなかった値を記録する件数の上限と有効期間（秒）
+NEGATIVE_CACHE_SIZE = 100000
+NEGATIVE_CACHE_SECONDS = 300
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def identifiers_select(user_ids):
+    """user_ids の職員ごとの現在の識別子を IDENTIFIER_COLUMNS の順に返す SELECT 文"""
+    current = current_subqueries(user_ids)
+    history = current['employee_number_history']
+    d_number = current['d_numbers']
+    system = current['system_ids']
+    card = current['cards']
+    return (
+        select(
+            User.user_id, User.name, history.c.employee_number, d_number.c.d_number,
+            system.c.system_id, card.c.card_uid, card.c.card_management_id,
+        )
+        .outerjoin(history, history.c.user_id == User.user_id)
+        .outerjoin(d_number, d_number.c.user_id == User.user_id)
+        .outerjoin(system, system.c.user_id == User.user_id)
+        .outerjoin(card, card.c.user_id == User.user_id)
+        .where(User.user_id.in_(user_ids))
+    )
+
+
+class IdentifierResolver:
+    """識別子 → user_id / 現在の識別子 のインメモリ索引"""
+
+    def __init__(self, negative_size=NEGATIVE_CACHE_SIZE, negative_seconds=NEGATIVE_CACHE_SECONDS):
+        self._lock = threading.Lock()
+        self._indexes = {key_type: {} for key_type in KEY_TYPES}  # {種類: {値: user_id}}
+        self._keys_by_user = {}  # {user_id: {(種類, 値)}}（職員ごとに索引から除くため）
+        self._negatives = OrderedDict()  # {(種類, 値): 有効期限}（見つからなかった値の LRU）
+        self._profiles = {}  # {user_id: {現在の識別子}}
+        self._change_id = None  # 前回の確認時点の Change_Log の change_id
+        self.negative_size = negative_size
+        self.negative_seconds = negative_seconds
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.invalidated = 0
+
+    def _check_version(self, session):
+        """DB 側の変更を検出したら、変更された値と職員の分だけ索引から除きます。"""
+        change_id = latest_change_id(session)
+        if change_id == self._change_id:
+            return
+        if self._change_id is not None:
+            self._invalidate_changes(session, self._change_id, change_id)
+        self._change_id = change_id
+
+    def _invalidate_changes(self, session, after, upto):
+        """after < change_id <= upto の間に変更・削除された職員とその値を索引から除きます。"""
+        tables = [model.__tablename__ for model in RESOLVER_TABLES]
+        user_ids = changed_user_ids(session, after, upto, tables)
+        if user_ids is None or len(user_ids) > MAX_INVALIDATE_USERS:
+            # 対象の分からない変更の後や、一括取り込みの後などは、職員ごとに調べるより索引を空にするほうが速い
+            self.clear()
+            return
+        # 変更後の値（見つからなかった値として記録されていたものを含む）
+        keys = set()
+        for key_type, (column, user_column, _) in KEY_TYPES.items():
+            for chunk in _chunks(user_ids):
+                keys.update((key_type, value) for value in
+                            session.execute(select(column).where(user_column.in_(chunk))).scalars())
+                self.queries += 1
+        # 所有者のいないカード・付け替えられたカード
+        card_keys = select(Change_Log.row_key).where(
+            Change_Log.change_id > after, Change_Log.change_id <= upto,
+            Change_Log.table_name == Cards.__tablename__, Change_Log.row_key.isnot(None))
+        keys.update(('card_uid', json.loads(key).get('card_uid')) for key in session.execute(card_keys).scalars())
+        self.queries += 2
+
+        with self._lock:
+            for user_id in user_ids:
+                keys |= self._keys_by_user.pop(user_id, set())
+                self._profiles.pop(user_id, None)
+            for key_type, value in keys:
+                self._indexes[key_type].pop(value, None)
+                self._negatives.pop((key_type, value), None)
+            self.invalidated += len(keys) + len(user_ids)
+
+    def clear(self):
+        """索引と見つからなかった値の記録をすべて消します。"""
+        with self._lock:
+            self.invalidated += sum(len(index) for index in self._indexes.values()) + len(self._profiles)
+            self._indexes = {key_type: {} for key_type in KEY_TYPES}
+            self._keys_by_user = {}
+            self._negatives.clear()
+            self._profiles = {}
+
+    def _is_negative(self, key_type, value, now):
+        """value が「見つからない」と記録されていて、有効期限内なら True を返します。"""
+        expires_at = self._negatives.get((key_type, value))
+        if expires_at is None:
+            return False
+        with self._lock:
+            if expires_at <= now:
+                self._negatives.pop((key_type, value), None)
+                return False
+            if (key_type, value) in self._negatives:
+                self._negatives.move_to_end((key_type, value))
+        return True
+
+    def _store(self, key_type, found):
+        """_lookup_keys() の結果を索引に載せます（None は見つからなかった値として LRU に記録する）。"""
+        expires_at = time.monotonic() + self.negative_seconds
+        with self._lock:
+            index = self._indexes[key_type]
+            for value, user_id in found.items():
+                if user_id is None:
+                    self._negatives[(key_type, value)] = expires_at
+                    self._negatives.move_to_end((key_type, value))
+                else:
+                    index[value] = user_id
+                    self._keys_by_user.setdefault(user_id, set()).add((key_type, value))
+            while len(self._negatives) > self.negative_size:
+                self._negatives.popitem(last=False)
+
+    def _lookup_keys(self, session, key_type, values):
+        """値を1回の IN クエリ（IN_CHUNK_SIZE 件ごと）で引き、{値: user_id} を返します。"""
+        column, user_column, order_by = KEY_TYPES[key_type]
+        found = {}
+        for chunk in _chunks(values):
+            stmt = select(column, user_column).where(column.in_(chunk), user_column.isnot(None))
+            if order_by:
+                stmt = stmt.order_by(*order_by)
+            found.update(dict.fromkeys(chunk))  # 見つからない値も None として返す
+            found.update(session.execute(stmt).all())
+            self.queries += 1
+        return found
+
+    def _lookup_profiles(self, session, user_ids):
+        found = {}
+        for chunk in _chunks(user_ids):
+            for row in session.execute(identifiers_select(chunk)):
+                found[row.user_id] = dict(zip(IDENTIFIER_COLUMNS, row))
+            self.queries += 1
+        return found
+
+    def resolve(self, session, identifiers):
+        """
+        identifiers: (種類, 値) のリスト。種類が None の場合はすべての種類から探します。
+
+        入力と同じ順に辞書のリストを返します。見つからない値は user_id が None になり、
+        種類を指定しなかった値が複数の職員に一致した場合は error を設定します。
+        """
+        for key_type, _ in identifiers:
+            if key_type is not None and key_type not in KEY_TYPES:
+                raise ValueError(f"識別子の種類には {' / '.join(KEY_TYPES)} を指定してください: {key_type}")
+
+        self._check_version(session)
+
+        # 種類ごとに索引にない値を集め、まとめて引く
+        # （この呼び出しで引いた結果は、処理中に他のスレッドが索引から除いても resolved で使う）
+        now = time.monotonic()
+        wanted = {key_type: set() for key_type in KEY_TYPES}
+        for key_type, value in identifiers:
+            for t in ([key_type] if key_type else KEY_TYPES):
+                wanted[t].add(value)
+        resolved = {}
+        for key_type, values in wanted.items():
+            index = self._indexes[key_type]
+            missing = []
+            for v in values:
+                user_id = index.get(v)
+                if user_id is not None:
+                    resolved[(key_type, v)] = user_id
+                elif not self._is_negative(key_type, v, now):
+                    missing.append(v)
+            self.hits += len(values) - len(missing)
+            self.misses += len(missing)
+            if missing:
+                found = self._lookup_keys(session, key_type, missing)
+                self._store(key_type, found)
+                resolved.update(((key_type, v), user_id) for v, user_id in found.items() if user_id is not None)
+
+        matches = []
+        for key_type, value in identifiers:
+            candidates = {t: resolved[(t, value)] for t in ([key_type] if key_type else KEY_TYPES)
+                          if (t, value) in resolved}
+            matches.append(candidates)
+
+        user_ids = {user_id for candidates in matches for user_id in candidates.values()}
+        profiles = {user_id: self._profiles[user_id] for user_id in user_ids if user_id in self._profiles}
+        missing = [user_id for user_id in user_ids if user_id not in profiles]
+        if missing:
+            found = self._lookup_profiles(session, missing)
+            profiles.update(found)
+            with self._lock:
+                self._profiles.update(found)
+        session.rollback()
+
+        results = []
+        for (key_type, value), candidates in zip(identifiers, matches):
+            result = {'type': key_type, 'value': value, 'matched_type': None}
+            result.update(dict.fromkeys(IDENTIFIER_COLUMNS))
+            if len(set(candidates.values())) > 1:
+                result['error'] = f"複数の職員に一致しました: {', '.join(sorted(candidates))}"
+            elif candidates:
+                matched_type, user_id = next(iter(candidates.items()))
+                result['matched_type'] = matched_type
+                result.update(profiles.get(user_id) or {'user_id': user_id})
+            results.append(result)
+        return results
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'queries': self.queries,
+            'invalidated': self.invalidated,
+            'indexed': {key_type: len(index) for key_type, index in self._indexes.items()},
+            'negatives': len(self._negatives),
+            'profiles': len(self._profiles),
+        }
+
+
+identifier_resolver = IdentifierResolver()
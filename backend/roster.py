@@ -0,0 +1,389 @@
+import base64
+import datetime
+import hashlib
+import json
+from sqlalchemy import select, func, case, and_, or_, exists
+from .models import User, EmployeeNumberHistory, Departments, UserDepartment, Positions, DNumbers, Cards, System_IDs, Change_Log
+from .changes import latest_change_id
+
+# --------------------
+# 職員一覧（ロスター）の射影
+# --------------------
+# 1ユーザー1行に平坦化した「現在の所属情報」を1本のSQLで取得します。
+# 各履歴テーブルは ROW_NUMBER() で1ユーザーにつき1行へ絞り込んでから結合するため、
+# ユーザー数に関わらずクエリ数は一定です（MySQL 8.x / SQLite 3.25+ のウィンドウ関数を使用）。
+
+# APIレスポンスのキー順
+ROSTER_COLUMNS = [
+    "user_id",
+    "name",
+    "d_id",
+    "employee_number",
+    "position_id",
+    "position_name",
+    "department_id",
+    "department_name",
+    "card_uid",
+    "card_management_id",
+]
+
+# CSV 出力時の見出し（フロントエンドの表示名と同じ）
+COLUMN_LABELS = {
+    "user_id": "UUID",
+    "name": "氏名",
+    "d_id": "D番号",
+    "employee_number": "職員番号",
+    "position_id": "職種ID",
+    "position_name": "職種名称",
+    "department_id": "部署ID",
+    "department_name": "部署名称",
+    "card_uid": "カードUID",
+    "card_management_id": "カード管理ID",
+}
+
+
+def _first_per_user(model, *order_by, where=None, join=None, name=None):
+    """
+    model を user_id ごとに order_by の先頭1行だけに絞ったサブクエリを返します。
+    where を指定すると、その条件を満たす行の中から選びます（join は where で参照するテーブルと結合条件）。
+    """
+    row_number = func.row_number().over(
+        partition_by=model.user_id,
+        order_by=order_by
+    ).label('row_number')
+    ranked = select(model.__table__, row_number)
+    if join is not None:
+        ranked = ranked.join(*join)
+    if where is not None:
+        ranked = ranked.where(where)
+    ranked = ranked.subquery()
+    return (
+        select(ranked)
+        .where(ranked.c.row_number == 1)
+        .subquery(name or f"current_{model.__tablename__.lower()}")
+    )
+
+
+def current_subqueries(user_ids=None):
+    """
+    各履歴テーブルの「現在のレコード」サブクエリを返します。
+
+    - 職員番号履歴: 終了日が未設定のもの → 開始日が新しいもの
+    - D番号: 有効なもの → 新しいもの
+    - 部署: 最後に更新された所属
+    - カード: 有効なもの → 最後に更新されたもの
+    - 情報システムID: 有効なもの → 新しいもの
+
+    user_ids（値のリストまたは user_id の SELECT 文）を指定すると、その職員の行だけから選びます
+    （順位付けの前に絞り込むため、一部の職員を読み直すときに全職員の行を並べ替えずに済む）。
+    """
+    def only(model):
+        return None if user_ids is None else model.user_id.in_(user_ids)
+
+    return {
+        'employee_number_history': _first_per_user(
+            EmployeeNumberHistory,
+            case((EmployeeNumberHistory.end_date.is_(None), 0), else_=1),
+            EmployeeNumberHistory.start_date.desc(),
+            EmployeeNumberHistory.employee_number_history_id.desc(),
+            where=only(EmployeeNumberHistory)
+        ),
+        'd_numbers': _first_per_user(
+            DNumbers,
+            case((DNumbers.is_active.is_(True), 0), else_=1),
+            DNumbers.d_number_history_id.desc(),
+            where=only(DNumbers)
+        ),
+        'departments': _first_per_user(
+            UserDepartment,
+            UserDepartment.updated_at.desc(),
+            UserDepartment.department_id,
+            where=only(UserDepartment)
+        ),
+        'cards': _first_per_user(
+            Cards,
+            case((Cards.is_active.is_(True), 0), else_=1),
+            Cards.updated_at.desc(),
+            Cards.card_uid,
+            where=only(Cards)
+        ),
+        'system_ids': _first_per_user(
+            System_IDs,
+            case((System_IDs.is_active.is_(True), 0), else_=1),
+            System_IDs.system_id_record_id.desc(),
+            where=only(System_IDs)
+        ),
+    }
+
+
+def _valid_on(model, as_of):
+    """start_date 〜 end_date（未設定は無期限）が as_of を含む条件"""
+    return and_(
+        or_(model.start_date.is_(None), model.start_date <= as_of),
+        or_(model.end_date.is_(None), model.end_date >= as_of),
+    )
+
+
+def as_of_subqueries(as_of):
+    """
+    as_of 時点で有効なレコードのサブクエリを返します（current_subqueries() と同じキー）。
+
+    - 職員番号履歴: 開始日〜終了日が as_of を含むもののうち、開始日が新しいもの
+    - 部署: 開始日〜終了日が as_of を含む部署への所属のうち、最後に更新されたもの
+      （User_Departments 自体は期間を持たないため、所属の期間は部署の有効期間で判定する）
+    - D番号・カード: 期間を持たないため現在のレコード
+    """
+    current = current_subqueries()
+    current['employee_number_history'] = _first_per_user(
+        EmployeeNumberHistory,
+        EmployeeNumberHistory.start_date.desc(),
+        EmployeeNumberHistory.employee_number_history_id.desc(),
+        where=_valid_on(EmployeeNumberHistory, as_of),
+        name='as_of_employee_number_history'
+    )
+    current['departments'] = _first_per_user(
+        UserDepartment,
+        UserDepartment.updated_at.desc(),
+        UserDepartment.department_id,
+        join=(Departments, Departments.department_id == UserDepartment.department_id),
+        where=_valid_on(Departments, as_of),
+        name='as_of_user_departments'
+    )
+    return current
+
+
+def roster_select(as_of=None):
+    """
+    ROSTER_COLUMNS の順に列を並べた職員一覧の SELECT 文を返します。
+    as_of（date）を指定すると、その日に在籍していた職員とその日の職員番号・職位・部署を返します。
+    """
+    current = current_subqueries() if as_of is None else as_of_subqueries(as_of)
+    history = current['employee_number_history']
+    d_number = current['d_numbers']
+    user_dept = current['departments']
+    card = current['cards']
+
+    stmt = (
+        select(
+            User.user_id.label('user_id'),
+            User.name.label('name'),
+            d_number.c.d_number.label('d_id'),
+            history.c.employee_number.label('employee_number'),
+            history.c.position_id.label('position_id'),
+            Positions.position_name.label('position_name'),
+            user_dept.c.department_id.label('department_id'),
+            Departments.department_name.label('department_name'),
+            card.c.card_uid.label('card_uid'),
+            card.c.card_management_id.label('card_management_id'),
+        )
+        .select_from(User)
+        .outerjoin(history, history.c.user_id == User.user_id)
+        .outerjoin(Positions, Positions.position_id == history.c.position_id)
+        .outerjoin(d_number, d_number.c.user_id == User.user_id)
+        .outerjoin(user_dept, user_dept.c.user_id == User.user_id)
+        .outerjoin(Departments, Departments.department_id == user_dept.c.department_id)
+        .outerjoin(card, card.c.user_id == User.user_id)
+    )
+    if as_of is not None:
+        # as_of より後に入職した職員は含めない（入職日が未設定の職員は含める）
+        stmt = stmt.where(or_(User.hire_date.is_(None), User.hire_date <= as_of))
+    return stmt
+
+
+# --------------------
+# 絞り込み・並び替え・キーセットページング
+# --------------------
+
+# 並び替えに使えるキー（カーソルの値の型変換も兼ねる）
+SORT_KEYS = {
+    'hire_date': datetime.date.fromisoformat,
+    'name': str,
+    'employee_number': str,
+    'user_id': str,
+}
+DEFAULT_SORT = 'hire_date'
+
+
+def _sort_column(stmt, key):
+    if key == 'hire_date':
+        return User.hire_date
+    if key == 'name':
+        return User.name
+    if key == 'user_id':
+        return User.user_id
+    return stmt.selected_columns[key]
+
+
+def filter_roster(stmt, department_id=None, position_id=None, name=None,
+                  has_card=None, has_d_number=None):
+    """
+    roster_select() の結果を SQL 側で絞り込みます。None の条件は無視します。
+
+    - name: 氏名の前方一致
+    - has_card: カードを持つ / 持たない
+    - has_d_number: 有効なD番号を持つ / 持たない
+    """
+    cols = stmt.selected_columns
+    if department_id is not None:
+        stmt = stmt.where(cols.department_id == department_id)
+    if position_id is not None:
+        stmt = stmt.where(cols.position_id == position_id)
+    if name:
+        stmt = stmt.where(User.name.startswith(name, autoescape=True))
+    if has_card is not None:
+        stmt = stmt.where(cols.card_uid.isnot(None) if has_card else cols.card_uid.is_(None))
+    if has_d_number is not None:
+        active_d_number = exists().where(
+            DNumbers.user_id == User.user_id,
+            DNumbers.is_active.is_(True)
+        )
+        stmt = stmt.where(active_d_number if has_d_number else ~active_d_number)
+    return stmt
+
+
+def encode_cursor(sort, value, user_id):
+    """
+    (並び替えキーの値, user_id) をURLに載せられる不透明な文字列にします。
+    """
+    if isinstance(value, datetime.date):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, user_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """
+    encode_cursor() の逆変換。不正なカーソルの場合は ValueError を送出します。
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, user_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"不正なカーソルです: {cursor}") from e
+    if cursor_sort != sort.lstrip('-'):
+        raise ValueError("カーソルと並び替えキーが一致しません。")
+    if value is not None:
+        value = SORT_KEYS[cursor_sort](value)
+    return value, user_id
+
+
+def paginate_roster(stmt, sort=DEFAULT_SORT, limit=None, cursor=None):
+    """
+    (並び替えキー, user_id) によるキーセットページングを適用します。
+    sort の先頭に '-' を付けると降順です。
+
+    NULL は昇順で先頭、降順で末尾に並ぶ前提で（MySQL / SQLite 共通）、
+    カーソル位置より後ろの行だけを取得する条件を組み立てます。
+    """
+    descending = sort.startswith('-')
+    key = sort.lstrip('-')
+    if key not in SORT_KEYS:
+        raise ValueError(f"並び替えできないキーです: {key}")
+
+    column = _sort_column(stmt, key)
+    tiebreak = User.user_id
+
+    if cursor:
+        value, user_id = decode_cursor(cursor, sort)
+        if not descending:
+            if value is None:
+                after = or_(and_(column.is_(None), tiebreak > user_id), column.isnot(None))
+            else:
+                after = or_(column > value, and_(column == value, tiebreak > user_id))
+        else:
+            if value is None:
+                after = and_(column.is_(None), tiebreak < user_id)
+            else:
+                after = or_(
+                    column < value,
+                    and_(column == value, tiebreak < user_id),
+                    column.is_(None)
+                )
+        stmt = stmt.where(after)
+
+    if descending:
+        stmt = stmt.order_by(column.desc(), tiebreak.desc())
+    else:
+        stmt = stmt.order_by(column.asc(), tiebreak.asc())
+
+    # 次ページの有無を判定するため1件多く取得する
+    stmt = stmt.add_columns(column.label('_sort_value'))
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def fetch_roster_page(session, stmt, sort=DEFAULT_SORT, limit=100, cursor=None):
+    """
+    1ページ分の職員一覧と次ページのカーソル（最終ページなら None）を返します。
+    """
+    rows = session.execute(paginate_roster(stmt, sort, limit, cursor)).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort.lstrip('-'), last['_sort_value'], last['user_id'])
+    items = [{key: row[key] for key in ROSTER_COLUMNS} for row in rows]
+    return items, next_cursor
+
+
+def stream_roster(session, stmt, batch_size=1000):
+    """
+    サーバーサイドカーソルで職員一覧を batch_size 件ずつ読み込み、1行ずつ辞書で返します。
+    """
+    result = session.execute(stmt.execution_options(yield_per=batch_size))
+    for row in result.mappings():
+        yield row
+
+
+# --------------------
+# バージョントークン（ETag / Last-Modified 用）
+# --------------------
+
+# 職員一覧の内容に関わるテーブル
+ROSTER_TABLES = [User, EmployeeNumberHistory, Positions, DNumbers, Cards, UserDepartment, Departments]
+
+
+class RosterVersion:
+    """職員一覧のバージョン（ETag と Last-Modified）"""
+
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+def roster_version(session, tables=None):
+    """
+    ROSTER_TABLES（または tables）ごとの Change_Log の記録から、職員一覧のバージョンを返します。
+
+    各テーブルの値は、読み出してよい change_id（latest_change_id）以下の最新の change_id と、それより後に
+    コミット済みの記録の件数です。change_id はコミットの順とは限らないため、後からコミットされた小さい change_id も
+    件数で区別します。どちらも (table_name, change_id) のインデックスの範囲を読むだけで、テーブルの行数に関わらず一定です。
+    削除も Change_Log に記録されるため、行の削除でもバージョンが変わります。
+    """
+    upto = latest_change_id(session)
+    columns = []
+    for model in tables or ROSTER_TABLES:
+        table = Change_Log.table_name == model.__tablename__
+        columns.append(select(func.max(Change_Log.change_id)).where(table, Change_Log.change_id <= upto)
+                       .scalar_subquery())
+        columns.append(select(func.count()).select_from(Change_Log).where(table, Change_Log.change_id > upto)
+                       .scalar_subquery())
+        columns.append(select(Change_Log.changed_at).where(table)
+                       .order_by(Change_Log.change_id.desc()).limit(1).scalar_subquery())
+    values = session.execute(select(*columns)).one()
+
+    timestamps = [v for v in values[2::3] if v is not None]
+    last_modified = max(timestamps) if timestamps else None
+    raw = '|'.join(f"{'' if latest is None else latest}+{pending}"
+                   for latest, pending in zip(values[0::3], values[1::3]))
+    return RosterVersion(hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20], last_modified)
+
+
+def fetch_roster(session, stmt=None):
+    """
+    職員一覧を辞書のリストとして取得します。
+    """
+    if stmt is None:
+        stmt = roster_select()
+    return [{key: row[key] for key in ROSTER_COLUMNS} for row in session.execute(stmt).mappings()]
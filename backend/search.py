@@ -0,0 +1,406 @@
+import bisect
+import re
+import unicodedata
+from functools import lru_cache
+from itertools import chain
+import jaconv
+import numpy as np
+from sqlalchemy import select
+from .models import User, EmployeeNumberHistory, DNumbers, Cards
+from .roster import current_subqueries
+from .cache import on_commit
+from .refresher import BackgroundRefresher
+
+# --------------------
+# 職員検索（氏名・カナ・ローマ字・職員番号・D番号・カード管理ID）のインメモリ索引
+# --------------------
+# 受付や電話対応では、氏名の一部・読み・職員番号の先頭などの断片から職員を探すため、
+# 全職員の検索キーを正規化して保持し、DB に問い合わせずに順位付きの候補を返します。
+#
+# 正規化:
+#   - 氏名・カナ: NFKC（半角カナ → 全角, 全角英数字 → 半角）、空白の除去、ひらがな → カタカナ
+#   - ローマ字: カナから jaconv で変換し、長音（ou, uu, ー）や「oh」を短くそろえる（satou = sato = satoh）
+#   - 職員番号・D番号・カード管理ID: NFKC、空白の除去、英字は大文字
+#
+# 索引:
+#   - 各キーの並べ替え済みリスト（bisect で完全一致・前方一致の範囲を求める）
+#   - 氏名・カナ・ローマ字の 2-gram（氏名・カナは 1 文字も）→ 文書番号の配列（部分一致の候補）
+#   文書番号はカナ・氏名の順に並べた順で振るため、候補を番号順に見れば読みの順の結果になります。
+#
+# 更新方法（カードUID索引と同じ refresher.BackgroundRefresher）:
+#   - サーバーの起動時に全件を読み込み（preload_indexes）
+#   - 一定間隔ごとに、前回以降に Change_Log に記録された変更・削除の user_id だけを読み直す
+#   - 同じプロセスでのコミットは on_commit で通知を受け、次の検索時に更新を始める
+#   読み直した職員は古い文書を無効にして差分として追加します。
+#   差分更新・定期的な全件の読み直し・差分が増えたときの作り直しはどれもバックグラウンドのスレッドで行い、
+#   完了したら索引を差し替えます（その間の検索は現在の索引で応答する）。
+
+# 検索結果に含める項目（SEARCH_FIELDS の順でタプルに保持する）
+SEARCH_FIELDS = ('user_id', 'name', 'name_kana', 'employee_number', 'd_number', 'card_management_id')
+
+# 正規化したキーの順（_KEYS の添字）と、一致した項目として返す名前
+_KEYS = ('name', 'name_kana', 'romaji', 'employee_number', 'd_number', 'card_management_id')
+_TEXT_KEYS = (0, 1)          # 氏名・カナ（正規化した検索語と比べる）
+_ROMAJI_KEY = 2              # ローマ字（英字だけの検索語と比べる）
+_IDENTIFIER_KEYS = (3, 4, 5) # 職員番号・D番号・カード管理ID
+
+# 一致の種類ごとの点数（高い順に結果に並べる）
+SCORE_IDENTIFIER_EXACT = 100
+SCORE_IDENTIFIER_PREFIX = 80
+SCORE_NAME_EXACT = 70
+SCORE_NAME_PREFIX = 60
+SCORE_NAME_SUBSTRING = 40
+
+# 差分の文書数がこれを超えたら索引を作り直す
+_MAX_DELTA = 2000
+# 前方一致の範囲の上限に使う文字
+_MAX_CHAR = '\U0010ffff'
+
+_SPACES = re.compile(r'\s+')
+_NON_ALPHA = re.compile(r'[^a-z]')
+# 長音の表記ゆれ（aa, ii, uu, ee, oo, ou → 1文字, 子音の前の oh → o）
+_LONG_VOWELS = re.compile(r'([aiueo])\1|(o)u|(o)h(?![aiueoy])')
+
+
+def normalize_text(value):
+    """
+    氏名・カナを検索キーに正規化します（文字列でない値や空の値は None）。
+
+    >>> normalize_text('ﾔﾏﾀﾞ ﾀﾛｳ')
+    'ヤマダタロウ'
+    >>> normalize_text('やまだ　太郎')
+    'ヤマダ太郎'
+    """
+    if not isinstance(value, str):
+        return None
+    text = _SPACES.sub('', unicodedata.normalize('NFKC', value))
+    return jaconv.hira2kata(text).lower() or None
+
+
+def normalize_romaji(value):
+    """
+    英字の検索語・ローマ字を、長音の表記ゆれを除いた小文字に正規化します。
+
+    >>> [normalize_romaji(s) for s in ('Satou', 'SATO', 'satoh', 'Ohno', 'Yamada Tarou')]
+    ['sato', 'sato', 'sato', 'ono', 'yamadataro']
+    """
+    if not isinstance(value, str):
+        return None
+    text = _NON_ALPHA.sub('', unicodedata.normalize('NFKC', value).lower())
+    text = _LONG_VOWELS.sub(lambda m: m.group(1) or m.group(2) or m.group(3), text)
+    return text or None
+
+
+# カナ→ローマ字の変換結果を覚えておく件数（同じ読みの職員が多いため。差分更新で増え続けないよう上限を設ける）
+_ROMAJI_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=_ROMAJI_CACHE_SIZE)
+def kana_to_romaji(kana):
+    """
+    正規化したカナをローマ字（normalize_romaji 済み）にします。
+
+    >>> kana_to_romaji('サトウハナコ')
+    'satohanako'
+    """
+    if not kana:
+        return None
+    return normalize_romaji(jaconv.kana2alphabet(jaconv.kata2hira(kana)))
+
+
+def normalize_identifier(value):
+    """
+    職員番号・D番号・カード管理IDを検索キーに正規化します。
+
+    >>> normalize_identifier(' ｄ００００４２ ')
+    'D000042'
+    """
+    if value is None:
+        return None
+    text = _SPACES.sub('', unicodedata.normalize('NFKC', str(value))).upper()
+    return text or None
+
+
+def search_select(user_ids=None):
+    """
+    職員ごとに現在の職員番号・D番号・カード管理IDを付けた SELECT 文を返します。
+    user_ids を指定すると、その職員だけを返します。
+    """
+    current = current_subqueries(user_ids)
+    history = current['employee_number_history']
+    d_number = current['d_numbers']
+    card = current['cards']
+    stmt = (
+        select(
+            User.user_id, User.name, User.name_kana,
+            history.c.employee_number, d_number.c.d_number, card.c.card_management_id,
+        )
+        .select_from(User)
+        .outerjoin(history, history.c.user_id == User.user_id)
+        .outerjoin(d_number, d_number.c.user_id == User.user_id)
+        .outerjoin(card, card.c.user_id == User.user_id)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(User.user_id.in_(user_ids))
+    return stmt
+
+
+def _grams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class _Snapshot:
+    """
+    ある時点の索引。検索側はロックを取らないため、更新時は新しいインスタンスに差し替えます。
+
+    文書番号 0〜base_size-1 は並べ替え済みの基本索引、それ以降は差分（delta）です。
+    """
+
+    def __init__(self, records, keys, orders):
+        # records[doc]: SEARCH_FIELDS のタプル, keys[doc]: _KEYS の正規化済みキー, orders[doc]: 並び順のキー
+        self.records = records
+        self.keys = keys
+        self.orders = orders
+        self.base_size = len(records)
+        self.alive = np.ones(len(records), dtype=bool)
+        self.by_user = {record[0]: doc for doc, record in enumerate(records)}
+        self.delta = []
+
+        # キーごとの並べ替え済みリスト（完全一致・前方一致）。安定ソートのため同じキーは文書番号の順になる
+        self.sorted_keys = {}
+        for k in range(len(_KEYS)):
+            column = [key[k] for key in keys]
+            docs = sorted((doc for doc, value in enumerate(column) if value), key=column.__getitem__)
+            self.sorted_keys[k] = ([column[doc] for doc in docs], np.array(docs, dtype=np.uint32))
+
+        # n-gram → 文書番号（昇順）の配列（部分一致）。同じ氏名・読みは多いため、n-gram は重複のないキーごとに作る
+        self.grams = {}
+        for k in _TEXT_KEYS + (_ROMAJI_KEY,):
+            by_text = {}
+            for doc, key in enumerate(keys):
+                if key[k]:
+                    by_text.setdefault(key[k], []).append(doc)
+            postings = {}
+            for text, docs in by_text.items():
+                grams = _grams(text, 2)
+                if k != _ROMAJI_KEY:
+                    grams |= set(text)
+                for gram in grams:
+                    postings.setdefault(gram, []).append(docs)
+            self.grams[k] = {gram: np.sort(np.fromiter(chain.from_iterable(lists), dtype=np.uint32))
+                             for gram, lists in postings.items()}
+
+    def patched(self, remove, records, keys, orders):
+        """remove の職員を無効にし、records を差分として追加した新しい索引を返します。"""
+        snapshot = object.__new__(_Snapshot)
+        snapshot.__dict__.update(self.__dict__)
+        snapshot.records = self.records + records
+        snapshot.keys = self.keys + keys
+        snapshot.orders = self.orders + orders
+        snapshot.by_user = dict(self.by_user)
+        alive = np.zeros(len(snapshot.records), dtype=bool)
+        alive[:len(self.alive)] = self.alive
+        for user_id in remove:
+            doc = snapshot.by_user.pop(user_id, None)
+            if doc is not None:
+                alive[doc] = False
+        start = len(self.records)
+        for doc, record in enumerate(records, start):
+            alive[doc] = True
+            snapshot.by_user[record[0]] = doc
+        snapshot.alive = alive
+        snapshot.delta = [doc for doc in self.delta if alive[doc]] + list(range(start, len(snapshot.records)))
+        return snapshot
+
+    def live(self):
+        """有効な文書の (records, keys, orders) を返します（索引の作り直し用）。"""
+        docs = [doc for doc in range(len(self.records)) if self.alive[doc]]
+        return ([self.records[d] for d in docs], [self.keys[d] for d in docs], [self.orders[d] for d in docs])
+
+    def __len__(self):
+        return len(self.by_user)
+
+
+def _build(records, keys, orders):
+    """並び順のキーで並べ替えてから索引を作ります。"""
+    order = sorted(range(len(records)), key=orders.__getitem__)
+    return _Snapshot([records[i] for i in order], [keys[i] for i in order], [orders[i] for i in order])
+
+
+class SearchIndex(BackgroundRefresher):
+    """氏名・カナ・ローマ字・識別子による職員検索の索引"""
+
+    user_tables = (User, EmployeeNumberHistory, DNumbers, Cards)
+    thread_name = 'search-index-refresh'
+    label = '職員検索の索引'
+
+    def __init__(self, refresh_seconds=5, full_refresh_seconds=3600):
+        super().__init__(refresh_seconds, full_refresh_seconds)
+        self._snapshot = _Snapshot([], [], [])
+        self.rebuilds = 0
+        self.searches = 0
+
+    # ---- 検索 ----
+
+    def search(self, query, limit=20):
+        """
+        query に一致する職員を点数の高い順に最大 limit 件返します。
+        同じ点数の職員はカナ・氏名の順に並べます。
+        """
+        self.searches += 1
+        snapshot = self._snapshot
+        text = normalize_text(query)
+        if not text or limit <= 0:
+            return []
+        romaji = normalize_romaji(query) if query.isascii() else None
+        identifier = normalize_identifier(query)
+
+        found = {}  # doc -> (score, 一致した項目の添字)
+        tiers = [
+            (SCORE_IDENTIFIER_EXACT, [(k, identifier) for k in _IDENTIFIER_KEYS], True),
+            (SCORE_IDENTIFIER_PREFIX, [(k, identifier) for k in _IDENTIFIER_KEYS], False),
+            (SCORE_NAME_EXACT, [(k, text) for k in _TEXT_KEYS] + [(_ROMAJI_KEY, romaji)], True),
+            (SCORE_NAME_PREFIX, [(k, text) for k in _TEXT_KEYS] + [(_ROMAJI_KEY, romaji)], False),
+        ]
+        for score, targets, exact in tiers:
+            candidates = []
+            for k, value in targets:
+                if value:
+                    candidates.extend((doc, k) for doc in self._match_key(snapshot, k, value, exact, limit + len(found)))
+            self._collect(snapshot, found, candidates, score, limit)
+            if len(found) >= limit:
+                break
+        else:
+            candidates = []
+            for k, value in [(k, text) for k in _TEXT_KEYS] + [(_ROMAJI_KEY, romaji)]:
+                if value:
+                    candidates.extend((doc, k) for doc in self._match_substring(snapshot, k, value, limit + len(found)))
+            self._collect(snapshot, found, candidates, SCORE_NAME_SUBSTRING, limit)
+
+        results = []
+        for doc, (score, k) in found.items():
+            result = dict(zip(SEARCH_FIELDS, snapshot.records[doc]))
+            result['matched'] = _KEYS[k]
+            result['score'] = score
+            results.append(result)
+        return results
+
+    @staticmethod
+    def _collect(snapshot, found, candidates, score, limit):
+        """同じ点数の候補を並び順に found へ追加します（limit 件まで）。"""
+        orders = snapshot.orders
+        for doc, k in sorted(candidates, key=lambda c: (orders[c[0]], c[1])):
+            if len(found) >= limit:
+                return
+            if doc not in found:
+                found[doc] = (score, k)
+
+    @staticmethod
+    def _match_key(snapshot, k, value, exact, n):
+        """キー k が value と一致する（exact=False なら value で始まる）文書を並び順に最大 n 件返します。"""
+        keys, docs = snapshot.sorted_keys[k]
+        lo = bisect.bisect_left(keys, value)
+        hi = bisect.bisect_right(keys, value, lo) if exact else bisect.bisect_left(keys, value + _MAX_CHAR, lo)
+        matched = docs[lo:hi]
+        matched = np.sort(matched[snapshot.alive[matched]])[:n].tolist()
+        for doc in snapshot.delta:
+            key = snapshot.keys[doc][k]
+            if key and (key == value if exact else key.startswith(value)):
+                matched.append(doc)
+        return matched
+
+    @staticmethod
+    def _match_substring(snapshot, k, value, n):
+        """キー k が value を含む文書を並び順に最大 n 件返します。"""
+        grams = snapshot.grams[k]
+        if len(value) == 1:
+            if k == _ROMAJI_KEY:
+                return []
+            postings = [grams.get(value)]
+        else:
+            postings = [grams.get(gram) for gram in _grams(value, 2)]
+        matched = []
+        if all(p is not None for p in postings):
+            postings.sort(key=len)
+            candidates = postings[0]
+            for other in postings[1:]:
+                candidates = np.intersect1d(candidates, other, assume_unique=True)
+            keys, alive = snapshot.keys, snapshot.alive
+            # 2-gram がすべて含まれていても、並びが違えば部分一致ではないため確かめる
+            for doc in candidates[alive[candidates]].tolist():
+                if value in keys[doc][k]:
+                    matched.append(doc)
+                    if len(matched) >= n:
+                        break
+        for doc in snapshot.delta:
+            key = snapshot.keys[doc][k]
+            if key and value in key:
+                matched.append(doc)
+        return matched
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    # ---- 更新 ----
+
+    @staticmethod
+    def _documents(rows):
+        """DB の行から (records, keys, orders) を作ります。"""
+        records, keys, orders = [], [], []
+        for row in rows:
+            record = tuple(row)
+            name, kana = normalize_text(record[1]), normalize_text(record[2])
+            records.append(record)
+            keys.append((
+                name, kana, kana_to_romaji(kana),
+                normalize_identifier(record[3]), normalize_identifier(record[4]), normalize_identifier(record[5]),
+            ))
+            orders.append((kana or '', name or '', record[0]))
+        return records, keys, orders
+
+    def _read_all(self, session):
+        """全職員を読み込んで索引のスナップショットを返します。"""
+        return _build(*self._documents(session.execute(search_select())))
+
+    def _install(self, data):
+        self._snapshot = data
+
+    def _refresh(self, session, after, upto, user_ids):
+        """前回以降に変更・削除された職員だけを読み直します。"""
+        if len(user_ids) > _MAX_DELTA:
+            # 一括取り込みの直後などは、職員ごとに読み直すより全件を読み直すほうが速い
+            return False
+        if user_ids:
+            rows = []
+            ids = list(user_ids)
+            for start in range(0, len(ids), 1000):
+                rows.extend(session.execute(search_select(ids[start:start + 1000])))
+            self._patch(user_ids, rows)
+            self.incremental_loads += 1
+        return True
+
+    def _patch(self, user_ids, rows):
+        snapshot = self._snapshot.patched(user_ids, *self._documents(rows))
+        if len(snapshot.delta) > _MAX_DELTA:
+            # 差分が増えると検索が遅くなるため、次の更新で全件を読み直して作り直す
+            self._dirty_all = True
+            self._checked_at = 0.0
+            self.rebuilds += 1
+        self._snapshot = snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'users': len(snapshot),
+            'delta': len(snapshot.delta),
+            'full_loads': self.full_loads,
+            'incremental_loads': self.incremental_loads,
+            'rebuilds': self.rebuilds,
+            'background_loads': self.background_loads,
+            'searches': self.searches,
+            'last_load_ms': None if self.last_load_seconds is None else round(self.last_load_seconds * 1000, 1),
+        }
+
+
+search_index = SearchIndex()
+on_commit(search_index.mark_dirty)
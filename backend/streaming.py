@@ -0,0 +1,155 @@
+import csv
+import datetime
+import io
+import json
+import unicodedata
+
+# --------------------
+# 行のストリーム書き出し（CSV / NDJSON / 端末の表 / Parquet）
+# --------------------
+# DB のサーバーサイドカーソルから受け取った行を、一定件数ごとにバイト列へ変換して返します。
+# 全件をメモリに載せないため、件数に関わらずメモリ使用量は一定です。
+
+# 対応している文字コード（Excel 向けには utf-8-sig か cp932 を使う）
+ENCODINGS = ('utf-8', 'utf-8-sig', 'cp932')
+
+# 何行ごとにバイト列として送り出すか
+FLUSH_ROWS = 500
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def unencodable_error(rows, columns, encoding, first_row=1):
+    """
+    rows（辞書のリスト）の columns のうち encoding で表せない最初の値を探し、
+    行番号（見出しを除いて first_row から数える）と列名を示す ValueError を返します。
+    """
+    codec = 'utf-8' if encoding == 'utf-8-sig' else encoding
+    for number, row in enumerate(rows, start=first_row):
+        for column in columns:
+            value = row[column]
+            if not isinstance(value, str):
+                continue
+            try:
+                value.encode(codec)
+            except UnicodeEncodeError as e:
+                return ValueError(f"{number}行目の {column} 列の文字「{value[e.start:e.end]}」は {encoding} で表せません"
+                                  f"（値: {value}）。")
+    return ValueError(f"{encoding} で表せない文字があります。")
+
+
+def iter_csv(rows, columns, header=None, encoding='utf-8'):
+    """
+    rows（辞書のイテラブル）の columns を CSV のバイト列として順に返します。
+    header を省略すると columns をそのまま見出しにします。
+    cp932 で表せない文字があると、その行番号と列名を示す ValueError を送出します（'?' などに置き換えない）。
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"対応していない文字コードです: {encoding}")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+
+    def flush(batch=(), first_row=1):
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        # utf-8-sig の BOM は先頭の1回だけ付ける
+        try:
+            return data.encode('utf-8' if encoding == 'utf-8-sig' else encoding)
+        except UnicodeEncodeError:
+            raise unencodable_error(batch, columns, encoding, first_row) from None
+
+    if encoding == 'utf-8-sig':
+        yield b'\xef\xbb\xbf'
+    writer.writerow(header or columns)
+    written = 0
+    for batch in _batched(rows, FLUSH_ROWS):
+        writer.writerows([[row[c] for c in columns] for row in batch])
+        yield flush(batch, written + 1)
+        written += len(batch)
+    tail = flush()
+    if tail:
+        yield tail
+
+
+def iter_ndjson(rows, columns):
+    """rows の columns を1行1 JSON オブジェクト（UTF-8）として順に返します。"""
+    for batch in _batched(rows, FLUSH_ROWS):
+        lines = [
+            json.dumps({c: row[c] for c in columns}, ensure_ascii=False, default=_json_default)
+            for row in batch
+        ]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _display_width(text):
+    # 全角文字は端末で2桁分を使う
+    return sum(2 if unicodedata.east_asian_width(ch) in ('F', 'W') else 1 for ch in text)
+
+
+def _pad(text, width):
+    return text + ' ' * (width - _display_width(text))
+
+
+def iter_table(rows, columns, header=None, page_size=50):
+    """
+    rows の columns を page_size 行ずつ、桁をそろえた表（文字列）として順に返します。
+    列幅はページごとに決めるため、全件を読み込まずに表示を始められます。
+    """
+    header = header or columns
+    for batch in _batched(rows, page_size):
+        cells = [['' if row[c] is None else str(row[c]) for c in columns] for row in batch]
+        widths = [max([_display_width(h)] + [_display_width(line[i]) for line in cells])
+                  for i, h in enumerate(header)]
+        lines = ['  '.join(_pad(h, w) for h, w in zip(header, widths)).rstrip(),
+                 '  '.join('-' * w for w in widths)]
+        lines += ['  '.join(_pad(v, w) for v, w in zip(line, widths)).rstrip() for line in cells]
+        yield '\n'.join(lines) + '\n'
+
+
+# Parquet の列の型（SQLAlchemy の python_type から対応付ける）
+def _arrow_type(pa, python_type):
+    if python_type is int:
+        return pa.int64()
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is datetime.datetime:
+        return pa.timestamp('s')
+    if python_type is datetime.date:
+        return pa.date32()
+    return pa.string()
+
+
+def write_parquet(rows, columns, path, types=None, batch_size=10000):
+    """
+    rows の columns を batch_size 行ごとの行グループとして Parquet ファイルに書き出し、件数を返します。
+    types は {列名: Python の型}（省略した列は文字列）。pyarrow が必要です（requirements-optional.txt の任意の依存）。
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = types or {}
+    schema = pa.schema([(c, _arrow_type(pa, types.get(c, str))) for c in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in _batched(rows, batch_size):
+            data = {c: [row[c] for row in batch] for c in columns}
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            count += len(batch)
+    return count
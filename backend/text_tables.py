@@ -0,0 +1,19 @@
+import jaconv
+
+# --------------------
+# 文字の変換表（外部出力の変換処理と cws_exchange/name_utils.py で共通）
+# --------------------
+# cws_exchange のノートブックは Flask を含まない環境で動くため、このモジュールは jaconv 以外を読み込まず、
+# name_utils.py からはファイルを直接読み込みます（backend パッケージの __init__ を通さない）。
+
+# 全角英数字（Ａ-Ｚ, ａ-ｚ, ０-９）を半角にする
+FULLWIDTH_ALNUM_TABLE = str.maketrans({
+    chr(code): chr(code - 0xFEE0)
+    for start, end in (('Ａ', 'Ｚ'), ('ａ', 'ｚ'), ('０', '９'))
+    for code in range(ord(start), ord(end) + 1)
+})
+
+# 全角カナ（と「・」「ー」などのカナ用の記号）を半角カナにする。jaconv.z2h(kana=True) と同じ結果になる
+KANA_Z2H_TABLE = str.maketrans({
+    c: jaconv.z2h(c) for c in map(chr, range(0x3000, 0x3100)) if jaconv.z2h(c) != c
+})
@@ -0,0 +1,143 @@
+"""
+カードUID検索（/api/cards）の応答時間を測定するベンチマーク
+
+合成データを投入したうえで、複数スレッドから GET /api/cards/<uid> を同時に呼び出し、
+応答時間の p50 / p99 を表示します。比較のため、同じ検索を毎回 DB に問い合わせた場合も測定します。
+続けて1スレッドで、通常時とバックグラウンドでの全件の読み直し中の応答時間を測り、
+p50 / p99 が --target-p50-ms / --target-p99-ms を超えた場合は終了コード 1 で終了します。
+（テストクライアントは同じプロセス内で動くため、複数スレッドでの応答時間には GIL の待ち時間が含まれます。
+目標との比較は1スレッドの測定で行います。）
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.bench_card_lookup --users 100000 --threads 8 --requests 2000
+"""
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+
+from sqlalchemy import select
+
+from backend import create_app
+from backend.extensions import db
+from backend.models import Cards, Positions
+from backend.card_index import card_index, card_select
+from .generator import populate
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_concurrent(worker, threads, requests):
+    """threads 個のスレッドで worker(i) を合計 requests 回呼び出し、各回の所要時間（秒）を返します。"""
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def run(offset):
+        local = []
+        barrier.wait()
+        for i in range(offset, requests, threads):
+            start = time.perf_counter()
+            worker(i)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def report(label, latencies, elapsed):
+    print(f"  {label:<28} p50 {percentile(latencies, 50) * 1000:7.2f} ms"
+          f"  p99 {percentile(latencies, 99) * 1000:7.2f} ms"
+          f"  mean {statistics.mean(latencies) * 1000:7.2f} ms"
+          f"  {len(latencies) / elapsed:9.0f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=500, help="POST /api/cards/resolve の1回あたりの件数")
+    parser.add_argument('--target-p50-ms', type=float, default=2.0, help="GET /api/cards/<uid> の p50 の目標（ミリ秒）")
+    parser.add_argument('--target-p99-ms', type=float, default=10.0, help="GET /api/cards/<uid> の p99 の目標（ミリ秒）")
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"{args.users}件の合成データを投入しています...")
+        populate(args.users)
+
+        start = time.perf_counter()
+        card_index.load(db.session)
+        print(f"索引の読み込み: {len(card_index)}件 {(time.perf_counter() - start) * 1000:.1f} ms")
+        uids = list(db.session.execute(select(Cards.card_uid)).scalars())
+        db.session.rollback()
+
+    rng = random.Random(0)
+    # 1割は存在しないUID（未登録カードのタッチ）
+    targets = [rng.choice(uids) if rng.random() < 0.9 else f'UNKNOWN{i}' for i in range(args.requests)]
+
+    client = app.test_client()
+
+    def via_api(i):
+        response = client.get(f'/api/cards/{targets[i]}')
+        assert response.status_code in (200, 404)
+
+    def via_db(i):
+        with app.app_context():
+            db.session.execute(card_select().where(Cards.card_uid == targets[i])).first()
+
+    def resolve(i):
+        batch = [targets[(i * args.batch + j) % len(targets)] for j in range(args.batch)]
+        response = client.post('/api/cards/resolve', json={'card_uids': batch})
+        assert response.status_code == 200
+
+    print(f"--- {args.threads}スレッド同時実行, {args.requests}リクエスト ---")
+    report('GET /api/cards/<uid>', *run_concurrent(via_api, args.threads, args.requests))
+    report('DB 直接検索（比較用）', *run_concurrent(via_db, args.threads, args.requests))
+    report(f'POST /resolve ({args.batch}件)', *run_concurrent(resolve, args.threads, max(args.threads, args.requests // 100)))
+
+    print(f"--- 1スレッド, {args.requests}リクエスト ---")
+    latencies, elapsed = run_concurrent(via_api, 1, args.requests)
+    report('GET /api/cards/<uid>', latencies, elapsed)
+
+    # マスタの変更（全件の読み直し）を繰り返し起こしながら測定し、読み直しがリクエストを待たせないことを確かめる
+    def via_api_reloading(i):
+        if i % 200 == 0:
+            card_index.mark_dirty({Positions.__tablename__}, None)
+        via_api(i)
+
+    loads = card_index.background_loads
+    reload_latencies, elapsed = run_concurrent(via_api_reloading, 1, args.requests)
+    card_index.wait_refresh()
+    report('GET (全件の読み直し中)', reload_latencies, elapsed)
+    print(f"  測定中のバックグラウンド読み込み: {card_index.background_loads - loads}回")
+
+    failed = []
+    for label, values in (('通常', latencies), ('全件の読み直し中', reload_latencies)):
+        p50, p99 = percentile(values, 50) * 1000, percentile(values, 99) * 1000
+        if p50 > args.target_p50_ms or p99 > args.target_p99_ms:
+            failed.append(f"{label}: p50 {p50:.2f} ms / p99 {p99:.2f} ms")
+    if failed:
+        print(f"NG: GET /api/cards/<uid> が目標（p50 {args.target_p50_ms} ms / p99 {args.target_p99_ms} ms）を超えました"
+              f" ({', '.join(failed)})")
+        sys.exit(1)
+    print("OK: GET /api/cards/<uid> は目標の応答時間内です。")
+
+
+if __name__ == '__main__':
+    main()
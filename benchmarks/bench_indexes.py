@@ -0,0 +1,113 @@
+"""
+セカンダリインデックスの効果を測定するベンチマーク
+
+合成データ（既定 100,000 ユーザー）を投入し、インデックスなし / ありの状態で
+以下の処理時間を比較します。
+
+- 職員番号による Employee_Number_History の検索（import-data の重複チェック）
+- カード管理IDによる Cards の検索
+- 有効なD番号の取得（user_id + is_active）
+- import-data コマンドによる新規データの取り込み
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.bench_indexes --users 100000
+    TEST_DATABASE_URL=mysql+pymysql://... python -m benchmarks.bench_indexes
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import select
+
+from backend import create_app
+from backend.extensions import db
+from backend.models import EmployeeNumberHistory, DNumbers, Cards
+from .generator import populate, write_staff_csv
+
+
+def secondary_indexes():
+    return [index for table in db.metadata.sorted_tables for index in table.indexes]
+
+
+def timed(label, func, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    elapsed = time.perf_counter() - start
+    return label, elapsed, repeat
+
+
+def run_lookups(n_users, repeat, seed=1):
+    rng = random.Random(seed)
+    targets = [rng.randrange(n_users) for _ in range(repeat)]
+    results = [
+        timed('employee_number lookup', lambda i: db.session.execute(
+            select(EmployeeNumberHistory.user_id)
+            .where(EmployeeNumberHistory.employee_number == f'{targets[i]:08d}')
+        ).first(), repeat),
+        timed('card_management_id lookup', lambda i: db.session.execute(
+            select(Cards.user_id).where(Cards.card_management_id == f'CM{targets[i]:08d}')
+        ).first(), repeat),
+        timed('active d_number by user_id', lambda i: db.session.execute(
+            select(DNumbers.d_number)
+            .where(DNumbers.user_id == f'user-{targets[i]:08d}', DNumbers.is_active.is_(True))
+        ).first(), repeat),
+    ]
+    db.session.rollback()
+    return results
+
+
+def run_import(app, n_users, n_rows, tag):
+    """import-data コマンドで n_rows 件の新規職員を取り込む時間を測定します。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'new_comers.csv')
+        write_staff_csv(path, n_rows, start=n_users + (0 if tag == 'before' else n_rows))
+        start = time.perf_counter()
+        app.test_cli_runner().invoke(args=['import-data', path])
+        elapsed = time.perf_counter() - start
+    return 'import-data', elapsed, n_rows
+
+
+def report(title, results):
+    print(f"--- {title} ---")
+    for label, elapsed, count in results:
+        print(f"  {label:<32} {elapsed * 1000:10.1f} ms  ({elapsed / count * 1e6:8.1f} us/件)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--import-rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"{args.users}件の合成データを投入しています...")
+        populate(args.users)
+
+        with db.engine.begin() as conn:
+            for index in secondary_indexes():
+                index.drop(conn)
+        before = run_lookups(args.users, args.lookups)
+        before.append(run_import(app, args.users, args.import_rows, 'before'))
+        report('インデックスなし', before)
+
+        with db.engine.begin() as conn:
+            for index in secondary_indexes():
+                index.create(conn)
+        after = run_lookups(args.users, args.lookups)
+        after.append(run_import(app, args.users, args.import_rows, 'after'))
+        report('インデックスあり', after)
+
+        print("--- 高速化率 ---")
+        for (label, slow, _), (_, fast, _) in zip(before, after):
+            print(f"  {label:<32} x{slow / fast:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+cws_exchange の氏名分割（name_utils）と、ノートブックの1件ずつのループの比較
+
+入退室カードの書き出しと同じ列の合成データ（既定 100,000 行）で、次の処理時間を比較します。
+結果が一致することも確認します（一致しなければ終了コード 1）。
+
+- 漢字氏名の姓・名の分割（for_cws.ipynb / main.ipynb の name_splitter）
+- カナ氏名の分割と半角カナへの変換（name_splitter(for_kana=True)）
+- 所属の全角英数字の半角化（for_cws.ipynb の lambda）
+- 姓・名の連結（phs_merge.ipynb のループ）
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.bench_name_split --rows 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import jaconv
+import numpy as np
+import pandas as pd
+
+from .generator import card_export
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cws_exchange'))
+import name_utils  # noqa: E402
+
+
+# ---- ノートブックの実装（比較用にそのまま写したもの） ----
+
+def legacy_name_splitter(id_, name, new_columns, for_kana=False):
+    l = []
+    for uid, name in zip(id_, name):
+        if type(name) == str:
+            name = name.replace('　　', ' ')
+            name = name.replace('　 ', ' ')
+            name = name.replace(' 　', ' ')
+            name = name.replace('　', ' ')
+            name = name.split(" ")
+        else:
+            name = [name]  # nanの対応
+
+        if for_kana:
+            # ノートブックのままでは NaN で AttributeError になるため、文字列だけを変換する
+            name = [jaconv.z2h(n) if isinstance(n, str) else n for n in name]
+
+        length = len(name)
+        if length >= 3:
+            name = [name[0], (" ").join(name[1:])]
+        elif length == 1:
+            name = name + [np.nan]
+        l.append([uid, name[0], name[1]])
+    return pd.DataFrame(l, columns=new_columns, dtype=object)
+
+
+def legacy_fullwidth_alnum(series):
+    return series.map(
+        lambda x: ''.join(
+            chr(ord(c) - 0xFEE0)
+            if ('Ａ' <= c <= 'Ｚ') or ('ａ' <= c <= 'ｚ') or ('０' <= c <= '９')
+            else c
+            for c in x
+        )
+    )
+
+
+def legacy_join_names(last_names, first_names):
+    lst = []
+    for last_name, first_name in zip(last_names, first_names):
+        if isinstance(last_name, float) and not isinstance(first_name, float):
+            name = first_name
+        elif not isinstance(last_name, float) and isinstance(first_name, float):
+            name = last_name
+        elif isinstance(last_name, float) and isinstance(first_name, float):
+            name = np.nan
+        else:
+            name = last_name + first_name
+        lst.append(name)
+    return pd.Series(lst, dtype=object)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def same(a, b):
+    return a.fillna('<NA>').astype(str).equals(b.fillna('<NA>').astype(str))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--unique', action='store_true',
+                        help='氏名をすべて異なる値にする（重複のない値だけを変換する効果を除いた最悪の場合）。')
+    args = parser.parse_args()
+
+    df = pd.DataFrame(card_export(args.rows)).astype(object)
+    if args.unique:
+        suffix = pd.Series(range(args.rows)).astype(str)
+        df['kanji_name'] = df.kanji_name + suffix
+        df['kana_name'] = df.kana_name + suffix
+        df['job_system2'] = df.job_system2 + suffix
+    df = df.astype(object)
+    df = df.where(df.notna(), np.nan)
+    print(f"{args.rows}行の合成データで比較します。{'（すべて異なる値）' if args.unique else ''}")
+
+    cases = [
+        ('漢字氏名の分割',
+         lambda: legacy_name_splitter(df.UID, df.kanji_name, ['UID', 'family', 'given']),
+         lambda: name_utils.name_splitter(df.UID, df.kanji_name, ['UID', 'family', 'given'])),
+        ('カナ氏名の分割・半角化',
+         lambda: legacy_name_splitter(df.UID, df.kana_name, ['UID', 'family', 'given'], for_kana=True),
+         lambda: name_utils.name_splitter(df.UID, df.kana_name, ['UID', 'family', 'given'], for_kana=True)),
+        ('全角英数字の半角化',
+         lambda: legacy_fullwidth_alnum(df.job_system2).to_frame(),
+         lambda: name_utils.fullwidth_alnum_to_ascii(df.job_system2).to_frame()),
+    ]
+    kanji = name_utils.split_names(df.kanji_name)
+    cases.append(('姓・名の連結',
+                  lambda: legacy_join_names(kanji.family.values, kanji.given.values).to_frame(),
+                  lambda: name_utils.join_names(kanji.family, kanji.given).reset_index(drop=True).to_frame()))
+
+    mismatches = 0
+    print(f"  {'処理':<16} {'ループ':>10} {'name_utils':>12} {'高速化率':>8}")
+    for label, legacy, vectorized in cases:
+        expected, legacy_seconds = timed(legacy)
+        actual, new_seconds = timed(vectorized)
+        ok = all(same(expected.iloc[:, i], actual.iloc[:, i]) for i in range(expected.shape[1]))
+        mismatches += not ok
+        print(f"  {label:<16} {legacy_seconds * 1000:8.1f} ms {new_seconds * 1000:10.1f} ms "
+              f"x{legacy_seconds / new_seconds:7.1f}{'' if ok else '  結果が一致しません'}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
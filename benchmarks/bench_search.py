@@ -0,0 +1,133 @@
+"""
+職員検索（/api/search）の応答時間を測定するベンチマーク
+
+合成データ（既定 100,000 人）を投入して索引を読み込み、検索語の種類ごとに
+索引の検索（SearchIndex.search）と GET /api/search の応答時間の p50 / p95 / p99 を表示します。
+比較のため、氏名・カナの部分一致を毎回 DB の LIKE で検索した場合も測定します。
+索引の検索の p99 が --target-ms を超えた種類があれば終了コード 1 で終了します。
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.bench_search --users 100000 --queries 500
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+import jaconv
+from sqlalchemy import or_
+
+from backend import create_app
+from backend.extensions import db
+from backend.models import User
+from backend.search import search_index, search_select
+from .generator import populate
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def query_sets(records, n, rng):
+    """検索語の種類ごとに、索引の職員から作った検索語を n 個ずつ返します。"""
+    def family(name):
+        return name.split()[0]
+
+    def pick():
+        return rng.choice(records)
+
+    def romaji(kana):
+        return jaconv.kana2alphabet(jaconv.kata2hira(kana.replace('　', ' '))).title()
+
+    sets = {
+        '漢字（姓）': lambda: family(pick()[1]),
+        '漢字（氏名）': lambda: ''.join(pick()[1].split()),
+        '漢字（部分・1文字）': lambda: rng.choice(''.join(pick()[1].split())),
+        'カナ（ひらがな・姓）': lambda: jaconv.kata2hira(family(pick()[2])),
+        '半角カナ（氏名）': lambda: jaconv.z2h(pick()[2]),
+        'ローマ字（姓）': lambda: romaji(family(pick()[2])),
+        'ローマ字（氏名）': lambda: romaji(pick()[2]),
+        'ローマ字（部分）': lambda: romaji(pick()[2]).lower().replace(' ', '')[2:6],
+        '職員番号（先頭）': lambda: pick()[3][:5],
+        'D番号': lambda: pick()[4],
+        'カード管理ID': lambda: next(r[5] for r in iter(pick, None) if r[5]),
+    }
+    return {label: [make() for _ in range(n)] for label, make in sets.items()}
+
+
+def measure(func, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(label, latencies):
+    print(f"  {label:<22} p50 {percentile(latencies, 50) * 1000:7.3f} ms"
+          f"  p95 {percentile(latencies, 95) * 1000:7.3f} ms"
+          f"  p99 {percentile(latencies, 99) * 1000:7.3f} ms"
+          f"  mean {statistics.mean(latencies) * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500, help="検索語の種類ごとの検索回数")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--target-ms', type=float, default=10.0, help="索引の検索の p99 の目標（ミリ秒）")
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"{args.users}件の合成データを投入しています...")
+        populate(args.users)
+
+        search_index.load(db.session)
+        # 測定中は索引を更新しない
+        search_index.configure(refresh_seconds=float('inf'), full_refresh_seconds=float('inf'))
+        print(f"索引の読み込み: {len(search_index)}件 {search_index.stats()['last_load_ms']:.1f} ms")
+        records = [tuple(row) for row in db.session.execute(search_select())]
+        db.session.rollback()
+
+    rng = random.Random(0)
+    sets = query_sets(records, args.queries, rng)
+    client = app.test_client()
+
+    def via_api(query):
+        response = client.get('/api/search', query_string={'q': query, 'limit': args.limit})
+        assert response.status_code == 200
+
+    def via_db(query):
+        pattern = f'%{query}%'
+        with app.app_context():
+            db.session.execute(
+                search_select().where(or_(User.name.like(pattern), User.name_kana.like(pattern))).limit(args.limit)
+            ).all()
+
+    failed = []
+    for label, queries in sets.items():
+        hits = statistics.mean(len(search_index.search(q, args.limit)) for q in queries)
+        print(f"--- {label}（例: {queries[0]}, 平均 {hits:.1f} 件）---")
+        latencies = measure(lambda q: search_index.search(q, args.limit), queries)
+        report('SearchIndex.search', latencies)
+        report('GET /api/search', measure(via_api, queries))
+        if percentile(latencies, 99) * 1000 > args.target_ms:
+            failed.append(label)
+
+    # DB の LIKE はサイズが大きいと遅いため、一部の検索語だけで比較する
+    print("--- 比較用: DB の LIKE '%...%'（漢字（姓）の先頭 20 語）---")
+    report('DB LIKE', measure(via_db, sets['漢字（姓）'][:20]))
+
+    if failed:
+        print(f"p99 が {args.target_ms} ms を超えた検索語: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+接続プールのリーク確認
+
+合成データを投入した SQLite ファイル（または TEST_DATABASE_URL の DB）に対して、
+複数スレッドから主要なエンドポイントを同時に呼び出し、終了後に
+
+- 貸し出し中の接続（checked_out）が 0 に戻っていること
+- 接続の取得がタイムアウトしていないこと
+- 5xx 応答がないこと
+
+を確認します。問題があれば終了コード 1 で終わります。
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.check_pool_leaks --threads 16 --requests 2000
+    DB_POOL_SIZE=2 DB_MAX_OVERFLOW=0 python -m benchmarks.check_pool_leaks   # 待ちが発生する設定
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+# backend.config は読み込み時に環境変数を参照するため、インポートより前に設定する
+_DB_PATH = os.path.join(tempfile.gettempdir(), 'staff_db_pool_check.sqlite')
+os.environ.setdefault('TEST_DATABASE_URL', f'sqlite:///{_DB_PATH}')
+
+from backend import create_app  # noqa: E402
+from backend.extensions import db  # noqa: E402
+from backend.pool import pool_status  # noqa: E402
+from .generator import populate  # noqa: E402
+from .bench_card_lookup import run_concurrent  # noqa: E402
+
+PATHS = [
+    '/health',
+    '/api/users/',
+    '/api/users/?limit=50',
+    '/api/users/?limit=20&sort=-name',
+    '/api/users/export?format=ndjson',
+    '/api/cards/{card_uid}',
+    '/api/users/?limit=0',  # 400 を返す（エラー時も接続が返却されること）
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        populate(args.users)
+
+    client = app.test_client()
+    rng = random.Random(0)
+    paths = [rng.choice(PATHS).format(card_uid=f'{rng.randrange(args.users):016X}') for _ in range(args.requests)]
+    failures = []
+
+    def call(i):
+        response = client.get(paths[i])
+        response.get_data()
+        response.close()
+        if response.status_code >= 500:
+            failures.append((paths[i], response.status_code))
+
+    latencies, elapsed = run_concurrent(call, args.threads, args.requests)
+
+    with app.app_context():
+        status = pool_status(db.engine)
+    print(f"{len(latencies)}リクエスト / {elapsed:.1f}秒, {args.threads}スレッド")
+    print(f"接続プール: {status}")
+
+    problems = []
+    if status.get('checked_out', 0) != 0:
+        problems.append(f"返却されていない接続があります: {status['checked_out']}")
+    if status.get('timeouts', 0):
+        problems.append(f"接続の取得がタイムアウトしました: {status['timeouts']}回")
+    if failures:
+        problems.append(f"5xx 応答: {len(failures)}件 (例: {failures[0]})")
+
+    for problem in problems:
+        print(f"NG: {problem}")
+    if problems:
+        sys.exit(1)
+    print("OK: 接続のリークはありません。")
+
+
+if __name__ == '__main__':
+    main()
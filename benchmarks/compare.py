@@ -0,0 +1,85 @@
+"""
+ベンチマーク結果（run.py の JSON）の比較
+
+基準の結果と新しい結果を (測定項目, ユーザー数) ごとに突き合わせ、所要時間の比を表示します。
+しきい値を超えて遅くなった項目があれば終了コード 1 で終わるため、CI の回帰チェックに使えます。
+ごく短い測定はぶれが大きいため、--min-ms 未満の項目は判定から除きます。
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.compare benchmarks/results/<基準>.json benchmarks/results/<新>.json
+    python -m benchmarks.compare before.json after.json --threshold 0.2
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data, {(r['name'], r['users']): r for r in data['results']}
+
+
+def describe(data):
+    commit = (data.get('commit') or 'unknown')[:12]
+    dirty = ' (未コミットの変更あり)' if data.get('dirty') else ''
+    env = data.get('environment', {})
+    return f"{commit}{dirty} / {env.get('database')} / Python {env.get('python')} / {data.get('created_at')}"
+
+
+def compare(base, head, threshold, min_ms):
+    """[(名前, ユーザー数, 基準秒, 新秒, 比, 判定), ...] を返します。判定は 'regression' / 'improvement' / '' / 'new' / 'removed'。"""
+    rows = []
+    for key in sorted(set(base) | set(head), key=lambda k: (k[1], k[0])):
+        name, users = key
+        if key not in head:
+            rows.append((name, users, base[key]['seconds'], None, None, 'removed'))
+            continue
+        if key not in base:
+            rows.append((name, users, None, head[key]['seconds'], None, 'new'))
+            continue
+        before, after = base[key]['seconds'], head[key]['seconds']
+        ratio = after / before if before > 0 else None
+        verdict = ''
+        if ratio is not None and max(before, after) * 1000 >= min_ms:
+            if ratio > 1 + threshold:
+                verdict = 'regression'
+            elif ratio < 1 / (1 + threshold):
+                verdict = 'improvement'
+        rows.append((name, users, before, after, ratio, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base', help='基準の結果（JSON）')
+    parser.add_argument('head', help='新しい結果（JSON）')
+    parser.add_argument('--threshold', type=float, default=0.1, help='回帰とみなす遅くなった割合（0.1 = 10%%）。')
+    parser.add_argument('--min-ms', type=float, default=5.0, help='判定の対象とする最小の所要時間（ミリ秒）。')
+    args = parser.parse_args()
+
+    base_data, base = load(args.base)
+    head_data, head = load(args.head)
+    print(f"基準: {describe(base_data)}")
+    print(f"新  : {describe(head_data)}")
+    if base_data.get('environment', {}).get('database') != head_data.get('environment', {}).get('database'):
+        print("警告: データベースの種類が異なるため、比較結果は参考値です。")
+
+    labels = {'regression': '遅くなった', 'improvement': '速くなった', 'new': '新規', 'removed': '削除'}
+    rows = compare(base, head, args.threshold, args.min_ms)
+    for name, users, before, after, ratio, verdict in rows:
+        before_text = '-' if before is None else f'{before * 1000:.1f}'
+        after_text = '-' if after is None else f'{after * 1000:.1f}'
+        ratio_text = '-' if ratio is None else f'x{ratio:.2f}'
+        print(f"  {name:<28} {users:>7} {before_text:>12} ms -> {after_text:>12} ms  {ratio_text:>7}  "
+              f"{labels.get(verdict, '')}")
+
+    regressions = [row for row in rows if row[5] == 'regression']
+    if regressions:
+        print(f"NG: {len(regressions)}件の項目が {args.threshold:.0%} を超えて遅くなりました。")
+        sys.exit(1)
+    print("OK: 回帰はありません。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+ベンチマーク用の合成データ生成
+
+同じ seed からは常に同じデータを生成します（サイズの異なるデータ同士でも、先頭の職員は同じ）。
+キーの形式は次の通りで、ベンチマークからは番号で直接引けます。
+
+    user_id             user-00000042
+    職員番号（現在）      00000042   （過去の職員番号は 9 から始まる）
+    D番号               D0000042
+    カードUID            000000000000002A（16進16桁）
+    カード管理ID         CM00000042
+"""
+import csv
+import datetime
+import random
+import re
+
+from sqlalchemy import insert
+
+from backend.extensions import db
+from backend.models import (
+    User, EmployeeNumberHistory, Positions, Departments, UserDepartment, DNumbers, Cards, System_IDs,
+)
+
+SIZES = {'1k': 1000, '10k': 10000, '100k': 100000}
+
+N_POSITIONS = 50
+N_DEPARTMENTS = 200
+
+FAMILY_NAMES = [
+    '佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤',
+    '吉田', '山田', '佐々木', '山口', '松本', '井上', '木村', '林', '斎藤', '清水',
+    '山崎', '森', '池田', '橋本', '阿部', '石川', '山下', '中島', '石井', '小川',
+    '前田', '岡田', '長谷川', '藤田', '後藤', '近藤', '村上', '遠藤', '青木', '坂本',
+]
+GIVEN_NAMES = [
+    '太郎', '次郎', '大輔', '健太', '翔太', '拓也', '直樹', '和也', '誠', '亮',
+    '花子', '陽子', '美咲', '彩', '愛', '真由美', '恵', '由美子', 'さくら', '葵',
+    '蓮', '湊', '陽翔', '樹', '悠真', '結衣', '陽菜', 'ひなた', '凛', '美月',
+]
+POSITION_NAMES = [
+    '医師', '研修医', '看護師', '准看護師', '看護助手', '薬剤師', '臨床検査技師', '診療放射線技師',
+    '理学療法士', '作業療法士', '言語聴覚士', '臨床工学技士', '管理栄養士', '事務員', '医療ソーシャルワーカー',
+]
+DEPARTMENT_NAMES = [
+    '内科', '外科', '小児科', '産婦人科', '整形外科', '眼科', '耳鼻咽喉科', '皮膚科', '泌尿器科', '精神科',
+    '放射線科', '麻酔科', '救急科', '病理診断科', '薬剤部', '看護部', '検査部', 'リハビリテーション部',
+    '医事課', '総務課',
+]
+# 読み（カナ氏名用）
+NAME_KANA = {
+    '佐藤': 'サトウ', '鈴木': 'スズキ', '高橋': 'タカハシ', '田中': 'タナカ', '伊藤': 'イトウ',
+    '渡辺': 'ワタナベ', '山本': 'ヤマモト', '中村': 'ナカムラ', '小林': 'コバヤシ', '加藤': 'カトウ',
+    '吉田': 'ヨシダ', '山田': 'ヤマダ', '佐々木': 'ササキ', '山口': 'ヤマグチ', '松本': 'マツモト',
+    '井上': 'イノウエ', '木村': 'キムラ', '林': 'ハヤシ', '斎藤': 'サイトウ', '清水': 'シミズ',
+    '山崎': 'ヤマザキ', '森': 'モリ', '池田': 'イケダ', '橋本': 'ハシモト', '阿部': 'アベ',
+    '石川': 'イシカワ', '山下': 'ヤマシタ', '中島': 'ナカジマ', '石井': 'イシイ', '小川': 'オガワ',
+    '前田': 'マエダ', '岡田': 'オカダ', '長谷川': 'ハセガワ', '藤田': 'フジタ', '後藤': 'ゴトウ',
+    '近藤': 'コンドウ', '村上': 'ムラカミ', '遠藤': 'エンドウ', '青木': 'アオキ', '坂本': 'サカモト',
+    '太郎': 'タロウ', '次郎': 'ジロウ', '大輔': 'ダイスケ', '健太': 'ケンタ', '翔太': 'ショウタ',
+    '拓也': 'タクヤ', '直樹': 'ナオキ', '和也': 'カズヤ', '誠': 'マコト', '亮': 'リョウ',
+    '花子': 'ハナコ', '陽子': 'ヨウコ', '美咲': 'ミサキ', '彩': 'アヤ', '愛': 'アイ',
+    '真由美': 'マユミ', '恵': 'メグミ', '由美子': 'ユミコ', 'さくら': 'サクラ', '葵': 'アオイ',
+    '蓮': 'レン', '湊': 'ミナト', '陽翔': 'ハルト', '樹': 'イツキ', '悠真': 'ユウマ',
+    '結衣': 'ユイ', '陽菜': 'ヒナ', 'ひなた': 'ヒナタ', '凛': 'リン', '美月': 'ミヅキ',
+}
+# 氏名の区切り（実データには半角・全角スペースが混在する）
+SEPARATORS = [' ', ' ', '　']
+
+
+def japanese_name(rng):
+    return f'{rng.choice(FAMILY_NAMES)}{rng.choice(SEPARATORS)}{rng.choice(GIVEN_NAMES)}'
+
+
+def japanese_name_with_kana(rng):
+    """(漢字氏名, 全角カナ氏名) を返します。区切りは漢字・カナで同じです。"""
+    family, given, separator = rng.choice(FAMILY_NAMES), rng.choice(GIVEN_NAMES), rng.choice(SEPARATORS)
+    return f'{family}{separator}{given}', f'{NAME_KANA[family]}{separator}{NAME_KANA[given]}'
+
+
+def kana_of(name):
+    """japanese_name の漢字氏名を全角カナにします（区切りはそのまま）。"""
+    family, separator, given = re.split(r'(\s)', name, maxsplit=1)
+    return f'{NAME_KANA[family]}{separator}{NAME_KANA[given]}'
+
+
+def positions():
+    return [
+        {'position_id': i, 'position_name': f'{POSITION_NAMES[(i - 1) % len(POSITION_NAMES)]}{(i - 1) // len(POSITION_NAMES) + 1}'}
+        for i in range(1, N_POSITIONS + 1)
+    ]
+
+
+def departments():
+    base = datetime.date(2000, 4, 1)
+    rows = []
+    for i in range(1, N_DEPARTMENTS + 1):
+        name = f'{DEPARTMENT_NAMES[(i - 1) % len(DEPARTMENT_NAMES)]}{(i - 1) // len(DEPARTMENT_NAMES) + 1}'
+        # 1割の部署は廃止済み（end_date あり）
+        end_date = base + datetime.timedelta(days=365 * 20) if i % 10 == 0 else None
+        rows.append({'department_id': i, 'department_name': name, 'start_date': base, 'end_date': end_date,
+                     'department_extension_number': f'{1000 + i}'})
+    return rows
+
+
+def staff(n_users, seed=0, start=0):
+    """
+    start 番目から n_users 人分の職員データを、テーブルごとのレコードのリストで返します。
+    職員 i の内容は i と seed だけで決まります。
+    """
+    data = {model: [] for model in (User, EmployeeNumberHistory, DNumbers, Cards, UserDepartment, System_IDs)}
+    for i in range(start, start + n_users):
+        rng = random.Random(seed * 1_000_003 + i)
+        user_id = f'user-{i:08d}'
+        hire_date = datetime.date(2000, 4, 1) + datetime.timedelta(days=rng.randrange(9000))
+        birthday = hire_date - datetime.timedelta(days=365 * rng.randint(22, 40) + rng.randrange(365))
+        name = japanese_name(rng)
+        data[User].append({'user_id': user_id, 'name': name, 'name_kana': kana_of(name),
+                           'birthday': birthday, 'hire_date': hire_date})
+
+        # 職員番号の履歴: 3割は1回、1割は2回の変更（職種変更・再雇用など）を経ている
+        n_history = 1 + (rng.random() < 0.3) + (rng.random() < 0.1)
+        start_date = hire_date
+        for h in range(n_history - 1, -1, -1):
+            current = h == 0
+            end_date = None if current else start_date + datetime.timedelta(days=rng.randint(180, 1500))
+            data[EmployeeNumberHistory].append({
+                'user_id': user_id,
+                'employee_number': f'{i:08d}' if current else f'9{h}{i:06d}'[-8:],
+                'position_id': rng.randint(1, N_POSITIONS),
+                'start_date': start_date,
+                'end_date': end_date,
+            })
+            if end_date is not None:
+                start_date = end_date + datetime.timedelta(days=1)
+
+        # D番号: 1割は失効した旧番号を持つ
+        if rng.random() < 0.1:
+            data[DNumbers].append({'user_id': user_id, 'd_number': f'X{i:07d}', 'is_active': False})
+        data[DNumbers].append({'user_id': user_id, 'd_number': f'D{i:07d}', 'is_active': True})
+
+        # カード: 7割が所持
+        if i % 10 < 7:
+            data[Cards].append({'card_uid': f'{i:016X}', 'user_id': user_id,
+                                'card_management_id': f'CM{i:08d}', 'is_active': True})
+
+        data[UserDepartment].append({'user_id': user_id, 'department_id': rng.randint(1, N_DEPARTMENTS)})
+
+        if rng.random() < 0.5:
+            data[System_IDs].append({'user_id': user_id, 'system_id': f'S{i:07d}', 'is_active': True})
+    return data
+
+
+def populate(n_users, seed=0, chunk_size=10000, include=None):
+    """
+    マスターと n_users 人分の職員データを Core の executemany でまとめて投入します。
+    include にモデルのリストを渡すと、職員データはそのテーブルだけを投入します。
+    """
+    db.session.execute(insert(Positions), positions())
+    db.session.execute(insert(Departments), departments())
+    for start in range(0, n_users, chunk_size):
+        data = staff(min(chunk_size, n_users - start), seed, start)
+        for model, records in data.items():
+            if records and (include is None or model in include):
+                db.session.execute(insert(model), records)
+    db.session.commit()
+
+
+# --------------------
+# CLI コマンドの入力ファイル
+# --------------------
+
+def write_positions_csv(path):
+    """import-positions 用（ヘッダーなし, ID, 名前）"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for row in positions():
+            writer.writerow([row['position_id'], row['position_name']])
+
+
+def write_departments_csv(path):
+    """import-departments 用（ヘッダーなし, ID, 名前）"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        for row in departments():
+            writer.writerow([row['department_id'], row['department_name']])
+
+
+def write_staff_csv(path, n_users, seed=0, start=0):
+    """import-data 用（new_comers.csv と同じ列）"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['', 'd_number', 'name', 'employee_number', 'Birthday',
+                         'position_id', 'department_id', 'hire_date', 'name_kana'])
+        for offset in range(0, n_users, 10000):
+            data = staff(min(10000, n_users - offset), seed, start + offset)
+            current = {r['user_id']: r for r in data[EmployeeNumberHistory] if r['end_date'] is None}
+            d_numbers = {r['user_id']: r for r in data[DNumbers] if r['is_active']}
+            depts = {r['user_id']: r for r in data[UserDepartment]}
+            for i, user in enumerate(data[User], start=offset):
+                user_id = user['user_id']
+                writer.writerow([
+                    i, d_numbers[user_id]['d_number'], user['name'], current[user_id]['employee_number'],
+                    user['birthday'].isoformat(), current[user_id]['position_id'],
+                    depts[user_id]['department_id'], user['hire_date'].isoformat(), user['name_kana'],
+                ])
+
+
+def write_cards_csv(path, n_users, seed=0, start=0):
+    """import-cards 用（ヘッダー付き, user_id, card_uid, card_management_id）。書き出した件数を返します。"""
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['user_id', 'card_uid', 'card_management_id'])
+        for offset in range(0, n_users, 10000):
+            for card in staff(min(10000, n_users - offset), seed, start + offset)[Cards]:
+                writer.writerow([card['user_id'], card['card_uid'], card['card_management_id']])
+                count += 1
+    return count
+
+
+def write_phone_csv(path, n_rows, seed=0):
+    """CWS 前処理用の内線・PHS 一覧（cp932, ヘッダーなし, 部署, 氏名, 番号, 直通番号）"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='cp932') as f:
+        writer = csv.writer(f)
+        for i in range(n_rows):
+            writer.writerow([
+                rng.choice(DEPARTMENT_NAMES), japanese_name(rng), f'{rng.randint(1000, 9999)}',
+                f'03-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}' if rng.random() < 0.3 else '',
+            ])
+
+
+def card_export(n_rows, seed=0):
+    """
+    入退室カードの書き出し（nyutai_data の列）を辞書のリストで返します。
+    氏名は漢字・全角カナで、1割は名がなく、1%は空欄です。
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_rows):
+        kanji, kana = japanese_name_with_kana(rng)
+        roll = rng.random()
+        if roll < 0.01:
+            kanji = kana = None
+        elif roll < 0.11:
+            # 姓だけ（区切りより前）
+            kanji, kana = kanji.replace('　', ' ').split(' ')[0], kana.replace('　', ' ').split(' ')[0]
+        rows.append({
+            'UID': f'{i:016X}',
+            'staff_number': f'{i:08d}',
+            'kanji_name': kanji,
+            'kana_name': kana,
+            'dept': rng.choice(DEPARTMENT_NAMES),
+            'job': rng.choice(POSITION_NAMES),
+            # 所属は全角英数字を含む（例: 内科・Ｂ３病棟）
+            'job_system2': f'{rng.choice(DEPARTMENT_NAMES)}・{chr(0xFF21 + rng.randrange(4))}{chr(0xFF10 + rng.randrange(10))}病棟',
+            'issue_date': (datetime.date(2015, 4, 1) + datetime.timedelta(days=rng.randrange(3650))).strftime('%Y/%m/%d'),
+        })
+    return rows
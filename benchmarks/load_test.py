@@ -0,0 +1,169 @@
+"""
+gunicorn（backend/gunicorn.conf.py）の負荷試験
+
+ワーカー数を変えながら gunicorn を起動し、複数スレッドから /api/users/ と /health を
+一定時間呼び続けて、毎秒リクエスト数と応答時間（p50 / p90 / p99 / 最大）を表示します。
+
+既定では合成データを投入した SQLite ファイルを使います。起動済みのサーバーを測定する場合は
+--url を指定します（この場合 --workers は無視されます）。
+
+使い方（リポジトリのルートで実行）:
+    python -m benchmarks.load_test --workers 1,2,4 --users 10000 --duration 10
+    python -m benchmarks.load_test --url http://localhost:5000 --concurrency 32
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+# backend.config は読み込み時に環境変数を参照するため、インポートより前に設定する
+_DB_PATH = os.path.join(tempfile.gettempdir(), 'staff_db_load_test.sqlite')
+os.environ.setdefault('TEST_DATABASE_URL', f'sqlite:///{_DB_PATH}')
+
+from backend import create_app  # noqa: E402
+from backend.extensions import db  # noqa: E402
+from .generator import populate  # noqa: E402
+from .bench_card_lookup import percentile  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUNICORN_CONF = os.path.join(ROOT, 'backend', 'gunicorn.conf.py')
+
+
+def prepare_database(n_users):
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"{n_users}件の合成データを投入しています... ({os.environ['TEST_DATABASE_URL']})")
+        populate(n_users)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn が起動しませんでした。")
+
+
+def start_server(workers, threads, port):
+    env = dict(os.environ,
+               FLASK_CONFIG='testing',
+               GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads),
+               # 測定中にワーカーが入れ替わって接続が切れないようにする
+               GUNICORN_MAX_REQUESTS='0',
+               GUNICORN_LOGLEVEL='warning')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', GUNICORN_CONF, '--access-logfile', '/dev/null'],
+        env=env, cwd=ROOT,
+    )
+    try:
+        wait_until_ready('127.0.0.1', port)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+def hammer(host, port, path, concurrency, duration):
+    """concurrency 本の keep-alive 接続から duration 秒間 path を呼び続けます。"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def run():
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    pool = [threading.Thread(target=run) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies, sum(errors), time.monotonic() - started
+
+
+def report(label, path, latencies, errors, elapsed):
+    if not latencies:
+        print(f"  {label:<10} {path:<14} 応答なし（エラー {errors}件）")
+        return
+    ms = [v * 1000 for v in latencies]
+    print(f"  {label:<10} {path:<14} {len(ms) / elapsed:8.1f} req/s"
+          f"  p50 {percentile(ms, 50):7.1f}  p90 {percentile(ms, 90):7.1f}"
+          f"  p99 {percentile(ms, 99):7.1f}  max {max(ms):7.1f} ms  エラー {errors}件")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help='測定する起動済みサーバー（省略時は gunicorn を起動）')
+    parser.add_argument('--workers', default='1,2,4', help='試すワーカー数（カンマ区切り）')
+    parser.add_argument('--threads', type=int, default=4, help='ワーカーあたりのスレッド数')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=16, help='同時接続数')
+    parser.add_argument('--duration', type=float, default=10, help='エンドポイントごとの測定秒数')
+    parser.add_argument('--paths', default='/api/users/,/health', help='測定するパス（カンマ区切り）')
+    args = parser.parse_args()
+    paths = [p for p in args.paths.split(',') if p]
+
+    print(f"--- 同時接続 {args.concurrency}, 各 {args.duration:.0f}秒 ---")
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        for path in paths:
+            report('external', path, *hammer(url.hostname, url.port or 80, path, args.concurrency, args.duration))
+        return
+
+    prepare_database(args.users)
+    for workers in [int(w) for w in args.workers.split(',')]:
+        port = free_port()
+        server = start_server(workers, args.threads, port)
+        try:
+            for path in paths:
+                # 1回目のリクエストでキャッシュが作られるため、先に温めておく
+                hammer('127.0.0.1', port, path, 1, 0.5)
+                label = f"{workers}w x {args.threads}t"
+                report(label, path, *hammer('127.0.0.1', port, path, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,24 @@
-import numpy as np
 import pandas as pd
 
-def main():
-    df_phs = pd.read_csv("data/phs_data.csv", encoding="cp932", header=None, dtype=object)
-    df_phs.columns = ["dept", "name", "phone_number"]
-    df_phs["direct_phone_number"] = np.nan
-    df_phs.to_csv("data/phs_data_unicode.csv", encoding="utf-8", index=False)
+# 一度に読み込む行数（ファイル全体をメモリに載せない）
+CHUNK_SIZE = 10000
+
+
+def convert_to_unicode(src, dst, columns, chunk_size=CHUNK_SIZE):
+    """cp932 のヘッダーなしCSVを chunk_size 行ずつ UTF-8 に変換して書き出します。"""
+    with pd.read_csv(src, encoding="cp932", header=None, dtype=object, chunksize=chunk_size) as reader:
+        for i, df in enumerate(reader):
+            df.columns = columns[:df.shape[1]]
+            df = df.reindex(columns=columns)
+            df.to_csv(dst, encoding="utf-8", index=False, mode="w" if i == 0 else "a", header=(i == 0))
 
-    df_naisen = pd.read_csv("data/naisen_data.csv", encoding="cp932", header=None, dtype=object)
-    df_naisen.columns = ["dept", "name", "phone_number", "direct_phone_number"]
-    df_naisen.to_csv("data/naisen_data_unicode.csv", encoding="utf-8", index=False)
+
+def main():
+    convert_to_unicode("data/phs_data.csv", "data/phs_data_unicode.csv",
+                       ["dept", "name", "phone_number", "direct_phone_number"])
+    convert_to_unicode("data/naisen_data.csv", "data/naisen_data_unicode.csv",
+                       ["dept", "name", "phone_number", "direct_phone_number"])
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,170 @@
+"""氏名の正規化と姓・名の分割
+
+ノートブック（for_cws.ipynb / main.ipynb / phs_merge.ipynb）で1件ずつ行っていた
+全角スペースの置換・姓名の分割・全角英数字や全角カナの変換を、pandas の .str による
+列単位の処理と、読み込み時に1回だけ作る変換表（str.maketrans）で行います。
+同じ氏名・所属は何度も現れるため、変換は重複のない値（pd.factorize）に対して1回だけ行い、
+結果を元の行に配り直します。
+
+    >>> import pandas as pd
+    >>> split_names(pd.Series(['山田　太郎', '佐藤 花子 ミドル', '鈴木', None])).values.tolist()
+    [['山田', '太郎'], ['佐藤', '花子 ミドル'], ['鈴木', nan], [nan, nan]]
+    >>> split_names(pd.Series(['ヤマダ　タロウ']), for_kana=True).values.tolist()
+    [['ﾔﾏﾀﾞ', 'ﾀﾛｳ']]
+"""
+import importlib.util
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+# 区切りとみなす空白（全角スペース・タブ・ノーブレークスペース）を半角スペースにする
+SPACE_TABLE = str.maketrans({'\u3000': ' ', '\t': ' ', '\u00a0': ' '})
+
+
+def _load_text_tables():
+    """
+    全角英数字・全角カナの変換表を backend/text_tables.py から読み込みます（外部出力の変換処理と同じ表を使う）。
+    backend パッケージの __init__ は Flask を読み込むため、ファイルを直接読み込みます。
+    """
+    path = Path(__file__).resolve().parent.parent / 'backend' / 'text_tables.py'
+    spec = importlib.util.spec_from_file_location('staff_db_text_tables', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+_text_tables = _load_text_tables()
+# 全角英数字（Ａ-Ｚ, ａ-ｚ, ０-９）を半角にする
+FULLWIDTH_ALNUM_TABLE = _text_tables.FULLWIDTH_ALNUM_TABLE
+# 全角カナ（と「・」「ー」などのカナ用の記号）を半角カナにする。jaconv.z2h(kana=True) と同じ結果になる
+KANA_Z2H_TABLE = _text_tables.KANA_Z2H_TABLE
+
+# 連続する空白は1つの区切りとみなす
+_SPACES = r' {2,}'
+# SPACE_TABLE で半角にする空白
+_OTHER_SPACES = '[\u3000\t\u00a0]'
+
+
+def _as_series(values) -> pd.Series:
+    if not isinstance(values, (pd.Series, pd.Index, np.ndarray, list)):
+        values = list(values)
+    return pd.Series(values, dtype=object)
+
+
+def _spread(converted: pd.Series, codes: np.ndarray) -> np.ndarray:
+    """重複のない値ごとの結果を、pd.factorize の codes で元の行の順に配り直します（-1 は NaN）。"""
+    result = np.full(len(codes), np.nan, dtype=object)
+    present = codes >= 0
+    result[present] = converted.to_numpy(dtype=object)[codes[present]]
+    return result
+
+
+def _map_unique(values: pd.Series, func) -> pd.Series:
+    """重複のない値だけに func（Series -> Series）を適用し、元の行の順に戻します。NaN は NaN のままです。"""
+    codes, uniques = pd.factorize(values)
+    converted = func(pd.Series(uniques, dtype=object))
+    return pd.Series(_spread(converted, codes), index=values.index, dtype=object)
+
+
+def normalize_spaces(names: pd.Series) -> pd.Series:
+    """全角スペースなどを半角スペースにそろえ、連続する空白を1つにして前後の空白を除きます。
+
+    Args:
+        names (pd.Series): 氏名（文字列以外の値はそのまま）
+
+    Returns:
+        pd.Series: 正規化した氏名
+
+    >>> normalize_spaces(pd.Series(['山田　　太郎', ' 佐藤 　花子 '])).tolist()
+    ['山田 太郎', '佐藤 花子']
+    """
+    return _map_unique(names, lambda u: u.str.translate(SPACE_TABLE).str.replace(_SPACES, ' ', regex=True).str.strip())
+
+
+def to_halfwidth_kana(names: pd.Series) -> pd.Series:
+    """全角カナを半角カナにします（jaconv.z2h の既定と同じく、英数字は変換しません）。
+
+    >>> to_halfwidth_kana(pd.Series(['ガッコウ・テスト', 'ＡＢＣ'])).tolist()
+    ['ｶﾞｯｺｳ･ﾃｽﾄ', 'ＡＢＣ']
+    """
+    return _map_unique(names, lambda u: u.str.translate(KANA_Z2H_TABLE))
+
+
+def fullwidth_alnum_to_ascii(values: pd.Series) -> pd.Series:
+    """全角英数字を半角にします（それ以外の文字は変換しません）。
+
+    >>> fullwidth_alnum_to_ascii(pd.Series(['マスターＢ', '４西病棟', None])).tolist()
+    ['マスターB', '4西病棟', nan]
+    """
+    return _map_unique(values, lambda u: u.str.translate(FULLWIDTH_ALNUM_TABLE))
+
+
+def split_names(names: pd.Series, for_kana: bool = False) -> pd.DataFrame:
+    """氏名を最初の空白で姓と名に分けます。
+
+    空白が2つ以上ある場合は、最初の1つを姓、残りを名とします。
+    空白がない場合は名を NaN に、氏名が文字列でない（NaN など）か空白だけの場合は姓・名とも NaN にします。
+    ノートブックの name_splitter と違い、連続する空白や前後の空白は区切りとして数えません。
+
+    Args:
+        names (pd.Series): 氏名
+        for_kana (bool, optional): 全角カナを半角カナに変換するかどうか. Defaults to False.
+
+    Returns:
+        pd.DataFrame: names と同じインデックスの family / given 列
+    """
+    names = _as_series(names)
+    codes, uniques = pd.factorize(names)
+    text = pd.Series(uniques, dtype=object)
+    if for_kana:
+        text = text.str.translate(KANA_Z2H_TABLE)
+    # 区切りなしの split は全角スペースを含む連続した空白を1つの区切りとみなし、前後の空白も無視する
+    # （文字列でない値は NaN、空白だけの値は空のリストになり、姓・名とも NaN になる）
+    parts = text.str.split(n=1)
+    family = parts.str[0]
+    given = parts.str[1]
+    # 3つ以上に分かれる氏名だけ、名に残った全角スペースなどを半角にする
+    spaced = given.str.contains(_OTHER_SPACES, regex=True, na=False)
+    if spaced.any():
+        given[spaced] = given[spaced].str.translate(SPACE_TABLE)
+
+    return pd.DataFrame({
+        'family': _spread(family, codes),
+        'given': _spread(given, codes),
+    }, index=names.index, dtype=object)
+
+
+def name_splitter(id_: Iterable, name: Iterable, new_columns: list, for_kana: bool = False) -> pd.DataFrame:
+    """氏名を姓と名に分ける（ノートブックの name_splitter と同じ引数・戻り値）
+
+    Args:
+        id_ (Iterable): マージするためのID
+        name (Iterable): 氏名
+        new_columns (list): 新しいカラム名（ID, 姓, 名）
+        for_kana (bool, optional): 全角カナを半角カナに変換するかどうか. Defaults to False.
+
+    Returns:
+        pd.DataFrame: 姓名を分けたDataFrame
+
+    >>> name_splitter(['D1', 'D2'], ['山田　太郎', '鈴木'], ['D_number', 'family', 'first']).values.tolist()
+    [['D1', '山田', '太郎'], ['D2', '鈴木', nan]]
+    """
+    split = split_names(_as_series(name).reset_index(drop=True), for_kana=for_kana)
+    df_new = pd.DataFrame({
+        new_columns[0]: _as_series(id_).to_numpy(),
+        new_columns[1]: split['family'].to_numpy(),
+        new_columns[2]: split['given'].to_numpy(),
+    }, dtype=object)
+    return df_new
+
+
+def join_names(family: pd.Series, given: pd.Series) -> pd.Series:
+    """姓と名を区切りなしで連結します。片方が NaN の場合はもう片方だけ、両方 NaN の場合は NaN にします。
+
+    >>> join_names(pd.Series(['山田', None, '鈴木', None]), pd.Series(['太郎', '花子', None, None])).tolist()
+    ['山田太郎', '花子', '鈴木', nan]
+    """
+    joined = family.fillna('') + given.fillna('')
+    return joined.where(family.notna() | given.notna(), np.nan)
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import ReactDOM from 'react-dom/client';
 
 // ▼ 1. カラム定義に追加
@@ -15,26 +15,148 @@ const COLUMNS = {
   card_management_id: "カード管理ID" // 追加
 };
 
-const escapeCSV = (str) => {
-  if (str === null || str === undefined) {
-    return "";
-  }
-  const s = String(str);
-  if (s.includes('"') || s.includes(',') || s.includes('\n')) {
-    return `"${s.replace(/"/g, '""')}"`;
+// 1回のリクエストで取得する件数
+const PAGE_SIZE = 200;
+
+// 列形式（?format=columns）のレスポンスを行の配列に戻す
+// 辞書で符号化されたカラム（部署名・職種名）は番号を辞書の値に置き換える
+const decodeColumns = (payload) => {
+  const { columns, length, data, dictionaries } = payload;
+  const rows = new Array(length);
+  for (let i = 0; i < length; i++) {
+    const row = {};
+    for (const column of columns) {
+      const value = data[column][i];
+      const dictionary = dictionaries[column];
+      row[column] = dictionary && value !== null ? dictionary[value] : value;
+    }
+    rows[i] = row;
   }
-  return s;
+  return rows;
+};
+
+const buildQuery = (filters, cursor) => {
+  const params = new URLSearchParams({ limit: PAGE_SIZE, sort: filters.sort });
+  if (filters.name) params.set('name', filters.name);
+  if (filters.departmentId) params.set('department_id', filters.departmentId);
+  if (filters.positionId) params.set('position_id', filters.positionId);
+  if (filters.hasCard) params.set('has_card', 'true');
+  if (filters.hasDNumber) params.set('has_d_number', 'true');
+  if (cursor) params.set('cursor', cursor);
+  return params.toString();
+};
+
+// 職員検索（/api/search）の一致した項目の表示名
+const MATCHED_LABELS = {
+  name: "氏名",
+  name_kana: "カナ",
+  romaji: "ローマ字",
+  employee_number: "職員番号",
+  d_number: "D番号",
+  card_management_id: "カード管理ID",
 };
 
+// 氏名・カナ・ローマ字・職員番号・D番号・カード管理IDのどれからでも職員を探す検索ボックス
+function PeopleSearch() {
+  const [query, setQuery] = useState('');
+  const [results, setResults] = useState([]);
+  const [error, setError] = useState(null);
+  // 入力が速いと古い検索の応答が後から届くため、最後に送った検索だけを表示する
+  const latest = useRef(0);
+
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setResults([]);
+      return undefined;
+    }
+    const timer = setTimeout(() => {
+      const seq = ++latest.current;
+      fetch(`/api/search?${new URLSearchParams({ q, limit: 20 })}`)
+        .then(response => {
+          if (!response.ok) {
+            throw new Error('Network response was not ok');
+          }
+          return response.json();
+        })
+        .then(data => {
+          if (seq === latest.current) {
+            setResults(data.results);
+            setError(null);
+          }
+        })
+        .catch(error => {
+          if (seq === latest.current) setError(error.message);
+        });
+    }, 150);
+    return () => clearTimeout(timer);
+  }, [query]);
+
+  return (
+    <div style={{ marginTop: '20px' }}>
+      <h3>職員検索:</h3>
+      <input
+        placeholder="氏名・カナ・ローマ字・職員番号・D番号・カード管理ID"
+        value={query}
+        onChange={e => setQuery(e.target.value)}
+        style={{ width: '30em' }}
+      />
+      {error && <div>Error: {error}</div>}
+      {results.length > 0 && (
+        <table>
+          <thead>
+            <tr>
+              <th>氏名</th>
+              <th>カナ</th>
+              <th>職員番号</th>
+              <th>D番号</th>
+              <th>カード管理ID</th>
+              <th>一致</th>
+            </tr>
+          </thead>
+          <tbody>
+            {results.map(user => (
+              <tr key={user.user_id}>
+                <td>{user.name}</td>
+                <td>{user.name_kana}</td>
+                <td>{user.employee_number}</td>
+                <td>{user.d_number}</td>
+                <td>{user.card_management_id}</td>
+                <td>{MATCHED_LABELS[user.matched]}</td>
+              </tr>
+            ))}
+          </tbody>
+        </table>
+      )}
+      {query.trim() && results.length === 0 && !error && <div>該当する職員はいません。</div>}
+    </div>
+  );
+}
+
 function App() {
   const [users, setUsers] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [filters, setFilters] = useState({
+    name: '',
+    departmentId: '',
+    positionId: '',
+    hasCard: false,
+    hasDNumber: false,
+    sort: 'hire_date',
+  });
 
   const [selectedColumns, setSelectedColumns] = useState(Object.keys(COLUMNS));
+  // 条件を続けて変えると古い条件の応答が後から届くため、最後に送ったリクエストだけを反映する
+  const latest = useRef(0);
 
-  useEffect(() => {
-    fetch('/api/users/')
+  // サーバー側で絞り込み・並び替えを行い、表示するページだけを取得する
+  const fetchPage = (cursor) => {
+    const seq = ++latest.current;
+    setLoading(true);
+    // 列形式で受け取る（gzip / br の展開はブラウザが行う）
+    return fetch(`/api/users/?${buildQuery(filters, cursor)}&format=columns`)
       .then(response => {
         if (!response.ok) {
           throw new Error('Network response was not ok');
@@ -42,14 +164,29 @@ function App() {
         return response.json();
       })
       .then(data => {
-        setUsers(data);
+        if (seq !== latest.current) return;
+        const items = decodeColumns(data);
+        setUsers(prev => (cursor ? [...prev, ...items] : items));
+        setNextCursor(data.next_cursor);
         setLoading(false);
       })
       .catch(error => {
+        if (seq !== latest.current) return;
         setError(error.message);
         setLoading(false);
       });
-  }, []);
+  };
+
+  useEffect(() => {
+    // 入力中に毎回リクエストしないよう少し待つ
+    const timer = setTimeout(() => fetchPage(null), 300);
+    return () => clearTimeout(timer);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [filters]);
+
+  const handleFilterChange = (key, value) => {
+    setFilters(prev => ({ ...prev, [key]: value }));
+  };
 
   const handleColumnToggle = (columnKey) => {
     setSelectedColumns(prev =>
@@ -59,36 +196,27 @@ function App() {
     );
   };
 
+  // CSV はサーバー側でストリーム生成し、ブラウザはそのままダウンロードする
   const handleDownloadCSV = () => {
     if (selectedColumns.length === 0) {
       alert("少なくとも1つのカラムを選択してください。");
       return;
     }
 
-    const headers = selectedColumns.map(key => COLUMNS[key]);
-    let csvContent = headers.join(",") + "\n";
-
-    users.forEach(user => {
-      const row = selectedColumns.map(key => escapeCSV(user[key]));
-      csvContent += row.join(",") + "\n";
-    });
+    const params = new URLSearchParams(buildQuery(filters, null));
+    params.delete('limit');
+    // 表示と同じ順番でカラムを並べる
+    params.set('columns', Object.keys(COLUMNS).filter(key => selectedColumns.includes(key)).join(','));
+    params.set('encoding', 'utf-8-sig');
 
-    const bom = new Uint8Array([0xEF, 0xBB, 0xBF]);
-    const blob = new Blob([bom, csvContent], { type: 'text/csv;charset=utf-8;' });
-    
     const link = document.createElement("a");
-    const url = URL.createObjectURL(blob);
-    link.setAttribute("href", url);
+    link.setAttribute("href", `/api/users/export?${params.toString()}`);
     link.setAttribute("download", "staff_list.csv");
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
   };
 
-  if (loading) {
-    return <div>Loading...</div>;
-  }
-
   if (error) {
     return <div>Error: {error}</div>;
   }
@@ -97,6 +225,8 @@ function App() {
     <div>
       <h1>職員リスト</h1>
 
+      <PeopleSearch />
+
       <div>
         <h3>CSVダウンロード項目:</h3>
         {Object.entries(COLUMNS).map(([key, label]) => (
@@ -115,6 +245,53 @@ function App() {
         選択した項目をCSVダウンロード
       </button>
 
+      <div style={{ marginTop: '20px' }}>
+        <h3>絞り込み:</h3>
+        <input
+          placeholder="氏名（前方一致）"
+          value={filters.name}
+          onChange={e => handleFilterChange('name', e.target.value)}
+        />
+        <input
+          placeholder="部署ID"
+          value={filters.departmentId}
+          onChange={e => handleFilterChange('departmentId', e.target.value)}
+          style={{ marginLeft: '10px', width: '6em' }}
+        />
+        <input
+          placeholder="職種ID"
+          value={filters.positionId}
+          onChange={e => handleFilterChange('positionId', e.target.value)}
+          style={{ marginLeft: '10px', width: '6em' }}
+        />
+        <label style={{ marginLeft: '10px' }}>
+          <input
+            type="checkbox"
+            checked={filters.hasCard}
+            onChange={e => handleFilterChange('hasCard', e.target.checked)}
+          />
+          カードあり
+        </label>
+        <label style={{ marginLeft: '10px' }}>
+          <input
+            type="checkbox"
+            checked={filters.hasDNumber}
+            onChange={e => handleFilterChange('hasDNumber', e.target.checked)}
+          />
+          有効なD番号あり
+        </label>
+        <select
+          value={filters.sort}
+          onChange={e => handleFilterChange('sort', e.target.value)}
+          style={{ marginLeft: '10px' }}
+        >
+          <option value="hire_date">入職日順</option>
+          <option value="-hire_date">入職日順（新しい順）</option>
+          <option value="name">氏名順</option>
+          <option value="employee_number">職員番号順</option>
+        </select>
+      </div>
+
       <table style={{ marginTop: '20px' }}>
         <thead>
           <tr>
@@ -149,6 +326,13 @@ function App() {
           ))}
         </tbody>
       </table>
+
+      {loading && <div>Loading...</div>}
+      {!loading && nextCursor && (
+        <button onClick={() => fetchPage(nextCursor)} style={{ marginTop: '10px' }}>
+          さらに読み込む
+        </button>
+      )}
     </div>
   );
 }
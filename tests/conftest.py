@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import event, insert
+
+# backend.config は読み込み時に環境変数を参照するため、インポートより前に設定する
+# （接続プールの確認もできるよう、インメモリではなくファイルの SQLite を使う）
+os.environ.setdefault('TEST_DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'staff_db_test.sqlite')}")
+
+from backend import create_app  # noqa: E402
+from backend.extensions import db  # noqa: E402
+from benchmarks.generator import positions, departments, staff  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """テーブルを作り直した testing 設定のアプリ（アプリケーションコンテキスト内で実行する）"""
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(insert(db.metadata.tables['Positions']), positions())
+        db.session.execute(insert(db.metadata.tables['Departments']), departments())
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_staff(n_users, start=0):
+    """benchmarks.generator の職員 start〜start+n_users-1 を投入します。"""
+    for model, records in staff(n_users, start=start).items():
+        if records:
+            db.session.execute(insert(model), records)
+    db.session.commit()
+
+
+class QueryCounter:
+    """with ブロックの中で DB に送られた SQL の件数を数えます（before_cursor_execute）。"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
@@ -0,0 +1,113 @@
+import json
+import threading
+
+import pytest
+from sqlalchemy import delete, event, insert, update
+
+from backend.card_index import card_index
+from backend.extensions import db
+from backend.models import Cards, Positions, Change_Log
+from .conftest import add_staff
+
+# benchmarks.generator の職員 0 はカードを持つ（i % 10 < 7）
+CARD_UID = f'{0:016X}'
+
+
+@pytest.fixture
+def cards(app):
+    """職員を投入して索引を読み込み、リクエストごとに差分更新する設定にします。"""
+    add_staff(10)
+    card_index.load(db.session)
+    card_index.configure(refresh_seconds=0, full_refresh_seconds=float('inf'))
+    yield
+    card_index.wait_refresh()
+    card_index.configure(app.config['CARD_INDEX_REFRESH_SECONDS'], app.config['CARD_INDEX_FULL_REFRESH_SECONDS'])
+
+
+def refresh():
+    """リクエストと同じく索引の更新を始め、バックグラウンドの更新が終わるまで待ちます。"""
+    card_index.ensure_fresh(db.session)
+    card_index.wait_refresh()
+
+
+def test_get_card(client, cards):
+    response = client.get(f'/api/cards/{CARD_UID}')
+    assert response.status_code == 200
+    assert response.get_json()['is_active'] is True
+    assert client.get('/api/cards/UNKNOWN').status_code == 404
+
+
+def test_card_uid_is_case_insensitive(client, cards):
+    uid = 'abcdef0123456789'
+    user_id = card_index.get(CARD_UID)['user_id']
+    db.session.execute(insert(Cards).values(card_uid=uid, user_id=user_id, is_active=True))
+    db.session.commit()
+    refresh()
+
+    assert client.get(f'/api/cards/{uid.upper()}').get_json()['card_uid'] == uid
+    assert client.get(f'/api/cards/{CARD_UID.lower()}').status_code == 200
+    response = client.post('/api/cards/resolve', json={'card_uids': [CARD_UID.lower(), uid]})
+    assert [card['user_id'] for card in response.get_json()['results']] == [user_id, user_id]
+
+
+def test_refresh_runs_off_the_request_thread(client, cards):
+    """差分更新はバックグラウンドのスレッドで行い、リクエストは DB に問い合わせずに現在の索引で応答すること"""
+    db.session.execute(update(Cards).where(Cards.card_uid == CARD_UID).values(is_active=False))
+    db.session.commit()
+    threads = []
+
+    def on_execute(*args):
+        threads.append(threading.current_thread().name)
+
+    event.listen(db.engine, 'before_cursor_execute', on_execute)
+    try:
+        assert client.get(f'/api/cards/{CARD_UID}').status_code == 200
+        card_index.wait_refresh()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', on_execute)
+    assert threads and set(threads) == {'card-index-refresh'}
+    assert client.get(f'/api/cards/{CARD_UID}').status_code == 404
+
+
+def test_inactive_card_is_not_found(client, cards):
+    db.session.execute(update(Cards).where(Cards.card_uid == CARD_UID).values(is_active=False))
+    db.session.commit()
+    refresh()
+
+    response = client.get(f'/api/cards/{CARD_UID}')
+    assert response.status_code == 404
+    assert response.get_json()['is_active'] is False
+
+    response = client.post('/api/cards/resolve', json={'card_uids': [CARD_UID]})
+    assert response.get_json()['results'] == [None]
+    response = client.post('/api/cards/resolve', json={'card_uids': [CARD_UID], 'include_inactive': True})
+    assert response.get_json()['results'][0]['is_active'] is False
+
+
+def test_deleted_card_is_removed_without_full_load(client, cards):
+    """別プロセスでの削除も Change_Log から差分で反映され、全件の読み直しは起きないこと"""
+    user_id = card_index.get(CARD_UID)['user_id']
+    loads = card_index.background_loads
+    # このプロセスの on_commit を通らない削除（Change_Log への記録は削除した側が行う）
+    db.session.rollback()
+    with db.engine.begin() as conn:
+        conn.execute(delete(Cards).where(Cards.card_uid == CARD_UID))
+        conn.execute(insert(Change_Log).values(op='delete', table_name=Cards.__tablename__,
+                                               user_id=user_id, row_key=json.dumps({'card_uid': CARD_UID})))
+    refresh()
+
+    assert client.get(f'/api/cards/{CARD_UID}').status_code == 404
+    assert card_index.background_loads == loads
+
+
+def test_master_change_reloads_in_background(client, cards):
+    """マスタの変更では全件をバックグラウンドで読み直し、完了後に索引を差し替えること"""
+    loads = card_index.background_loads
+    db.session.execute(update(Positions).values(position_name='変更後'))
+    db.session.commit()
+
+    # 読み直しの完了を待たずに現在の索引で応答する
+    assert client.get(f'/api/cards/{CARD_UID}').status_code == 200
+    card_index.wait_refresh()
+    assert card_index.background_loads == loads + 1
+    assert client.get(f'/api/cards/{CARD_UID}').status_code == 200
@@ -0,0 +1,148 @@
+import base64
+import datetime
+import importlib.util
+import json
+import os
+
+import pytest
+from sqlalchemy import delete, insert, select, update
+
+import backend
+from backend.changes import changed_user_ids, feed_models, latest_change_id, log_invalidation
+from backend.extensions import db
+from backend.models import Cards, Change_Log, DNumbers, Positions, User
+from .conftest import add_staff
+
+
+@pytest.fixture
+def staff(app):
+    add_staff(5)
+
+
+def fetch(client, since=None, tables='Users'):
+    params = {'tables': tables}
+    if since:
+        params['since'] = since
+    response = client.get('/api/changes', query_string=params)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    return rows, response.headers.get('X-Next-Cursor')
+
+
+def test_changes_follow_commit_order_not_updated_at(client, staff):
+    """updated_at が取得済みのカーソルより前でも、後からコミットされた変更は次の取得で返ること"""
+    _, cursor = fetch(client)
+    # 長いトランザクションの行は、開始時点の updated_at のまま後からコミットされる
+    past = datetime.datetime.now() - datetime.timedelta(hours=1)
+    user_id = db.session.execute(db.select(User.user_id).order_by(User.user_id)).scalars().first()
+    db.session.execute(update(User).where(User.user_id == user_id).values(name='長い 取込', updated_at=past))
+    db.session.commit()
+
+    rows, next_cursor = fetch(client, cursor)
+    assert [(row['op'], row['user_id'], row['data']['name']) for row in rows] == [('upsert', user_id, '長い 取込')]
+    assert fetch(client, next_cursor)[0] == []
+
+
+def test_rolled_back_savepoint_is_not_logged(client, staff):
+    _, cursor = fetch(client)
+    user_ids = db.session.execute(db.select(User.user_id).order_by(User.user_id)).scalars().all()
+    with db.session.begin_nested():
+        db.session.execute(update(User).where(User.user_id == user_ids[0]).values(name='残す'))
+    savepoint = db.session.begin_nested()
+    db.session.execute(update(User).where(User.user_id == user_ids[1]).values(name='取り消す'))
+    savepoint.rollback()
+    db.session.commit()
+
+    rows, _ = fetch(client, cursor)
+    assert [row['user_id'] for row in rows] == [user_ids[0]]
+
+
+def test_deletes_are_returned_and_old_cursors_rejected(client, staff):
+    _, cursor = fetch(client, tables='D_Numbers')
+    user_id = db.session.execute(db.select(User.user_id).order_by(User.user_id)).scalars().first()
+    db.session.execute(delete(DNumbers).where(DNumbers.user_id == user_id))
+    db.session.commit()
+
+    rows, _ = fetch(client, cursor, tables='D_Numbers')
+    assert rows and {(row['op'], row['user_id']) for row in rows} == {('delete', user_id)}
+
+    # updated_at による以前の形式のカーソル
+    old = base64.urlsafe_b64encode(json.dumps(['2026-01-01T00:00:00', 'Users', '[]']).encode()).decode()
+    response = client.get('/api/changes', query_string={'since': old})
+    assert response.status_code == 400
+
+
+def test_multi_row_insert_values_are_logged_per_row(client, staff):
+    """insert().values([...]) の複数行も、行ごとの主キーと user_id で記録されること"""
+    _, cursor = fetch(client, tables='Cards')
+    user_ids = db.session.execute(db.select(User.user_id).order_by(User.user_id)).scalars().all()[:2]
+    db.session.execute(insert(Cards).values([
+        {'card_uid': f'MULTI{i}', 'user_id': user_id, 'card_management_id': f'M-{i}'}
+        for i, user_id in enumerate(user_ids)
+    ]))
+    db.session.commit()
+
+    rows, _ = fetch(client, cursor, tables='Cards')
+    assert [(row['key'], row['user_id']) for row in rows] == [
+        ({'card_uid': f'MULTI{i}'}, user_id) for i, user_id in enumerate(user_ids)]
+
+
+def test_unkeyed_writes_invalidate_the_table(client, staff):
+    """主キーも user_id も分からない書き込み・セッションを通さない書き込みは、テーブル全体の invalidate になること"""
+    _, cursor = fetch(client, tables='Positions,Users')
+    after = latest_change_id(db.session)
+    db.session.execute(insert(Positions).from_select(
+        ['position_id', 'position_name'], select(Positions.position_id + 1000, Positions.position_name)))
+    db.session.commit()
+    with db.engine.begin() as conn:
+        conn.execute(update(User).values(name='直接'))
+    log_invalidation(db.session, ['Users'])
+    db.session.commit()
+
+    rows, _ = fetch(client, cursor, tables='Positions,Users')
+    assert [(row['op'], row['table'], row['key']) for row in rows] == [
+        ('invalidate', 'Positions', None), ('invalidate', 'Users', None)]
+    assert changed_user_ids(db.session, after, latest_change_id(db.session), ['Users']) is None
+
+
+def _log_user(conn, change_id, user_id, changed_at=None):
+    values = {'change_id': change_id, 'op': 'upsert', 'table_name': 'Users', 'user_id': user_id,
+              'row_key': json.dumps({'user_id': user_id})}
+    if changed_at is not None:
+        values['changed_at'] = changed_at
+    conn.execute(insert(Change_Log).values(**values))
+
+
+def test_gaps_hold_back_later_change_ids(client, staff):
+    """先にコミットされた大きい change_id は、手前の欠番が埋まるまで返さず、古い欠番は読み飛ばすこと"""
+    _, cursor = fetch(client)
+    upto = latest_change_id(db.session)
+    user_ids = db.session.execute(db.select(User.user_id).order_by(User.user_id)).scalars().all()
+    db.session.rollback()
+
+    # upto + 1 を採番したトランザクションがまだコミットしていない
+    with db.engine.begin() as conn:
+        _log_user(conn, upto + 2, user_ids[1])
+    assert latest_change_id(db.session) == upto
+    assert fetch(client, cursor)[0] == []
+
+    with db.engine.begin() as conn:
+        _log_user(conn, upto + 1, user_ids[0])
+    assert latest_change_id(db.session) == upto + 2
+    rows, cursor = fetch(client, cursor)
+    assert [row['user_id'] for row in rows] == user_ids[:2]
+
+    # 戻されたトランザクションの欠番（upto + 3）は、後の記録が古くなれば読み飛ばす
+    with db.engine.begin() as conn:
+        _log_user(conn, upto + 4, user_ids[2], changed_at=datetime.datetime(2000, 1, 1))
+    assert latest_change_id(db.session) == upto + 4
+    assert [row['user_id'] for row in fetch(client, cursor)[0]] == [user_ids[2]]
+
+
+def test_migration_seeds_every_feed_table(app):
+    """Change_Log を作るマイグレーションが、変更フィードの全テーブルに基準の記録を入れること"""
+    path = os.path.join(os.path.dirname(backend.__file__), 'migrations', 'versions', '6c1e8f4a9d23_add_change_log.py')
+    spec = importlib.util.spec_from_file_location('add_change_log', path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    assert migration.FEED_TABLES == [model.__tablename__ for model in feed_models()]
@@ -0,0 +1,102 @@
+import importlib.util
+import os
+
+from sqlalchemy import insert, select, update
+
+import backend
+from backend.extensions import db
+from backend.models import Cards, Department_Aliases, Departments, EmployeeNumberHistory, User
+from .conftest import add_staff
+
+
+def test_show_users_parquet_without_pyarrow(app, tmp_path, monkeypatch):
+    """pyarrow がない場合は読み込みを始める前にエラーを表示し、ファイルを作らないこと"""
+    add_staff(3)
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec',
+                        lambda name, *args: None if name == 'pyarrow' else find_spec(name, *args))
+    output = tmp_path / 'users.parquet'
+
+    result = app.test_cli_runner().invoke(args=['show-users', '--format', 'parquet', '-o', str(output)])
+    assert 'pyarrow が必要です' in result.output
+    assert not output.exists()
+
+
+def test_show_users_csv(app, tmp_path):
+    add_staff(3)
+    output = tmp_path / 'users.csv'
+    result = app.test_cli_runner().invoke(args=['show-users', '--format', 'csv', '-o', str(output)])
+    assert result.exit_code == 0
+    assert len(output.read_text(encoding='utf-8-sig').splitlines()) == 4
+
+
+def test_backfill_name_kana(app, client, tmp_path):
+    """登録済みの職員のカナを職員番号（以前の表記を含む）で埋め、カナで検索できるようにすること"""
+    add_staff(4)
+    db.session.execute(update(User).values(name_kana=None))
+    db.session.execute(update(User).where(User.user_id == 'user-00000001').values(name_kana='キゾン'))
+    # 型推論で取り込まれていた頃の表記（先頭の 0 が落ちた職員番号）
+    db.session.execute(update(EmployeeNumberHistory).where(EmployeeNumberHistory.employee_number == '00000002')
+                       .values(employee_number='2'))
+    db.session.commit()
+
+    csv_file = tmp_path / 'users.csv'
+    csv_file.write_text(',employee_number,name_kana\n'
+                        '0,00000000,コウシン　イチ\n'
+                        '1,00000001,コウシン　ニ\n'
+                        '2,00000002,コウシン　サン\n'
+                        '3,99999999,ミトウロク\n', encoding='utf-8')
+
+    result = app.test_cli_runner().invoke(args=['backfill-name-kana', str(csv_file)])
+    assert '更新 2件 / スキップ 1件 / エラー 1件' in result.output
+    kana = dict(db.session.execute(select(User.user_id, User.name_kana)).all())
+    assert kana == {'user-00000000': 'コウシン　イチ', 'user-00000001': 'キゾン',
+                    'user-00000002': 'コウシン　サン', 'user-00000003': None}
+
+    response = client.get('/api/search', query_string={'q': 'こうしん'})
+    assert {r['user_id'] for r in response.get_json()['results']} == {'user-00000000', 'user-00000002'}
+
+    result = app.test_cli_runner().invoke(args=['backfill-name-kana', '--overwrite', str(csv_file)])
+    assert db.session.get(User, 'user-00000001').name_kana == 'コウシン　ニ'
+
+
+def test_seed_department_aliases(app, tmp_path):
+    """別名が未登録なら canonicalize-departments が警告し、同梱の別名は存在する部署の分だけ登録できること"""
+    csv_file = tmp_path / 'cards.csv'
+    csv_file.write_text('dept\n救急部\n', encoding='utf-8')
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['canonicalize-departments', str(csv_file)])
+    assert '別名（Department_Aliases）が1件も登録されていません' in result.output
+
+    db.session.execute(insert(Departments).values(department_id=999, department_name='救急科'))
+    db.session.commit()
+    seeds = os.path.join(os.path.dirname(backend.__file__), 'seeds', 'department_aliases.csv')
+    result = runner.invoke(args=['add-department-alias', '--from-csv', seeds])
+    assert 'エラー: 部署を1つに特定できません' in result.output
+    assert db.session.execute(select(Department_Aliases)).first() is None
+
+    result = runner.invoke(args=['add-department-alias', '--from-csv', seeds, '--skip-unknown'])
+    assert '別名を 1件登録しました' in result.output
+    assert db.session.execute(select(Department_Aliases.alias, Department_Aliases.department_id)).all() == [('救急部', 999)]
+
+    result = runner.invoke(args=['canonicalize-departments', str(csv_file)])
+    assert '登録されていません' not in result.output
+    assert '999,救急科' in result.output
+
+
+def test_import_cards_row_by_row_in_chunks(app, tmp_path):
+    """1行ずつの取り込みもチャンクごとに書き出し、チャンクをまたいだ重複を読み飛ばすこと"""
+    add_staff(3)
+    csv_file = tmp_path / 'cards.csv'
+    csv_file.write_text('user_id,card_uid,card_management_id\n'
+                        'user-00000000,NEW0001,NEWCM01\n'
+                        'user-00000001,NEW0002,NEWCM02\n'
+                        'user-00000002,NEW0001,NEWCM03\n'
+                        'user-99999999,NEW0003,NEWCM04\n'
+                        'user-00000002,NEW0004,NEWCM05\n', encoding='utf-8')
+
+    result = app.test_cli_runner().invoke(args=['import-cards', '--chunk-size', '2', str(csv_file)])
+    assert '3件の新しいレコードが追加されました' in result.output
+    assert 'Card UID NEW0001 は既に存在します' in result.output
+    owners = dict(db.session.execute(select(Cards.card_uid, Cards.user_id).where(Cards.card_uid.like('NEW%'))).all())
+    assert owners == {'NEW0001': 'user-00000000', 'NEW0002': 'user-00000001', 'NEW0004': 'user-00000002'}
@@ -0,0 +1,15 @@
+import doctest
+
+import pytest
+
+from backend import departments, exports, importers, search
+from cws_exchange import name_utils
+
+
+@pytest.mark.parametrize('module', [departments, exports, importers, search, name_utils],
+                         ids=lambda module: module.__name__)
+def test_doctests(module):
+    """docstring の例（>>>）が実行結果と一致すること"""
+    result = doctest.testmod(module)
+    assert result.attempted > 0
+    assert result.failed == 0
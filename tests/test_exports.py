@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+from sqlalchemy import select, update
+
+from backend import exports
+from backend.extensions import db
+from backend.models import External_Systems, External_System_Exports, User
+from backend.streaming import iter_csv
+from .conftest import add_staff
+
+
+@pytest.fixture
+def system(app):
+    add_staff(5)
+    system = External_Systems(system_id=1, system_name='入退館')
+    db.session.add(system)
+    db.session.add_all([
+        External_System_Exports(system_id=1, table_name='Employee_Number_History', column_name='employee_number',
+                                transform_id='職員番号'),
+        External_System_Exports(system_id=1, table_name='Users', column_name='name', transform_id='氏名'),
+    ])
+    db.session.commit()
+    return system
+
+
+def _delta_file(system, path):
+    plan = exports.load_plan(db.session, system)
+    return exports.write_delta_file(db.session, system, plan, str(path))
+
+
+def test_delta_file_is_replaced_after_commit(system, tmp_path):
+    path = tmp_path / 'delta.csv'
+    state = _delta_file(system, path)
+    assert state.inserted == 5
+    assert len(path.read_text(encoding='utf-8-sig').splitlines()) == 6
+    assert not (tmp_path / 'delta.csv.tmp').exists()
+    assert db.session.get(External_Systems, 1).exported_change_id is not None
+
+
+def test_failed_commit_keeps_previous_file_and_state(system, tmp_path, monkeypatch):
+    path = tmp_path / 'delta.csv'
+    path.write_text('前回の出力\n', encoding='utf-8')
+
+    def fail(session, state):
+        raise RuntimeError('commit failed')
+
+    monkeypatch.setattr(exports, 'save_delta_state', fail)
+    with pytest.raises(RuntimeError):
+        _delta_file(system, path)
+
+    assert path.read_text(encoding='utf-8') == '前回の出力\n'
+    assert not (tmp_path / 'delta.csv.tmp').exists()
+    db.session.rollback()
+    assert db.session.get(External_Systems, 1).exported_change_id is None
+
+
+def test_plan_is_reused_until_settings_change(system, monkeypatch):
+    """出力設定が変わるまでコンパイルした ExportPlan を使い回し、差分出力の基準の更新では破棄しないこと"""
+    monkeypatch.setattr(exports, 'export_plans', exports.ExportPlanCache())
+    plan = exports.load_plan(db.session, system)
+    system.exported_change_id = 1
+    db.session.commit()
+    assert exports.load_plan(db.session, system) is plan
+
+    db.session.add(External_System_Exports(system_id=1, table_name='Users', column_name='hire_date',
+                                           transform_id='入職日', transform='date'))
+    db.session.commit()
+    assert exports.load_plan(db.session, system).headers == ['職員番号', '氏名', '入職日']
+    assert (exports.export_plans.compiles, exports.export_plans.hits) == (2, 1)
+
+
+def test_text_transforms_accept_numbers_and_nulls():
+    """数値・NULL だけの列にも文字列の変換処理を適用でき、適用できない場合は列名を示す ValueError にすること"""
+    frame = pd.DataFrame({'number': [7, None], 'kana': [None, None]})
+    zfill = exports.ExportColumn('番号', 'number', exports.parse_transform('zfill:3'))
+    assert zfill.apply(frame).tolist() == ['007', None]
+    kana = exports.ExportColumn('カナ', 'kana', exports.parse_transform('halfwidth_kana'))
+    assert kana.apply(frame).tolist() == [None, None]
+    with pytest.raises(ValueError, match='番号 列に変換処理 zfill:x を適用できません'):
+        exports.ExportColumn('番号', 'number', exports.parse_transform('zfill:x')).apply(frame)
+
+
+def test_unencodable_character_fails_with_row_and_column(system, tmp_path):
+    """cp932 で表せない文字は '?' にせず、行と列を示して失敗し、差分の基準も進めないこと"""
+    user_id = db.session.execute(select(User.user_id).order_by(User.user_id)).scalars().all()[2]
+    db.session.execute(update(User).where(User.user_id == user_id).values(name='𠮷田 太郎'))
+    db.session.commit()
+
+    path = tmp_path / 'delta.csv'
+    plan = exports.load_plan(db.session, system)
+    with pytest.raises(ValueError, match='3行目の 氏名 列の文字「𠮷」は cp932 で表せません'):
+        exports.write_delta_file(db.session, system, plan, str(path), encoding='cp932')
+    assert not path.exists() and not (tmp_path / 'delta.csv.tmp').exists()
+    assert db.session.get(External_Systems, 1).exported_change_id is None
+
+    rows = [{'name': '山田'}, {'name': '𠮷田'}]
+    with pytest.raises(ValueError, match='2行目の name 列'):
+        b''.join(iter_csv(rows, ['name'], encoding='cp932'))
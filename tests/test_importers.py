@@ -0,0 +1,19 @@
+import pandas as pd
+
+from backend.importers import validate_staff
+
+
+def test_blank_employee_numbers_are_rejected():
+    """空欄・空白だけの職員番号の行は登録せず、CSV の行番号つきのエラーにすること"""
+    df = pd.DataFrame({
+        'name': ['山田', '佐藤', '鈴木', '田中'],
+        'employee_number': [' 00123 ', '   ', '', None],
+        'Birthday': [None] * 4,
+        'hire_date': [None] * 4,
+        'position_id': ['1'] * 4,
+        'department_id': [None] * 4,
+        'd_number': [None] * 4,
+    })
+    frame, errors = validate_staff(df)
+    assert frame['employee_number'].tolist() == ['00123']
+    assert [line for line, _ in errors] == [3, 4, 5]
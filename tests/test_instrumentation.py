@@ -0,0 +1,24 @@
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from backend.extensions import db
+from backend.instrumentation import RequestStats
+
+
+def test_failed_statement_does_not_leave_timing_state(app):
+    """失敗した SQL の開始時刻が接続に残らず、後続の SQL の時間が正しく記録されること"""
+    with app.test_request_context():
+        g.sql_stats, g.sql_slowest = RequestStats(), 3
+        with db.engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text('SELECT * FROM no_such_table'))
+                conn.rollback()
+            conn.execute(text('SELECT 1'))
+            assert not any(key == 'query_start' for key in conn.info)
+
+        stats = g.sql_stats
+        assert stats.queries == 1
+        assert 0 <= stats.db_seconds < 1
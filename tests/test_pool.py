@@ -0,0 +1,60 @@
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.card_index import card_index
+from backend.extensions import db
+from backend.pool import pool_status
+from .conftest import QueryCounter, add_staff
+from .test_users_api import MAX_QUERIES
+
+N_USERS = 60
+THREADS = 8
+REQUESTS = 400
+
+
+def _expected(path):
+    """パスごとの (ステータスコード, 件数の確認) を返します。"""
+    if path.startswith('/api/cards/'):
+        # benchmarks.generator の職員 i は i % 10 < 7 のときカードを持つ
+        return (200 if int(path.rsplit('/', 1)[1], 16) % 10 < 7 else 404), None
+    return {
+        '/health': (200, None),
+        '/api/users/': (200, lambda body: len(json.loads(body)) == N_USERS),
+        '/api/users/?limit=20&sort=-name': (200, lambda body: len(json.loads(body)['items']) == 20),
+        '/api/users/export?format=ndjson': (200, lambda body: len(body.splitlines()) == N_USERS),
+        '/api/users/?limit=0': (400, None),  # エラー時も接続が返却されること
+    }[path]
+
+
+def test_concurrent_requests_do_not_leak_connections(app, client):
+    add_staff(N_USERS)
+    card_index.load(db.session)
+
+    rng = random.Random(0)
+    paths = [rng.choice(['/health', '/api/users/', '/api/users/?limit=20&sort=-name',
+                         '/api/users/export?format=ndjson', '/api/users/?limit=0',
+                         f'/api/cards/{rng.randrange(N_USERS):016X}'])
+             for _ in range(REQUESTS)]
+
+    def get(path):
+        response = client.get(path)
+        try:
+            return path, response.status_code, response.get_data(as_text=True)
+        finally:
+            response.close()
+
+    with QueryCounter(db.engine) as counter:
+        with ThreadPoolExecutor(THREADS) as executor:
+            results = list(executor.map(get, paths))
+        card_index.wait_refresh()
+
+    for path, status_code, body in results:
+        expected_code, check = _expected(path)
+        assert status_code == expected_code, path
+        assert check is None or check(body), path
+
+    status = pool_status(db.engine)
+    assert status['checked_out'] == 0
+    assert status['timeouts'] == 0
+    assert counter.count <= REQUESTS * MAX_QUERIES
@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import insert
+
+from backend.extensions import db
+from backend.models import DNumbers
+from backend.resolver import IdentifierResolver
+from .conftest import add_staff
+
+
+@pytest.fixture
+def staff(app):
+    add_staff(20)
+
+
+def _resolve(resolver, *identifiers):
+    return {r['value']: r['user_id'] for r in resolver.resolve(db.session, list(identifiers))}
+
+
+def test_negative_cache_is_bounded(staff):
+    resolver = IdentifierResolver(negative_size=3)
+    for i in range(10):
+        _resolve(resolver, ('d_number', f'UNKNOWN{i}'))
+    assert resolver.stats()['negatives'] == 3
+
+    # 直近に使った値だけが残る
+    queries = resolver.queries
+    _resolve(resolver, ('d_number', 'UNKNOWN9'))
+    assert resolver.queries == queries
+    _resolve(resolver, ('d_number', 'UNKNOWN0'))
+    assert resolver.queries == queries + 1
+
+
+def test_negative_cache_expires(staff):
+    resolver = IdentifierResolver(negative_seconds=0)
+    _resolve(resolver, ('d_number', 'UNKNOWN'))
+    queries = resolver.queries
+    _resolve(resolver, ('d_number', 'UNKNOWN'))
+    assert resolver.queries == queries + 1
+
+
+def test_change_invalidates_only_changed_keys(staff):
+    resolver = IdentifierResolver()
+    resolved = _resolve(resolver, ('d_number', 'D0000001'), ('d_number', 'D0000002'), ('d_number', 'DNEW'))
+    assert resolved['D0000001'] == 'user-00000001'
+    assert resolved['DNEW'] is None
+
+    db.session.execute(insert(DNumbers).values(user_id='user-00000001', d_number='DNEW', is_active=True))
+    db.session.commit()
+
+    hits = resolver.hits
+    resolved = _resolve(resolver, ('d_number', 'D0000001'), ('d_number', 'D0000002'), ('d_number', 'DNEW'))
+    assert resolved['DNEW'] == 'user-00000001'
+    # 変更のない職員の値（D0000002）だけが索引から引ける
+    assert resolver.hits == hits + 1
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import update
+
+from backend.extensions import db
+from backend.models import User
+from backend.search import search_index
+from .conftest import add_staff
+
+
+@pytest.fixture
+def people(app):
+    """職員を投入して索引を読み込み、リクエストごとに差分更新する設定にします。"""
+    add_staff(10)
+    search_index.load(db.session)
+    search_index.configure(refresh_seconds=0, full_refresh_seconds=float('inf'))
+    yield
+    search_index.wait_refresh()
+    search_index.configure(app.config['SEARCH_INDEX_REFRESH_SECONDS'], app.config['SEARCH_INDEX_FULL_REFRESH_SECONDS'])
+
+
+def _search(client, query):
+    response = client.get('/api/search', query_string={'q': query})
+    assert response.status_code == 200
+    return [result['user_id'] for result in response.get_json()['results']]
+
+
+def test_full_reload_runs_in_background(client, people):
+    """全件の読み直しはバックグラウンドで行い、その間も現在の索引で応答すること"""
+    loads = search_index.stats()['full_loads']
+    search_index.mark_dirty({User.__tablename__}, None)
+
+    assert 'user-00000003' in _search(client, '00000003')
+    search_index.wait_refresh()
+    stats = search_index.stats()
+    assert stats['background_loads'] >= 1
+    assert stats['full_loads'] == loads + 1
+    assert 'user-00000003' in _search(client, '00000003')
+
+
+def test_incremental_refresh(client, people):
+    """更新はバックグラウンドで行い、完了後の検索に反映されること"""
+    db.session.execute(update(User).where(User.user_id == 'user-00000003').values(name_kana='ケンサク　テスト'))
+    db.session.commit()
+    assert _search(client, 'けんさく') == []
+    search_index.wait_refresh()
+    assert _search(client, 'けんさく') == ['user-00000003']
@@ -0,0 +1,72 @@
+import pytest
+
+from backend.extensions import db
+from backend.models import User
+from backend.roster import ROSTER_COLUMNS
+from .conftest import QueryCounter, add_staff
+
+# 職員数によらず、1リクエストで実行してよい SQL の件数の上限
+MAX_QUERIES = 5
+
+
+def _get_users(client, query):
+    with QueryCounter(db.engine) as counter:
+        response = client.get(f'/api/users/{query}')
+    assert response.status_code == 200
+    payload = response.get_json()
+    if 'columns' in payload:
+        users = [dict(zip(payload['columns'], values))
+                 for values in zip(*(payload['data'][c] for c in payload['columns']))]
+    else:
+        users = payload['items'] if 'items' in payload else payload
+    return users, counter.count
+
+
+@pytest.mark.parametrize('query', ['', '?sort=name', '?department_id=1', '?limit=1000', '?format=columns'])
+def test_query_count_does_not_grow_with_users(client, query):
+    """N 人と 2N 人で SQL の件数が変わらず、小さい定数以下であること（N+1 の回帰防止）"""
+    counts = []
+    for start, n_users in ((0, 40), (40, 40)):
+        add_staff(n_users, start=start)
+        users, count = _get_users(client, query)
+        counts.append(count)
+        if 'department_id' not in query:
+            assert len(users) == start + n_users
+    assert counts[0] == counts[1]
+    assert counts[0] <= MAX_QUERIES
+
+
+def test_users_response_shape(client):
+    add_staff(3)
+    users, _ = _get_users(client, '')
+    assert [sorted(user) for user in users] == [sorted(ROSTER_COLUMNS)] * 3
+    by_id = {user['user_id']: user for user in users}
+    user = by_id['user-00000001']
+    assert user['employee_number'] == '00000001'
+    assert user['d_id'] == 'D0000001'
+    assert user['card_management_id'] == 'CM00000001'
+    assert user['department_name'] is not None and user['position_name'] is not None
+
+
+def test_cached_users_cost_only_version_queries(client):
+    """キャッシュから返す全件は、バージョンを求める2回の SQL（読み出してよい change_id とテーブルごとの記録）だけで応答すること"""
+    add_staff(20)
+    for query in ('', '?format=columns'):
+        _get_users(client, query)  # キャッシュを作る
+        users, count = _get_users(client, query)
+        assert len(users) == 20
+        assert count == 2
+
+
+def test_cp932_export_rejects_unencodable_before_streaming(client):
+    """cp932 で表せない氏名があれば、送信を始める前に行と列を示す 400 を返すこと"""
+    add_staff(3)
+    db.session.get(User, 'user-00000002').name = '𠮷田'
+    db.session.commit()
+    response = client.get('/api/users/export?encoding=cp932&columns=user_id,name')
+    assert response.status_code == 400
+    assert '行目の name 列の文字「𠮷」は cp932 で表せません' in response.get_json()['error']
+
+    response = client.get('/api/users/export?encoding=utf-8&columns=user_id,name')
+    assert response.status_code == 200
+    assert '𠮷田' in response.get_data(as_text=True)